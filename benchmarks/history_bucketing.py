@@ -0,0 +1,110 @@
+import argparse
+import time
+from datetime import datetime
+from datetime import timedelta
+
+from helpers import time_functions
+
+# Compares the hourly bucketing of DeviceLog.get_log_history before and after
+# the single pass bucketizer on a synthetic history. No database is needed.
+#
+#   python -m benchmarks.history_bucketing --days 90 --oids 20
+
+
+def generate(start, days, oids, interval_minutes):
+    records = {}
+    count = days * 24 * 60 // interval_minutes
+    for n in range(oids):
+        object_id = f'1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.{n}.0'
+        records[object_id] = [{
+            'id': f'ffffffff-ffff-ffff-ffff-ffffffffffff#{object_id}',
+            'timestamp': time_functions.unparse_time(
+                start + timedelta(minutes=i * interval_minutes, seconds=n)),
+            'value': str(i)} for i in range(count)]
+    return records
+
+
+def split(records, period):
+    from_time = time_functions.unparse_time(period['start_time'])
+    to_time = time_functions.unparse_time(period['end_time'])
+    return {
+        object_id: [item for item in items
+                    if from_time <= item['timestamp'] <= to_time]
+        for object_id, items in records.items()}
+
+
+# Bucketing as it was done before, one scan of every record per hour
+def legacy(period_records, period):
+    result = []
+    start_unit = period['start_time']
+    end_unit = start_unit + timedelta(hours=1)
+    while (start_unit <= period['end_time']):
+        db_res = {}
+        for records in period_records.values():
+            child_list = []
+            for item in records:
+                if start_unit <= time_functions.parse_time(
+                        item['timestamp']) < end_unit:
+                    child_list.append(item)
+            if child_list:
+                required_item = child_list[-1]
+                db_res.update({required_item['id'].split('#')[1]: required_item})
+        if db_res:
+            result.append(db_res)
+        start_unit = end_unit
+        end_unit = start_unit + timedelta(hours=1)
+    return result
+
+
+def single_pass(period_records, period):
+    result = []
+    bounds = time_functions.hourly_bounds(
+        period['start_time'], period['end_time'])
+    buckets = {
+        object_id: time_functions.latest_per_interval(records, bounds)
+        for object_id, records in period_records.items() if records}
+    for i in range(len(bounds)):
+        db_res = {
+            object_id: latest[i]
+            for object_id, latest in buckets.items() if latest[i]}
+        if db_res:
+            result.append(db_res)
+    return result
+
+
+def run(bucketize, periods):
+    start = time.perf_counter()
+    result = []
+    for period, period_records in periods:
+        result.extend(bucketize(period_records, period))
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--oids', type=int, default=20)
+    parser.add_argument('--interval-minutes', type=int, default=15)
+    parser.add_argument('--threshold', type=int, default=16)
+    args = parser.parse_args()
+
+    start = datetime(2018, 1, 1, 0, 30, 0)
+    records = generate(start, args.days, args.oids, args.interval_minutes)
+    time_periods = time_functions.break_time_period(
+        time_functions.unparse_time(start),
+        time_functions.unparse_time(start + timedelta(days=args.days)),
+        args.threshold)
+    periods = [(period, split(records, period)) for period in time_periods]
+
+    new_res, new_time = run(single_pass, periods)
+    old_res, old_time = run(legacy, periods)
+    assert new_res == old_res, 'bucketing results differ'
+
+    print(f'records: {sum(len(items) for items in records.values())}, '
+          f'hourly buckets: {len(new_res)}')
+    print(f'legacy:      {old_time:.3f}s')
+    print(f'single pass: {new_time:.3f}s ({old_time / new_time:.0f}x)')
+
+
+if __name__ == '__main__':
+    main()
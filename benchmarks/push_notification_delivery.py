@@ -0,0 +1,57 @@
+import argparse
+import time
+from urllib import parse
+from urllib import request
+
+from functions.push_notifications import delivery
+from tests.functions.stub_notification_server import StubNotificationServer
+from tests.functions.stub_notification_server import payload
+
+# Measures push notification deliveries per second against a local stub
+# notify_url, with a new urllib connection per notification as before and
+# with the persistent connection pool. No AWS resource is needed.
+#
+#   python -m benchmarks.push_notification_delivery --notifications 2000
+
+
+# Delivery as it was done before, one urlopen per notification
+def legacy(url, notifications):
+    for notification in notifications:
+        request.urlopen(
+            url, parse.urlencode(notification).encode('ascii')).read()
+
+
+def pooled(url, notifications):
+    results = delivery.deliver([(url, n) for n in notifications])
+    failures = [result for result in results if isinstance(result, Exception)]
+    assert not failures, failures
+
+
+def run(send, url, notifications):
+    start = time.perf_counter()
+    send(url, notifications)
+    return len(notifications) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--notifications', type=int, default=2000)
+    parser.add_argument('--delay-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    notifications = [payload(i) for i in range(args.notifications)]
+    with StubNotificationServer(delay=args.delay_ms / 1000) as stub:
+        old_rate = run(legacy, stub.url, notifications)
+        old_connections = stub.connections
+        new_rate = run(pooled, stub.url, notifications)
+        new_connections = stub.connections - old_connections
+
+    print(f'notifications: {args.notifications}')
+    print(f'legacy: {old_rate:.0f}/s, {old_connections} connections')
+    print(f'pooled: {new_rate:.0f}/s, {new_connections} connections '
+          f'({new_rate / old_rate:.1f}x)')
+    print(f'stats:  {delivery.stats()}')
+
+
+if __name__ == '__main__':
+    main()
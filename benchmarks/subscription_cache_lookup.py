@@ -0,0 +1,103 @@
+import argparse
+import statistics
+import time
+from os import environ
+
+environ.setdefault('DYNAMO_ENDPOINT_URL', 'http://localhost:8000')
+environ.setdefault('REDIS_ENDPOINT_URL', 'localhost')
+environ.setdefault('PROXY', '')
+
+from models import connections
+from models.device_subscription import DeviceSubscription
+from models.device_subscription import subscription_cache_key
+
+# Measures DeviceSubscription.get_record latency while the number of cached
+# subscriptions grows. Requires a local Redis server, the subscriptions of
+# the benchmark devices (ffffffff-ffff-ffff-ffff-...) are deleted afterwards.
+#
+#   python -m benchmarks.subscription_cache_lookup --sizes 10000 100000 10000000
+
+LOG_SERVICE_ID = '0'
+FILL_CHUNK = 10000
+LOCAL_ENDPOINTS = ('localhost', '127.0.0.1')
+
+
+def device_id(i):
+    return f'ffffffff-ffff-ffff-ffff-{i:012x}'
+
+
+def fill(elasticache, start, stop):
+    for chunk_start in range(start, stop, FILL_CHUNK):
+        pipe = elasticache.pipeline(transaction=False)
+        for i in range(chunk_start, min(chunk_start + FILL_CHUNK, stop)):
+            pipe.hmset(subscription_cache_key(device_id(i), LOG_SERVICE_ID), {
+                'status': '1200',
+                'message': 'Subscribed',
+                'created_at': '2018-01-01T00:00:00',
+                'updated_at': '2018-01-01T00:00:00'})
+        pipe.execute()
+
+
+def clear(elasticache, stop):
+    for chunk_start in range(0, stop, FILL_CHUNK):
+        elasticache.delete(*[
+            subscription_cache_key(device_id(i), LOG_SERVICE_ID)
+            for i in range(chunk_start, min(chunk_start + FILL_CHUNK, stop))])
+
+
+def legacy_lookup(elasticache, i):
+    # Lookup as it was done before the subscription cache (KEYS scan)
+    return elasticache.keys(subscription_cache_key(device_id(i), LOG_SERVICE_ID))
+
+
+def measure(lookup, size, lookups):
+    latencies = []
+    for n in range(lookups):
+        i = (n * 7919) % size
+        start = time.perf_counter()
+        lookup(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return (statistics.median(latencies),
+            latencies[int(len(latencies) * 0.99) - 1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--sizes', type=int, nargs='+',
+        default=[10000, 100000, 1000000, 10000000])
+    parser.add_argument('--lookups', type=int, default=1000)
+    parser.add_argument(
+        '--legacy', action='store_true',
+        help='also measure the KEYS based lookup (slow on large keyspaces)')
+    args = parser.parse_args()
+    if environ['REDIS_ENDPOINT_URL'] not in LOCAL_ENDPOINTS:
+        parser.error(
+            f'REDIS_ENDPOINT_URL {environ["REDIS_ENDPOINT_URL"]} is not a '
+            f'local Redis server')
+
+    elasticache = connections.redis_client()
+    device_subscription = DeviceSubscription()
+
+    filled = 0
+    print('cached_subscriptions  get_record_p50_ms  get_record_p99_ms  keys_p50_ms')
+    try:
+        for size in sorted(args.sizes):
+            fill(elasticache, filled, size)
+            filled = size
+            p50, p99 = measure(
+                lambda i: device_subscription.get_record(device_id(i), LOG_SERVICE_ID),
+                size, args.lookups)
+            keys_p50 = '-'
+            if args.legacy:
+                keys_p50 = '%.3f' % measure(
+                    lambda i: legacy_lookup(elasticache, i),
+                    size, min(args.lookups, 20))[0]
+            print(f'{size:>20}  {p50:>17.3f}  {p99:>17.3f}  {keys_p50:>11}')
+    finally:
+        clear(elasticache, max(args.sizes))
+
+
+if __name__ == '__main__':
+    main()
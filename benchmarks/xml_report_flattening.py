@@ -0,0 +1,87 @@
+import argparse
+import email
+import time
+import xml.etree.ElementTree as ET
+
+from config import PrintCountFieldMap
+from functions.email_notifications import handler
+
+# Compares the flattening of xml mail reports before and after the one pass
+# parser, on a report made of the devices sections of tests/data/email
+# repeated --devices times. No AWS resource is needed.
+#
+#   python -m benchmarks.xml_report_flattening --devices 500
+
+REPORT = 'tests/data/email/Report.eml'
+
+
+def generate(devices):
+    with open(REPORT, 'rb') as eml:
+        msg = email.message_from_bytes(eml.read())
+    report = next(
+        part for part in msg.walk() if part.get_filename()
+    ).get_payload(decode=True).decode('utf-8')
+    head, body = report.split('<bpsdm:NetInfo>', 1)
+    body, tail = ('<bpsdm:NetInfo>' + body).rsplit('</', 1)
+    return head + body * devices + '</' + tail
+
+
+# Flattening as it was done before, quadratic concatenation of the leaves
+# then mapping of the key/value list
+def legacy(data):
+    res = []
+    for child in ET.fromstring(data):
+        res = res + read_rec(child, child.tag.split('}')[1])
+    fields = {}
+    for item in range(0, len(res), 2):
+        fields[res[item]] = res[item + 1]
+    mail_log_data = {}
+    field_map = PrintCountFieldMap.PrintCountFieldMapXML
+    for k, v in fields.items():
+        if k in field_map:
+            if field_map[k] == "serial_number":
+                mail_log_data[field_map[k]] = v.upper() if v else ' '
+            else:
+                mail_log_data[field_map[k]] = v if v else ' '
+    return mail_log_data
+
+
+def read_rec(node, name, parent=None):
+    if len(node) > 0:
+        res = []
+        for child in node:
+            child_name_prefix = child.tag.split('}')[1]
+            if child.attrib:
+                attr = child.attrib
+                key = next(iter(attr.keys()))
+                valu = next(iter(attr.values()))
+                child_name_prefix = child_name_prefix + '_' + key + '_' + valu
+            res = res + read_rec(child, child_name_prefix, name)
+        return res
+    else:
+        return [parent + '_' + name, node.text]
+
+
+def run(flatten, data):
+    start = time.perf_counter()
+    result = flatten(data)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--devices', type=int, default=500)
+    args = parser.parse_args()
+
+    data = generate(args.devices)
+    new_res, new_time = run(handler.parse_xml, data)
+    old_res, old_time = run(legacy, data)
+    assert new_res == old_res, 'flattened reports differ'
+
+    print(f'report: {len(data) // 1024}KB, fields: {len(new_res)}')
+    print(f'legacy:   {old_time:.3f}s')
+    print(f'one pass: {new_time:.3f}s ({old_time / new_time:.0f}x)')
+
+
+if __name__ == '__main__':
+    main()
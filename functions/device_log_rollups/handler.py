@@ -0,0 +1,122 @@
+import json
+import logging
+from functions import helper
+from models import device_log_rollup
+from models.device_log import DeviceLog
+from models.device_log_rollup import DeviceLogRollup
+
+logger = logging.getLogger('device_log_rollups')
+logger.setLevel(logging.INFO)
+
+BACKFILL_ASYNC = 'backfill_device_log_rollups'
+# Stop scanning and continue in a new invocation below this remaining time
+BACKFILL_MIN_REMAINING_MILLIS = 60000
+
+
+# Build the rollups of the logs already stored in device_logs.
+# The table is scanned page by page, optionally as one segment of a parallel
+# scan: {"segment": 0, "total_segments": 4}. When the Lambda is about to time
+# out, the scan continues in a new asynchronous invocation.
+def backfill(event, context):
+    logger.info(f'device_log_rollups: backfill, {event}')
+    device_log = DeviceLog()
+    rollup = DeviceLogRollup()
+
+    scan_params = {
+        'ProjectionExpression': '#id, #ts, #v',
+        'ExpressionAttributeNames': {
+            '#id': 'id', '#ts': 'timestamp', '#v': 'value'}
+    }
+    if 'total_segments' in event:
+        scan_params['Segment'] = int(event.get('segment', 0))
+        scan_params['TotalSegments'] = int(event['total_segments'])
+    if event.get('exclusive_start_key'):
+        scan_params['ExclusiveStartKey'] = event['exclusive_start_key']
+
+    scanned = 0
+    while True:
+        response = device_log.table.scan(**scan_params)
+        scanned += len(response['Items'])
+        # Only the latest log of each bucket of the page has to be written
+        records = {}
+        for item in response['Items']:
+            records.setdefault(item['id'], []).append(item)
+        for log_id, items in records.items():
+            device_id, object_id = log_id.split('#')
+            for time_unit in device_log_rollup.BUCKET_LENGTHS:
+                for item in device_log_rollup.latest_per_bucket(
+                        items, time_unit).values():
+                    rollup.put_bucket(
+                        device_id, object_id, time_unit,
+                        item['timestamp'], item['value'])
+
+        if 'LastEvaluatedKey' not in response:
+            logger.info(f'device_log_rollups: backfill done, scanned {scanned}')
+            return {'scanned': scanned, 'last_evaluated_key': None}
+        scan_params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        if (context and context.get_remaining_time_in_millis() <
+                BACKFILL_MIN_REMAINING_MILLIS):
+            payload = dict(event)
+            payload['exclusive_start_key'] = response['LastEvaluatedKey']
+            helper.invoke_async(BACKFILL_ASYNC, json.dumps(payload))
+            return {
+                'scanned': scanned,
+                'last_evaluated_key': response['LastEvaluatedKey']}
+
+
+# Compare the rollups of a device with its raw device_logs records.
+# {"device_id": "...", "object_ids": ["..."], "time_unit": "daily",
+#  "from_time": "2017-01-01T00:00:00", "to_time": "2017-01-31T23:59:59",
+#  "repair": true}
+# Every bucket overlapping the time period is checked. With 'repair',
+# missing or outdated rollups are rewritten from device_logs.
+def check(event, context):
+    logger.info(f'device_log_rollups: check, {event}')
+    device_log = DeviceLog()
+    rollup = DeviceLogRollup()
+
+    device_id = event['device_id']
+    time_unit = event['time_unit']
+    from_bucket = device_log_rollup.bucket(event['from_time'], time_unit)
+    to_bucket = device_log_rollup.bucket(event['to_time'], time_unit)
+    # Timestamps of the last bucket are all before to_bucket + '~'
+    db_query_params = {'from_time': from_bucket, 'to_time': to_bucket + '~'}
+
+    checked = 0
+    mismatches = []
+    for object_id in event['object_ids']:
+        records = device_log.get_all_logs_in_interval(
+            device_id + '#' + object_id, db_query_params) or []
+        raw = device_log_rollup.latest_per_bucket(records, time_unit)
+        rollups = rollup.get_rollups(
+            device_id, object_id, time_unit, from_bucket, to_bucket)
+
+        for key in sorted(set(raw) | set(rollups)):
+            checked += 1
+            expected = raw.get(key)
+            actual = rollups.get(key)
+            if (expected and actual and
+                    expected['timestamp'] == actual['timestamp'] and
+                    expected['value'] == actual['value']):
+                continue
+            mismatches.append({
+                'object_id': object_id,
+                'bucket': key,
+                'expected': expected and {
+                    'timestamp': expected['timestamp'],
+                    'value': expected['value']},
+                'actual': actual and {
+                    'timestamp': actual['timestamp'],
+                    'value': actual['value']}
+            })
+            if event.get('repair') and expected:
+                rollup.put_bucket(
+                    device_id, object_id, time_unit,
+                    expected['timestamp'], expected['value'])
+
+    if mismatches:
+        logger.warning(
+            f'device_log_rollups: {len(mismatches)} mismatches for '
+            f'device {device_id}: {mismatches}')
+    return {'checked': checked, 'mismatches': mismatches}
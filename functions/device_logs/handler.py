@@ -1,3 +1,4 @@
+import concurrent.futures
 import json
 import logging
 from botocore.exceptions import ClientError
@@ -6,6 +7,7 @@ from constants.odessa_response_codes import *
 from constants.device_response_codes import *
 from functions import helper
 from models.device_log import DeviceLog
+from models.device_log import latest_logs_max_workers
 from models.device_network_status import DeviceNetworkStatus
 from models.device_subscription import DeviceSubscription
 from models.service_oid import ServiceOid
@@ -47,25 +49,32 @@ def get_latest_logs(event, context):
 
         #   Make sure that multiple instance of same device_id
         #   is not present in the request
-        device_ids = list(set(device_ids))
+        device_ids = [device_id.lower() for device_id in set(device_ids)]
+        unique_ids = list(set(device_ids))
 
-        for device_id in device_ids:
-            device_id = device_id.lower()
-            #   Retrieve object_ids (whose status is Subscribed) for a particular
-            #   device_id and service_id from DeviceSubscription table.
-            status_res = device_subscription.get_device_status(
-                device_id, service_id)
+        #   Subscriptions, network statuses and latest logs of every
+        #   requested device are retrieved together on one executor
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=latest_logs_max_workers()) as executor:
+            #   Retrieve object_ids (whose status is Subscribed) for the
+            #   device_ids and service_id from DeviceSubscription table.
+            status_future = executor.submit(
+                device_subscription.get_device_statuses,
+                unique_ids, service_id)
 
             #   Retrieve Online_Offline feature value from
             #   DeviceNetworkStatus table
-            network_res = device_network_status.get_latest_status(
-                device_id)
+            network_statuses = device_network_status.get_latest_statuses(
+                unique_ids, executor)
+            statuses = status_future.result()
+
+            #   Retrieve latest logs from either ElastiCache or Dynamodb
+            latest_logs = device_log.get_latest_logs_for_devices(
+                statuses, executor)
 
-            #   Verify if the above extracted data from DeviceLog table is
-            #   latest or not by checking with DeviceSubscription table data
-            if network_res:
-                network_res = network_res[0] if type(
-                    network_res) is list else network_res
+        for device_id in device_ids:
+            status_res = statuses.get(device_id, [])
+            network_res = network_statuses.get(device_id)
 
             #   If no object_id is Subscribed yet or the device_id
             #   is not found in the DeviceSubscription table and device_id
@@ -75,8 +84,7 @@ def get_latest_logs(event, context):
                 devices.append(
                     helper.create_devices_layer([], device_id, code=DEVICE_NOT_FOUND))
             else:
-                #   Retrieve latest logs from either ElastiCache or Dynamodb
-                log_res = device_log.get_latest_logs(status_res)
+                log_res = latest_logs.get(device_id, {'Items': []})
                 if not log_res['Items'] and not network_res:
                     logger.warning(
                         "handler:device_logs No records found for device {}".format(device_id)
@@ -1,7 +1,9 @@
+import concurrent.futures
 import json
 import logging
 from functions import helper
 from models.device_log import DeviceLog
+from models.device_log import latest_logs_max_workers
 from models.device_network_status import DeviceNetworkStatus
 from botocore.exceptions import ClientError
 from botocore.exceptions import ConnectionError
@@ -41,8 +43,12 @@ def save_notify_logs_db(event, context):
             [tuple(d.items()) for d in request['notification']])]
         request['notification'] = redundant_data
 
+        #   The latest logs missing from the cache are queried on one
+        #   executor bounded by LATEST_LOGS_MAX_WORKERS
         cache_res = device_log.is_exists_cache(request)
-        db_res = device_log.is_exists_db(cache_res)
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=latest_logs_max_workers()) as executor:
+            db_res = device_log.is_exists_db(cache_res, executor)
 
         if db_res['notification']:
             device_log.put_logs(db_res)
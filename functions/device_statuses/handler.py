@@ -1,3 +1,4 @@
+import concurrent.futures
 import sys
 import json
 import logging
@@ -12,8 +13,7 @@ from helpers import time_functions
 from datetime import datetime, timedelta
 from constants.odessa_response_codes import *
 from constants.feature_response_codes import *
-from pymib.mib import MIB
-from pymib.oid import OID
+from helpers import mib_cache
 
 logger = logging.getLogger('device_statuses')
 logger.setLevel(logging.INFO)
@@ -21,6 +21,7 @@ logger.setLevel(logging.INFO)
 
 def get_device_statuses(event, context):
     logger.info(event)
+    mib_cache.warm()
     data = json.loads(event['body'])
 
     if ('reporting_id' not in data
@@ -57,37 +58,68 @@ def get_device_statuses(event, context):
         status_from = datetime.now() - timedelta(hours=1)
 
     data['features'] = list(OrderedDict.fromkeys(data['features']))
-    oids, missings = MIB.search_oid(data['features'])
+    oids, missings = mib_cache.search_oid(data['features'])
     if missings and not oids:
         return device_statuses_response(BAD_REQUEST, [], '"features" values are invalid')
 
+    # Registrations of every reporting_id are read concurrently
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        registration_futures = {
+            reporting_id: executor.submit(
+                ReportingRegistration().read, reporting_id, log_service_id)
+            for reporting_id in data['reporting_id']}
+        concurrent.futures.wait(registration_futures.values())
+
+    # Statuses of every registered device, including the pair OIDs of
+    # counters, are read at once
+    object_ids = list(oids.keys())
+    for object_id in oids:
+        if mib_cache.oid_type(object_id) == 'counter':
+            try:
+                object_ids.append(mib_cache.pair_oid(object_id))
+            except:  # pragma: no cover
+                logger.warning(f'no pair OID for counter {object_id}')
+    status_keys = []
+    for reporting_id, future in registration_futures.items():
+        if future.exception() or not future.result():
+            continue
+        status_keys.extend(
+            (reporting_id, object_id) for object_id in object_ids)
+    statuses = {}
+    status_error = None
+    try:
+        statuses = DeviceStatus().batch_read(status_keys)
+    except (ClientError, ConnectionError) as e:  # pragma: no cover
+        status_error = e
+
     response_data = []
     for reporting_id in data['reporting_id']:
         try:
-            reporting_registration = ReportingRegistration().read(reporting_id, log_service_id)
+            reporting_registration = registration_futures[reporting_id].result()
             if not reporting_registration:
                 response_data.append(create_device_result(reporting_id, [], DEVICE_NOT_FOUND))
                 continue
+            if status_error:  # pragma: no cover
+                raise status_error
 
             feature_results = []
             processed_count_type_features = []
             for missing_feature in missings:
                 feature_results.append(create_feature_result(missing_feature, None, FEATURE_NOT_FOUND))
             for object_id, feature_names in oids.items():
-                oid = OID(object_id)
+                oid = mib_cache.oid(object_id)
                 if oid.type in ['count_type', 'counter']:
                     feature_names = list(set(feature_names) - set(processed_count_type_features))
                     if not feature_names:
                         continue
 
-                device_status = DeviceStatus()
-                device_status.read(reporting_id, object_id)
-                if(device_status.is_existing() and
+                device_status = statuses.get((reporting_id, object_id))
+                if(device_status and
                    timestamp_newer_than(device_status.timestamp, status_from)):
                     for feature_name in feature_names:
                         device_id = reporting_registration[0]['device_id']
                         oid_data = device_status.data
-                        if(oid.type == 'counter' and oid_feature_is_matching(device_id, device_status, feature_name, status_from)):
+                        if(oid.type == 'counter' and oid_feature_is_matching(device_id, device_status, feature_name, status_from, statuses)):
                             processed_count_type_features.append(feature_name)
                             feature_results.append(create_feature_result(feature_name, oid_data['counter_value'], SUCCESS))
                         elif(feature_name in oid_data and
@@ -158,18 +190,17 @@ def device_statuses_response(error_code, data, message=None):
     return helper.create_odessa_response(error_code, {'devices': data}, message)
 
 
-def oid_feature_is_matching(device_id, device_status, feature_name, status_from):
-    pair_oid = OID(device_status.object_id).pair_oid
-    pair_oid_status = DeviceStatus()
-    pair_oid_status.read(device_status.reporting_id, pair_oid)
-    if (pair_oid_status.is_existing() and
-       OID(pair_oid).parse(pair_oid_status.data['count_type_id']['value']) == feature_name and
+def oid_feature_is_matching(device_id, device_status, feature_name, status_from, statuses):
+    pair_oid = mib_cache.pair_oid(device_status.object_id)
+    pair_oid_status = statuses.get((device_status.reporting_id, pair_oid))
+    if (pair_oid_status and
+       mib_cache.oid(pair_oid).parse(pair_oid_status.data['count_type_id']['value']) == feature_name and
        timestamp_newer_than(device_status.data['counter_value']['timestamp'], status_from)):
         return True
     else:
         log_record = DeviceLog().get_log({'oid': pair_oid}, device_id)
         if (log_record and log_record['Items'] and
-           OID(pair_oid).parse(log_record['Items'][0]['value']) == feature_name and
+           mib_cache.oid(pair_oid).parse(log_record['Items'][0]['value']) == feature_name and
            timestamp_newer_than(device_status.data['counter_value']['timestamp'], status_from)):
             return True
     return False
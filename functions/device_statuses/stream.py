@@ -1,118 +1,218 @@
 import logging
 import sys
-import json
 from models.device_status import DeviceStatus
 from models.cloud_device import CloudDevice
 from models.email_device import EmailDevice
 from models.service_oid import ServiceOid
 from models.push_notification_subscription import PushNotificationSubscription
 from models.accumulated_device_log import AccumulatedDeviceLog
-from functions import helper
+from models.accumulated_device_log import accumulated_log_oids
+from models.device_log_rollup import DeviceLogRollup
+from models import device_log_rollup
+from functions.push_notifications.dispatcher import PushNotificationDispatcher
 from helpers.time_functions import parse_time
-from pymib.oid import OID
-from pymib.mib import MIB
+from helpers import mib_cache
+from helpers import time_functions
 
 logger = logging.getLogger('device_logs_stream')
 logger.setLevel(logging.INFO)
 
 
+# Records of a batch are grouped by device_id#object_id. Registrations,
+# statuses and push subscriptions are read once per distinct key and the
+# final status of every key is written back in one batch. A failure of one
+# key does not stop the others.
 def save_cloud_device_status(event, context):
     logger.info(f'stream: device_logs, {event}')
+    mib_cache.warm()
+
+    logs = parse_cloud_device_logs(event['Records'])
+    if not logs:
+        return
+
+    save_accumulated_logs(logs)
+    save_rollups(logs)
+
+    # A failed read raises so that the stream retries the whole batch. The
+    # accumulated logs and rollups above are idempotent.
+    cloud_devices = CloudDevice().batch_read(
+        [device_id for device_id, _ in logs])
+    for device_id in {device_id for device_id, _ in logs} - set(cloud_devices):
+        logger.warning(f'device_id {device_id} not subscribed to reporting')
+
+    keys = [
+        (cloud_devices[device_id].reporting_id, object_id)
+        for device_id, object_id in logs if device_id in cloud_devices]
     device_status = DeviceStatus()
-    cloud_device = CloudDevice()
-    accumulated_device_log = AccumulatedDeviceLog()
+    statuses = device_status.batch_read(keys)
+    subscriptions = PushNotificationSubscription().batch_read(
+        [(cloud_devices[device_id].log_service_id, object_id)
+         for device_id, object_id in logs if device_id in cloud_devices])
 
-    for record in event['Records']:
+    changed_statuses = []
+    dispatcher = PushNotificationDispatcher()
+    for (device_id, object_id), records in logs.items():
+        if device_id not in cloud_devices:
+            continue
+        try:
+            cloud_device = cloud_devices[device_id]
+            key = (cloud_device.reporting_id, object_id)
+            status, changed, changes = apply_cloud_device_logs(
+                cloud_device.reporting_id, object_id,
+                statuses.get(key), records)
+
+            subscription = subscriptions.get(
+                (cloud_device.log_service_id, object_id))
+            notifications = [
+                (cloud_device.reporting_id, subscription.object_id,
+                 timestamp, notify_data, subscription.notify_url)
+                for timestamp, notify_data in changes] if subscription else []
+        except Exception:
+            logger.error(sys.exc_info())
+            continue
+        if changed:
+            changed_statuses.append(status)
+        for notification in notifications:
+            dispatcher.add(*notification)
+
+    save_statuses(device_status, changed_statuses)
+    dispatcher.dispatch()
+
+
+# Statuses are saved in one batch, one by one if the batch fails so that a
+# bad status only loses its own write
+def save_statuses(device_status, statuses):
+    try:
+        device_status.batch_write(statuses)
+    except Exception:
+        logger.error(sys.exc_info())
+        for status in statuses:
+            try:
+                device_status.batch_write([status])
+            except Exception:
+                logger.error(sys.exc_info())
+
+
+# INSERT records of device_logs grouped by (device_id, object_id), each in
+# stream order
+def parse_cloud_device_logs(records):
+    logs = {}
+    for record in records:
         try:
             ddb_action = record['eventName']
             if ddb_action == 'INSERT':
-                device_log_id = record['dynamodb']['Keys']['id']['S'].split('#')
-                timestamp = record['dynamodb']['NewImage']['timestamp']['S']
-                device_id = device_log_id[0]
-                object_id = device_log_id[1]
-                oid = OID(object_id)
+                device_id, object_id = record['dynamodb']['Keys']['id']['S'].split('#')
                 rawdata = record['dynamodb']['NewImage']['value']['S']
-                data = oid.parse(rawdata)
-
-                if oid.type == 'count_type':
-                    data = {'count_type_id': record['dynamodb']['NewImage']['value']['S']}
-                elif oid.type == 'counter':
-                    data = {'counter_value': data}
-
-                accumulated_device_log.read(device_id, object_id, timestamp)
-                if not accumulated_device_log.is_existing():
-                    accumulated_device_log.insert(device_id, object_id, timestamp, rawdata)
-                else:
-                    accumulated_log = accumulated_device_log.accumulated_log
-                    latest_date = accumulated_log[-1]['timestamp'][0:10]
-                    if latest_date == timestamp[0:10]:
-                        accumulated_log[-1]['timestamp'] = timestamp
-                        accumulated_log[-1]['value'] = rawdata
-                    else:
-                        accumulated_log.append({'value' : rawdata, 'timestamp' : timestamp})
-                    accumulated_device_log.update(accumulated_log)
-
-                cloud_device.read(device_id)
-                if not cloud_device.is_existing():
-                    logger.warning(f'device_id {device_id} not subscribed to reporting')
-                    return
-
-                device_status.read(cloud_device.reporting_id, object_id)
-                notify_data = []
-                if not device_status.is_existing():
-                    insert_data = {}
-                    for key, value in data.items():
-                        insert_data[key] = {'value': value, 'timestamp': timestamp}
-                        notify_data.append({'feature_name': key, 'value': value})
-                    device_status.insert(cloud_device.reporting_id, object_id, timestamp, insert_data)
-                elif parse_time(device_status.timestamp) < parse_time(timestamp):
-                    update_data = device_status.data
-                    updated = False
-                    for key, value in data.items():
-                        if update_data[key]['value'] != value:
-                            updated = True
-                            update_data[key]['value'] = value
-                            update_data[key]['timestamp'] = timestamp
-                            notify_data.append({'feature_name': key, 'value': value})
-                    if updated:
-                        device_status.update(timestamp, update_data)
-
-                subscription = PushNotificationSubscription().read(cloud_device.log_service_id, object_id)
-                if subscription.is_subscribed() and notify_data:
-                    payload = {
-                        'reporting_id': cloud_device.reporting_id,
-                        'object_id': subscription.object_id,
-                        'timestamp': timestamp,
-                        'data': notify_data,
-                        'notify_url': subscription.notify_url
-                    }
-                    helper.invoke_async('send_push_notification', json.dumps(payload))
+                logs.setdefault((device_id, object_id), []).append({
+                    'timestamp': record['dynamodb']['NewImage']['timestamp']['S'],
+                    'value': rawdata,
+                    'data': parse_cloud_device_data(object_id, rawdata)
+                })
             else:
                 logger.warning(f'Unexpected DB action {ddb_action} on table device_logs caught on stream')
         except:  # pragma: no cover
             logger.error(sys.exc_info())
+    return logs
+
+
+def parse_cloud_device_data(object_id, rawdata):
+    oid = mib_cache.oid(object_id)
+    if oid.type == 'count_type':
+        return {'count_type_id': rawdata}
+    data = oid.parse(rawdata)
+    if oid.type == 'counter':
+        return {'counter_value': data}
+    return data
+
+
+# Only the latest log of each day is accumulated
+def save_accumulated_logs(logs):
+    accumulated_device_log = AccumulatedDeviceLog()
+    accumulated_oids = accumulated_log_oids()
+    for (device_id, object_id), records in logs.items():
+        if object_id not in accumulated_oids:
+            continue
+        try:
+            latest = device_log_rollup.latest_per_bucket(
+                records, time_functions.DAILY)
+            for day in sorted(latest):
+                accumulated_device_log.put(
+                    device_id, object_id, latest[day]['timestamp'],
+                    latest[day]['value'])
+        except Exception:
+            logger.error(sys.exc_info())
+
+
+# Only the latest log of each bucket is rolled up
+def save_rollups(logs):
+    rollup = DeviceLogRollup()
+    for (device_id, object_id), records in logs.items():
+        try:
+            for time_unit in device_log_rollup.BUCKET_LENGTHS:
+                for record in device_log_rollup.latest_per_bucket(
+                        records, time_unit).values():
+                    rollup.put_bucket(
+                        device_id, object_id, time_unit,
+                        record['timestamp'], record['value'])
+        except Exception:
+            logger.error(sys.exc_info())
+
+
+# Apply the logs of one key to its status in memory, in stream order.
+# Returns the final status, whether it has to be saved and the
+# (timestamp, notify_data) of every log which changed it.
+def apply_cloud_device_logs(reporting_id, object_id, status, records):
+    changed = False
+    changes = []
+    for record in records:
+        timestamp = record['timestamp']
+        notify_data = []
+        if status is None:
+            status = DeviceStatus()
+            status.reporting_id = reporting_id
+            status.object_id = object_id
+            status.timestamp = timestamp
+            status.data = {}
+            changed = True
+            for key, value in record['data'].items():
+                status.data[key] = {'value': value, 'timestamp': timestamp}
+                notify_data.append({'feature_name': key, 'value': value})
+        elif parse_time(status.timestamp) < parse_time(timestamp):
+            for key, value in record['data'].items():
+                if status.data[key]['value'] != value:
+                    status.data[key]['value'] = value
+                    status.data[key]['timestamp'] = timestamp
+                    notify_data.append({'feature_name': key, 'value': value})
+            if notify_data:
+                status.timestamp = timestamp
+        if notify_data:
+            changed = True
+            changes.append((timestamp, notify_data))
+    return status, changed, changes
 
 
 def save_email_device_status(event, context):
     logger.info(f'stream: email_logs, {event}')
-    email_device = EmailDevice()
+    mib_cache.warm()
+    dispatcher = PushNotificationDispatcher()
 
     for record in event['Records']:
         try:
             ddb_action = record['eventName']
             if ddb_action == 'INSERT':
                 serial_number = record['dynamodb']['Keys']['serial_number']['S']
+                email_device = EmailDevice()
                 email_device.read(serial_number)
                 if not email_device.is_existing():
                     logger.warning(f'serial_number {serial_number} not subscribed to reporting')
-                    return
+                    continue
 
                 timestamp = record['dynamodb']['NewImage']['timestamp']['S']
                 features = record['dynamodb']['NewImage']
                 features.pop('timestamp')
                 service_oids = ServiceOid().read(email_device.log_service_id)['oids']
 
-                oids, missings = MIB.search_oid(list(features.keys()))
+                oids, missings = mib_cache.search_oid(list(features.keys()))
                 if missings:
                     logger.warning(f'unknown features {missings} saved in email logs')
 
@@ -124,16 +224,17 @@ def save_email_device_status(event, context):
                     else:
                         processed_feature_names.append(feature_names)
 
-                    oid = OID(object_id)
+                    oid = mib_cache.oid(object_id)
                     if oid.type == 'count_type':
                         notify_data.append(
                             put_count_type_oid(email_device, oid, feature_names,
-                                               timestamp, features)
+                                               timestamp, features, dispatcher)
                         )
                     else:
                         notify_data.append(
                             put_key_value_oid(email_device, object_id,
-                                              feature_names, timestamp, features)
+                                              feature_names, timestamp, features,
+                                              dispatcher)
                         )
 
             else:
@@ -141,22 +242,24 @@ def save_email_device_status(event, context):
         except:  # pragma: no cover
             logger.error(sys.exc_info())
 
+    dispatcher.dispatch()
+
 
-def put_count_type_oid(email_device, oid, feature_names, timestamp, features):
+def put_count_type_oid(email_device, oid, feature_names, timestamp, features, dispatcher):
     notify_data = {}
     for count_type_id, feature_name in oid.id_map.items():
         device_status = DeviceStatus()
         if feature_name not in feature_names:
             continue
 
-        map_id = list(oid.id_map.keys()).index(count_type_id) + 1
+        map_id = mib_cache.count_type_index(oid.oid)[count_type_id]
         count_type_oid = '.'.join([oid.oid, str(map_id)])
         try:
-            pair_oid = OID(count_type_oid).pair_oid
+            pair_oid = mib_cache.pair_oid(count_type_oid)
         except:
             short_oid = oid.oid[:oid.oid.rindex('.')]
             count_type_oid = '.'.join([short_oid, str(map_id)])
-            pair_oid = OID(count_type_oid).pair_oid
+            pair_oid = mib_cache.pair_oid(count_type_oid)
         device_status.read(email_device.reporting_id, count_type_oid)
         if not device_status.is_existing():
             device_status.insert(
@@ -183,10 +286,10 @@ def put_count_type_oid(email_device, oid, feature_names, timestamp, features):
             notify_data[pair_oid] = {'feature_name': 'counter_value', 'value': features[feature_name]['S']}
 
     if notify_data:
-        send_push_notification(email_device, notify_data, timestamp)
+        send_push_notification(email_device, notify_data, timestamp, dispatcher)
 
 
-def put_key_value_oid(email_device, object_id, feature_names, timestamp, features):
+def put_key_value_oid(email_device, object_id, feature_names, timestamp, features, dispatcher):
     device_status = DeviceStatus()
     notify_data = []
     device_status.read(email_device.reporting_id, object_id)
@@ -211,18 +314,13 @@ def put_key_value_oid(email_device, object_id, feature_names, timestamp, feature
     if notify_data:
         data = {}
         data[object_id] = notify_data
-        send_push_notification(email_device, data, timestamp)
+        send_push_notification(email_device, data, timestamp, dispatcher)
 
 
-def send_push_notification(email_device, notify_data, timestamp):
+def send_push_notification(email_device, notify_data, timestamp, dispatcher):
     for object_id, data in notify_data.items():
         subscription = PushNotificationSubscription().read(email_device.log_service_id, object_id)
         if subscription.is_subscribed():
-            payload = {
-                'reporting_id': email_device.reporting_id,
-                'object_id': subscription.object_id,
-                'timestamp': timestamp,
-                'data': data,
-                'notify_url': subscription.notify_url
-            }
-            helper.invoke_async('send_push_notification', json.dumps(payload))
+            dispatcher.add(
+                email_device.reporting_id, subscription.object_id,
+                timestamp, data, subscription.notify_url)
@@ -0,0 +1,54 @@
+import os
+import re
+import threading
+import yaml
+
+# Country config of the email reports, config/country_config/{STAGE}.yml.
+# The file is parsed once per (warm) Lambda container and parsed again only
+# when its modification time changes.
+
+_lock = threading.Lock()
+_cache = {}
+
+
+class Country(object):
+    def __init__(self, config):
+        self.email_enabled = bool(config.get('email_enabled'))
+        self.subject_list = str(config.get('subject_list', '')).split('|')
+        # One alternation of every subject, longest first
+        self.subject_regex = re.compile('|'.join(
+            re.escape(subject) for subject in sorted(
+                self.subject_list, key=len, reverse=True)))
+
+    def is_report_subject(self, email_subject):
+        return self.subject_regex.search(email_subject) is not None
+
+
+def config_path(stage=None):
+    return f"config/country_config/{stage or os.environ['STAGE']}.yml"
+
+
+# Countries of the config file by country code
+def countries(path=None):
+    path = path or config_path()
+    mtime = os.stat(path).st_mtime_ns
+    cached = _cache.get(path)
+    if not cached or cached[0] != mtime:
+        with _lock:
+            cached = _cache.get(path)
+            if not cached or cached[0] != mtime:
+                cached = _cache[path] = (mtime, load(path))
+    return cached[1]
+
+
+def load(path):
+    with open(path) as data:
+        yaml_data = yaml.safe_load(data)
+    return {
+        country_code: Country(config or {})
+        for country_code, config in yaml_data['CountryConfig'].items()}
+
+
+def reset():
+    with _lock:
+        _cache.clear()
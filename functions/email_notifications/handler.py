@@ -1,200 +1,284 @@
-import boto3
+import concurrent.futures
 import csv
-import email
+import functools
 import io
 import logging
 import json
 from datetime import datetime
+from email.policy import compat32
+from email.message import Message
+from email.parser import BytesFeedParser
 from config import PrintCountFieldMap
+from functions.email_notifications import country_config
+from models import connections
 from models.device_email_log import DeviceEmailLog
 import xml.etree.ElementTree as ET
 from botocore.exceptions import ClientError
 from botocore.exceptions import ConnectionError
-from os import environ
-from botocore.client import Config
-import yaml
 import os
 import traceback
 
 logger = logging.getLogger('email_notifications')
 logger.setLevel(logging.INFO)
 
+MAIL_CHUNK_SIZE = 64 * 1024
+XML_CHUNK_SIZE = 64 * 1024
+SUPPORTED_EXTENSIONS = ('xml', 'csv')
+DEFAULT_EMAIL_REPORT_MAX_WORKERS = 8
+
+# Store the print counts reports of every mail of the SNS records. Mails are
+# fetched from S3 and parsed concurrently, every xml or csv attachment gives
+# one device_email_logs row and all the rows are written in one batch. A mail
+# or attachment which fails only loses its own rows.
 def save_mail_report(event, context):
-    device_email_log = DeviceEmailLog()
-    mail_log_data = {}
-    xml_parsed_field_map_dict = {}
-    csv_parsed_field_map_dict = {}
     logger.info(f"Request parameter: {event}")
+    countries = country_config.countries()
 
-    try:
-        request = json.loads(event["Records"][0]['Sns']['Message'])
+    mails = []
+    for record in event.get('Records', []):
+        mail = parse_mail_record(record, countries)
+        if mail:
+            mails.append(mail)
+    if not mails:
+        return
 
-        email_from = request['mail']['commonHeaders']['from'][0]
-        country_code = email_from[-2:]
-        subject_present = False
-        env = os.environ['STAGE']
-
-        with open(f"config/country_config/{env}.yml") as data:
-            yaml_data = yaml.load(data)
-
-        if (
-            country_code in yaml_data['CountryConfig']
-                and yaml_data['CountryConfig'][country_code]['email_enabled']):
-            email_subject = request['mail']['commonHeaders']['subject']
-            country_email_subject = yaml_data['CountryConfig'][country_code]['subject_list'].split('|')
-
-            for subject in country_email_subject:
-                if subject in email_subject:
-                    subject_present = True
-                    break
-            if not subject_present:
+    mail_logs = []
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=email_report_max_workers()) as executor:
+        futures = [executor.submit(mail_reports, mail) for mail in mails]
+        for mail, future in zip(mails, futures):
+            try:
+                mail_logs.extend(future.result())
+            except (ValueError, TypeError):
+                logger.warning(traceback.format_exc())
+            except ConnectionError as e:
+                logger.error(e)
                 logger.warning(
-                    f'handler:email_notifications this email does not belong '
-                    f'to print counts as the email subject {email_subject} '
-                    f'does not match country {country_code} email '
-                    f'subject {country_email_subject}.'
-                )
-                return
-
-            bucket_name = request['receipt']['action']['bucketName']
-            bucket_object_key = request['receipt']['action']['objectKey']
-            bucket_region_name = request['receipt']['action']['topicArn'].split(':')[3]
-            mail_timestamp = request['mail']['timestamp']
-
-
-            raw_email = retrieve_mail(bucket_name, bucket_object_key, bucket_region_name)
-            msg = email.message_from_string(raw_email)
-            attachments = find_attachments(msg)
-            for cdisp, part in attachments:
-                extension = cdisp['filename'].split('.')[1]
-                mail_charset = part.get_content_charset()
-                encoding= mail_charset if mail_charset else 'utf-8'
-                attach_data = str(part.get_payload(decode=True), encoding)
-
-            if extension == 'xml':
-                root = ET.fromstring(attach_data)
-                xml_data = parse_xml(root)
-
-                for item in range(0, len(xml_data), 2):
-                    xml_parsed_field_map_dict[xml_data[item]
-                                              ] = xml_data[item + 1]
-                for k, v in xml_parsed_field_map_dict.items():
-                    if k in PrintCountFieldMap.PrintCountFieldMapXML:
-                        if PrintCountFieldMap.PrintCountFieldMapXML[k] == "serial_number":
-                            mail_log_data[PrintCountFieldMap.PrintCountFieldMapXML[k]
-                                      ] = v.upper() if v else ' '
-                        else:
-                            mail_log_data[PrintCountFieldMap.PrintCountFieldMapXML[k]
-                                      ] = v if v else ' '
-            elif extension == 'csv':
-                raw_data = io.StringIO(attach_data)
-                csv_data = csv.DictReader(raw_data, delimiter=',')
-
-                for item in csv_data:
-                    csv_parsed_field_map_dict = dict(item)
-                for k, v in csv_parsed_field_map_dict.items():
-                    if k in PrintCountFieldMap.PrintCountFieldMapCSV:
-                        if PrintCountFieldMap.PrintCountFieldMapCSV[k] == "serial_number":
-                            mail_log_data[PrintCountFieldMap.PrintCountFieldMapCSV[k]
-                                      ] = v.upper() if v else ' '
-                        else:
-                            mail_log_data[PrintCountFieldMap.PrintCountFieldMapCSV[k]
-                                      ] = v if v else ' '
-            else:
-                logger.warning(
-                    f'handler:email_notifications {extension} '
-                    f'file extension not yet supported')
-                return
-
-            mail_timestamp = datetime.strptime(mail_timestamp, '%Y-%m-%dT%H:%M:%S.%fZ')
-            mail_timestamp = mail_timestamp.replace(microsecond=0)
-            mail_log_data['timestamp'] = mail_timestamp.isoformat()
-            device_email_log.create(mail_log_data)
-        else:
-            logger.warning(
-                f'handler:email_notifications email notifications functionality '
-                f'is not enabled for the specified country {country_code}')
-    except ValueError as e:
-        logger.warning(traceback.format_exc())
-    except TypeError as e:
-        logger.warning(traceback.format_exc())
+                    f'handler:email_notifications Amazon S3 connection error '
+                    f'on SaveMailReport for bucket {mail["bucket_name"]} and '
+                    f'object_key {mail["object_key"]}')
+            except ClientError as e:
+                logger.error(e)
+                error_code = e.response['Error']['Code']
+                if error_code == 'NoSuchBucket':
+                    logger.warning(
+                        f'handler:email_notifications Amazon S3 invalid bucket name '
+                        f'error on SaveMailReport for bucket {mail["bucket_name"]} and '
+                        f'object_key {mail["object_key"]}')
+                elif error_code == 'NoSuchKey':
+                    logger.warning(
+                        f'handler:email_notifications Amazon S3 invalid object key name '
+                        f'error on SaveMailReport for bucket {mail["bucket_name"]} and '
+                        f'object_key {mail["object_key"]}')
+                else:
+                    logger.warning(
+                        f'handler:email_notifications Amazon S3 client error '
+                        f'on SaveMailReport for bucket {mail["bucket_name"]} and '
+                        f'object_key {mail["object_key"]}')
+            except Exception:
+                logger.warning(traceback.format_exc())
+    if not mail_logs:
+        return
+
+    try:
+        DeviceEmailLog().batch_create(mail_logs)
     except ConnectionError as e:
         logger.error(e)
         logger.warning(
             f'handler:email_notifications dynamodb connection error '
-            f'on SaveMailReport for bucket {bucket_name}, object_key '
-            f'{bucket_object_key} and xml_parsed_data {mail_log_data}')
+            f'on SaveMailReport for xml_parsed_data {mail_logs}')
     except ClientError as e:
         logger.error(e)
-        error_code = e.response['Error']['Code']
-        if error_code == 'NoSuchBucket':
+        logger.warning(
+            f'handler:email_notifications dynamodb client error '
+            f'on SaveMailReport for xml_parsed_data {mail_logs}')
+
+
+# S3 location and timestamp of the mail notified by an SNS record, None
+# when the mail is not a print counts report of an enabled country
+def parse_mail_record(record, countries):
+    try:
+        request = json.loads(record['Sns']['Message'])
+
+        email_from = request['mail']['commonHeaders']['from'][0]
+        country_code = email_from[-2:]
+        country = countries.get(country_code)
+        if not (country and country.email_enabled):
             logger.warning(
-                f'handler:email_notifications Amazon S3 invalid bucket name '
-                f'error on SaveMailReport for bucket {bucket_name} and '
-                f'object_key {bucket_object_key}')
-        elif error_code == 'NoSuchKey':
+                f'handler:email_notifications email notifications functionality '
+                f'is not enabled for the specified country {country_code}')
+            return
+
+        email_subject = request['mail']['commonHeaders']['subject']
+        if not country.is_report_subject(email_subject):
             logger.warning(
-                f'handler:email_notifications Amazon S3 invalid object key name '
-                f'error on SaveMailReport for bucket {bucket_name} and '
-                f'object_key {bucket_object_key}')
-        else:
+                f'handler:email_notifications this email does not belong '
+                f'to print counts as the email subject {email_subject} '
+                f'does not match country {country_code} email '
+                f'subject {country.subject_list}.'
+            )
+            return
+
+        mail_timestamp = datetime.strptime(
+            request['mail']['timestamp'], '%Y-%m-%dT%H:%M:%S.%fZ')
+        return {
+            'bucket_name': request['receipt']['action']['bucketName'],
+            'object_key': request['receipt']['action']['objectKey'],
+            'region_name': request['receipt']['action']['topicArn'].split(':')[3],
+            'timestamp': mail_timestamp.replace(microsecond=0).isoformat()
+        }
+    except (ValueError, TypeError, KeyError):
+        logger.warning(traceback.format_exc())
+
+
+# device_email_logs rows of every report attached to the mail
+def mail_reports(mail):
+    mail_logs = []
+    for attachment in retrieve_attachments(
+            mail['bucket_name'], mail['object_key'], mail['region_name']):
+        try:
+            mail_log_data = parse_attachment(attachment)
+        except Exception:
+            # e.g. malformed xml or unknown charset
             logger.warning(
-                f'handler:email_notifications dynamodb client error '
-                f'on SaveMailReport for bucket {bucket_name}, object_key '
-                f'{bucket_object_key} and xml_parsed_data {mail_log_data}')
-
-def parse_xml(root):
-    res = []
-    for child in root:
-        res = res + read_rec(child, child.tag.split('}')[1])
-    return res
+                f'handler:email_notifications invalid report '
+                f'{attachment.get_filename()} in {mail["object_key"]}: '
+                f'{traceback.format_exc()}')
+            continue
+        if not (mail_log_data.get('serial_number') or '').strip():
+            logger.warning(
+                f'handler:email_notifications no serial number in '
+                f'{attachment.get_filename()} of {mail["object_key"]}')
+            continue
+        mail_log_data['timestamp'] = mail['timestamp']
+        mail_logs.append(mail_log_data)
+    if not mail_logs:
+        logger.warning(
+            f'handler:email_notifications no xml or csv report '
+            f'found in {mail["object_key"]}')
+    return mail_logs
+
 
+def parse_attachment(attachment):
+    mail_charset = attachment.get_content_charset()
+    encoding = mail_charset if mail_charset else 'utf-8'
+    attach_data = str(attachment.get_payload(decode=True), encoding)
+    if attachment_extension(attachment) == 'xml':
+        return parse_xml(attach_data)
+    return parse_csv(attach_data)
 
-def read_rec(node, name, parent=None):
-    if len(node.getchildren()) > 0:
-        res = []
-        for child in node:
-            child_name_prefix = child.tag.split('}')[1]
-            if child.attrib:
-                attr = child.attrib
-                key = next(iter(attr.keys()))
-                valu = next(iter(attr.values()))
-                child_name_prefix = child_name_prefix + '_' + key + '_' + valu
-            res = res + read_rec(child, child_name_prefix, name)
+
+# Fields of PrintCountFieldMapCSV in the last row of the csv report. The
+# columns mapping to a field are looked up once from the header.
+def parse_csv(data, field_map=PrintCountFieldMap.PrintCountFieldMapCSV):
+    reader = csv.reader(io.StringIO(data), delimiter=',')
+    header = next(reader, [])
+    columns = [
+        (i, field_map[column]) for i, column in enumerate(header)
+        if column in field_map]
+    row = None
+    for line in reader:
+        # Blank lines, e.g. at the end of the report, are skipped
+        if line:
+            row = line
+    res = {}
+    if row is None:
         return res
-    else:
-        return [parent + '_' + name, node.text]
-
-
-def retrieve_mail(bucket_name, bucket_object_key, bucket_region_name):
-    if environ['S3_ENDPOINT_URL']:
-        s3client = boto3.resource('s3', endpoint_url=environ['S3_ENDPOINT_URL'],
-                                aws_access_key_id=environ['S3_ACCESS_KEY'],
-                                aws_secret_access_key=environ['S3_SECRET_KEY'],
-                                config=Config(signature_version='s3v4'),
-                                )
-    else:
-        s3client = boto3.resource('s3', region_name=bucket_region_name)
-    obj = s3client.Object(bucket_name, bucket_object_key)
-    res = obj.get()
-    return (res['Body'].read().decode('utf-8'))
-
-def find_attachments(message):
-    found = []
-    for part in message.walk():
-        if 'content-disposition' not in part:
-            continue
-        cdisp = part['content-disposition'].split(';')
-        cdisp = [x.strip() for x in cdisp]
-        if cdisp[0].lower() != 'attachment':
+    for i, field in columns:
+        value = row[i] if i < len(row) else None
+        if field == "serial_number":
+            res[field] = value.upper() if value else ' '
+        else:
+            res[field] = value if value else ' '
+    return res
+
+
+def email_report_max_workers():
+    return int(os.environ.get(
+        'EMAIL_REPORT_MAX_WORKERS', DEFAULT_EMAIL_REPORT_MAX_WORKERS))
+
+
+# Flatten the xml report into the fields of PrintCountFieldMapXML in one
+# pass. A leaf is named after its parent and itself, e.g. 'PageCount_Total';
+# below the children of the root element the first attribute of an element
+# is appended to its name, e.g. 'DrumUnit_Unit_pages'. Elements are cleared
+# once parsed and leaves which do not map to any field are dropped.
+def parse_xml(data, field_map=PrintCountFieldMap.PrintCountFieldMapXML):
+    res = {}
+    path = []
+    leaf = False
+    for event, elem in xml_events(data):
+        if event == 'start':
+            path.append(element_name(elem, len(path) > 1))
+            leaf = True
             continue
-        parsed = {}
-        for kv in cdisp[1:]:
-            key, val = kv.split('=')
-            if val.startswith('"'):
-                val = val.strip('"')
-            elif val.startswith("'"):
-                val = val.strip("'")
-            parsed[key] = val
-        found.append((parsed, part))
+        name = path.pop()
+        if leaf and len(path) > 1:
+            key = path[-1] + '_' + name
+            if key in field_map:
+                value = elem.text
+                if field_map[key] == "serial_number":
+                    res[field_map[key]] = value.upper() if value else ' '
+                else:
+                    res[field_map[key]] = value if value else ' '
+        leaf = False
+        elem.clear()
+    return res
+
+
+def xml_events(data):
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    for offset in range(0, len(data), XML_CHUNK_SIZE):
+        parser.feed(data[offset:offset + XML_CHUNK_SIZE])
+        yield from parser.read_events()
+    parser.close()
+    yield from parser.read_events()
+
+
+def element_name(elem, with_attribute):
+    name = elem.tag.rsplit('}', 1)[-1]
+    if with_attribute and elem.attrib:
+        key, value = next(iter(elem.attrib.items()))
+        name = name + '_' + key + '_' + value
+    return name
+
+
+# Parse the mail stored in S3 by chunks of MAIL_CHUNK_SIZE bytes and
+# return its xml and csv attachments. Only these parts are kept, the
+# other parts are never decoded.
+def retrieve_attachments(bucket_name, bucket_object_key, bucket_region_name):
+    obj = connections.s3_resource(bucket_region_name).Object(
+        bucket_name, bucket_object_key)
+    return read_attachments(obj.get()['Body'])
+
+
+def read_attachments(body):
+    found = []
+    parser = BytesFeedParser(_factory=functools.partial(MailPart, found))
+    try:
+        for chunk in iter(functools.partial(body.read, MAIL_CHUNK_SIZE), b''):
+            parser.feed(chunk)
+        parser.close()
+    finally:
+        body.close()
     return found
+
+
+def attachment_extension(part):
+    filename = part.get_filename()
+    if filename and '.' in filename:
+        return filename.rsplit('.', 1)[1].lower()
+
+
+class MailPart(Message):
+    # The payload of a part is set once the parser reached its end, the
+    # supported attachments are collected in 'found' at that point
+    def __init__(self, found, policy=compat32):
+        super().__init__(policy=policy)
+        self.found = found
+
+    def set_payload(self, payload, charset=None):
+        super().set_payload(payload, charset)
+        if (self.get_content_disposition() == 'attachment' and
+                attachment_extension(self) in SUPPORTED_EXTENSIONS):
+            self.found.append(self)
@@ -2,7 +2,6 @@ import json
 import logging
 from os import environ
 from os import path
-import boto3
 from constants.odessa_response_codes import *
 from constants.boc_response_codes import *
 from constants.feature_response_codes import *
@@ -10,6 +9,7 @@ from constants.device_response_codes import *
 from constants.oids import *
 from boc.subscription import Subscription
 from helpers import time_functions
+from models import connections
 
 RUN_SUBSCRIBE_ASYNC = 'run_subscribe'
 RUN_UNSUBSCRIBE_ASYNC = 'run_unsubscribe'
@@ -181,8 +181,7 @@ def invoke_async(function_name, payload):
     if 'IS_LOCAL' in environ and environ['IS_LOCAL'] == 'true':
         return
     else:  # pragma: no cover
-        lambda_client = boto3.client('lambda')
-        return lambda_client.invoke(
+        return connections.lambda_client().invoke(
             FunctionName=function_name,
             InvocationType='Event',
             Payload=payload
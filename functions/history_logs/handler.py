@@ -1,11 +1,12 @@
 from botocore.exceptions import ClientError
 from botocore.exceptions import ConnectionError
 from collections import OrderedDict
+import concurrent.futures
 from constants import feature_response_codes
 from constants import odessa_response_codes
 from constants.device_response_codes import *
-from constants.oids import BR_INFO_MAINTENANCE_OID
 from functions import helper
+from helpers import mib_cache
 from helpers import time_functions
 import json
 import logging
@@ -16,13 +17,14 @@ from models.reporting_registration import ReportingRegistration
 from models.service_oid import ServiceOid
 from models.accumulated_device_log import AccumulatedDeviceLog
 from os import environ
-from pymib.mib import MIB
 import re
 import sys
 import traceback
 
 
 QUERY_PARAMS_LIST = ['features', 'from', 'to', 'time_unit']
+DEFAULT_HISTORY_SEGMENTS_MAX_WORKERS = 4
+DEFAULT_HISTORY_QUERIES_MAX_WORKERS = 16
 
 logger = logging.getLogger('get_history_logs')
 logger.setLevel(logging.INFO)
@@ -39,6 +41,7 @@ def get_history_logs(event, context):
     device_email_log = DeviceEmailLog()
     reporting_registration = ReportingRegistration()
     accumulated_device_log = AccumulatedDeviceLog()
+    mib_cache.warm()
 
     missing_params_list = []
 
@@ -229,7 +232,7 @@ def get_history_logs(event, context):
 
         # Find out the corresponding object ids from features
         # Features which do not exist (if any) are also returned
-        object_id_list, unidentified_features = MIB.search_oid(
+        object_id_list, unidentified_features = mib_cache.search_oid(
             original_feature_list)
 
         # Remove Timezone +00:00 value
@@ -241,15 +244,15 @@ def get_history_logs(event, context):
         # 2. Request is using reporting_id (Both BOC and Email devices possible)
         if device_id:
             unsubscribed_features = []
-            device_subscription.read_for_history_logs(
-                device_id, log_service_id)
+            is_existing, subscribed_oids = subscribed_object_ids(
+                device_subscription.get_snapshots(
+                    [device_id], log_service_id)[device_id])
 
             # Filter the object ids which are (or were) subscribed
-            if device_subscription.is_existing():
-                # Check if device subscription record has the field 'oids' which
+            if is_existing:
+                # The device subscription record has the field 'oids' which
                 # means it is subscribed or was subscribed in the past
-                if device_subscription.has_oids_field():
-                    subscribed_oids = device_subscription.get_subscribed_oids()
+                if subscribed_oids is not None:
                     # Check for unsubscribed object ids
                     for key, val in object_id_list.items():
                         if key not in subscribed_oids:
@@ -276,7 +279,7 @@ def get_history_logs(event, context):
                 params.update({'log_pre_from': log_pre_from})
             
             object_ids = list(object_id_list.keys())
-            if time_unit == 'daily' and len(object_ids) == 1 and object_ids[0] == BR_INFO_MAINTENANCE_OID:
+            if accumulated_device_log.covers(object_ids, time_unit):
                 # get history logs from accumulated device logs table
                 result = accumulated_device_log.get_log_history(
                     params, object_id_list, original_feature_list)
@@ -297,70 +300,88 @@ def get_history_logs(event, context):
                         message="Reporting ID Not Found",
                         client_origin=client_origin)
 
-            for record in reporting_records:
-                if (
-                    'from_time_unit' in record and 'to_time_unit' in record
-                        and record['communication_type'] == 'cloud'
-                            and 'device_id' in record):
-                    unsubscribed_features = []
-                    device_id = record['device_id']
-                    device_subscription.read_for_history_logs(
-                        device_id, log_service_id)
-
-                    # Filter the object ids which are (or were) subscribed
-                    if device_subscription.is_existing():
-                        # Check if device subscription record has the field 'oids' which
-                        # means it is subscribed or was subscribed in the past
-                        if device_subscription.has_oids_field():
-                            subscribed_oids = device_subscription.get_subscribed_oids()
-                            # Check for unsubscribed object ids
-                            for key, val in object_id_list.items():
-                                if key not in subscribed_oids:
-                                    unsubscribed_features.extend(val)
-                            object_id_list = {
-                                key: val for key, val in object_id_list.items() if key in subscribed_oids}
-                    else:
-                        # Case of contradiction: Reporting activated but device
-                        # not subscribed/ not been subscribed in the past
-                        logger.error("DB Contradiction Error")
-                        logger.warning(
-                            f"DB Contradiction Error on request = {request_body} "
-                            "Reason: Reporting activated but device not "
-                            "subscribed (currently or in the past)")
-                        return history_logs_response(
-                            odessa_response_codes.DB_CONTRADICTION_ERROR,
-                            reporting_id, client_origin=client_origin)
-
-                    # Erasing duplicates in case of features' type being count_type etc.
-                    unsubscribed_features_list.extend(
-                        list(
-                            OrderedDict.fromkeys(unsubscribed_features)))
-
-                    record['time_unit'] = time_unit
-                    if log_pre_from:
-                        record['log_pre_from'] = log_pre_from
-
-                    object_ids = list(object_id_list.keys())
-                    if time_unit == 'daily'and len(object_ids) == 1 and object_ids[0] == BR_INFO_MAINTENANCE_OID:
+            # Subscriptions of the cloud devices are read at once, then every
+            # registration segment is queried concurrently. The results are
+            # merged in the order of the registrations, i.e. in time order.
+            # The queries of all the segments share one executor, bounded by
+            # HISTORY_QUERIES_MAX_WORKERS.
+            segments = []
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=history_segments_max_workers()) as executor, \
+                    concurrent.futures.ThreadPoolExecutor(
+                        max_workers=history_queries_max_workers()) as query_executor:
+                device_ids = list(OrderedDict.fromkeys(
+                    record['device_id'] for record in reporting_records
+                    if is_cloud_segment(record)))
+                subscriptions = {
+                    device_id: subscribed_object_ids(snapshot)
+                    for device_id, snapshot in device_subscription.get_snapshots(
+                        device_ids, log_service_id).items()}
+
+                for record in reporting_records:
+                    if is_cloud_segment(record):
+                        unsubscribed_features = []
+                        is_existing, subscribed_oids = subscriptions[
+                            record['device_id']]
+
+                        # Filter the object ids which are (or were) subscribed
+                        if is_existing:
+                            # The device subscription record has the field 'oids'
+                            # which means it is subscribed or was subscribed in the past
+                            if subscribed_oids is not None:
+                                # Check for unsubscribed object ids
+                                for key, val in object_id_list.items():
+                                    if key not in subscribed_oids:
+                                        unsubscribed_features.extend(val)
+                                object_id_list = {
+                                    key: val for key, val in object_id_list.items() if key in subscribed_oids}
+                        else:
+                            # Case of contradiction: Reporting activated but device
+                            # not subscribed/ not been subscribed in the past
+                            logger.error("DB Contradiction Error")
+                            logger.warning(
+                                f"DB Contradiction Error on request = {request_body} "
+                                "Reason: Reporting activated but device not "
+                                "subscribed (currently or in the past)")
+                            return history_logs_response(
+                                odessa_response_codes.DB_CONTRADICTION_ERROR,
+                                reporting_id, client_origin=client_origin)
+
+                        # Erasing duplicates in case of features' type being count_type etc.
+                        unsubscribed_features_list.extend(
+                            list(
+                                OrderedDict.fromkeys(unsubscribed_features)))
+
+                        record['time_unit'] = time_unit
+                        if log_pre_from:
+                            record['log_pre_from'] = log_pre_from
+                        segments.append((record, object_id_list))
+                    elif is_email_segment(record):
+                        record['time_unit'] = time_unit
+                        if log_pre_from:
+                            record['log_pre_from'] = log_pre_from
+                        segments.append((record, None))
+
+                futures = []
+                for record, segment_object_id_list in segments:
+                    if segment_object_id_list is None:
+                        futures.append(executor.submit(
+                            device_email_log.get_log_history,
+                            record, original_feature_list, query_executor))
+                    elif accumulated_device_log.covers(
+                            list(segment_object_id_list.keys()), time_unit):
                         # get history logs from accumulated device logs table
-                        result = accumulated_device_log.get_log_history(
-                            record, object_id_list, original_feature_list)
+                        futures.append(executor.submit(
+                            accumulated_device_log.get_log_history,
+                            record, segment_object_id_list, original_feature_list))
                     else:
                         # get history logs from device logs table
-                        result = device_log.get_log_history(
-                            record, object_id_list, original_feature_list)
-                
-                    if result:
-                        feature_response.extend(result)
-                elif (
-                    'from_time_unit' in record and 'to_time_unit' in record
-                        and record['communication_type'] == 'email'
-                            and 'serial_number' in record):
-                    record['time_unit'] = time_unit
-                    if log_pre_from:
-                        record['log_pre_from'] = log_pre_from
-                    result = device_email_log.get_log_history(
-                        record, original_feature_list)
+                        futures.append(executor.submit(
+                            device_log.get_log_history,
+                            record, segment_object_id_list, original_feature_list,
+                            query_executor))
+                for future in futures:
+                    result = future.result()
                     if result:
                         feature_response.extend(result)
 
@@ -397,6 +418,38 @@ def get_history_logs(event, context):
             device_id, client_origin=client_origin)
 
 
+def is_cloud_segment(record):
+    return ('from_time_unit' in record and 'to_time_unit' in record
+            and record['communication_type'] == 'cloud'
+            and 'device_id' in record)
+
+
+def is_email_segment(record):
+    return ('from_time_unit' in record and 'to_time_unit' in record
+            and record['communication_type'] == 'email'
+            and 'serial_number' in record)
+
+
+# Whether the subscription exists, and the object ids it is (or was)
+# subscribed to, None when the record has no 'oids' field
+def subscribed_object_ids(snapshot):
+    if not snapshot.is_existing():
+        return False, None
+    if snapshot.has_oids_field():
+        return True, snapshot.get_subscribed_oids()
+    return True, None
+
+
+def history_segments_max_workers():
+    return int(environ.get(
+        'HISTORY_SEGMENTS_MAX_WORKERS', DEFAULT_HISTORY_SEGMENTS_MAX_WORKERS))
+
+
+def history_queries_max_workers():
+    return int(environ.get(
+        'HISTORY_QUERIES_MAX_WORKERS', DEFAULT_HISTORY_QUERIES_MAX_WORKERS))
+
+
 def create_feature_data(
         feature_list, raw_data, unidentified_features, unsubscribed_features):
     data = []
@@ -0,0 +1,115 @@
+import concurrent.futures
+import json
+import logging
+from functions import helper
+from models import latest_cache
+from models.device_log import DeviceLog
+from models.device_log import latest_logs_max_workers
+from models.device_network_status import DeviceNetworkStatus
+
+logger = logging.getLogger('latest_cache')
+logger.setLevel(logging.INFO)
+
+RECONCILE_ASYNC = 'reconcile_latest_cache'
+RECONCILE_SCAN_COUNT = 500
+# Stop scanning and continue in a new invocation below this remaining time
+RECONCILE_MIN_REMAINING_MILLIS = 60000
+
+
+# Repair the drift between the latest logs and network statuses cached in
+# ElastiCache and DynamoDB. The keyspace is walked with SCAN, {"cursor": n}
+# resumes a previous run. A cached hash is replaced by the latest DynamoDB
+# record, or deleted when there is none, unless it has been updated by the
+# ingestion path in the meantime.
+def reconcile(event, context):
+    logger.info(f'latest_cache: reconcile, {event}')
+    device_log = DeviceLog()
+    device_network_status = DeviceNetworkStatus()
+    elasticache = device_log.elasticache
+    if not elasticache:
+        return {'checked': 0, 'repaired': 0, 'cursor': None}
+
+    cursor = int(event.get('cursor', 0))
+    checked = repaired = 0
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=latest_logs_max_workers()) as executor:
+        while True:
+            cursor, keys = elasticache.scan(
+                cursor, count=RECONCILE_SCAN_COUNT)
+            keys = [key.decode() if isinstance(key, bytes) else key
+                    for key in keys]
+            log_keys = [key for key in keys
+                        if key.startswith(latest_cache.DEVICE_LOG_PREFIX)]
+            status_keys = [
+                key for key in keys
+                if key.startswith(latest_cache.DEVICE_NETWORK_STATUS_PREFIX)]
+            checked += len(log_keys) + len(status_keys)
+            repairs = (
+                log_repairs(device_log, log_keys, executor) +
+                status_repairs(device_network_status, status_keys, executor))
+            repaired += sum(latest_cache.replace_latest(elasticache, repairs))
+
+            if not cursor:
+                logger.info(
+                    f'latest_cache: reconcile done, checked {checked}, '
+                    f'repaired {repaired}')
+                return {'checked': checked, 'repaired': repaired, 'cursor': None}
+
+            if (context and context.get_remaining_time_in_millis() <
+                    RECONCILE_MIN_REMAINING_MILLIS):
+                helper.invoke_async(
+                    RECONCILE_ASYNC, json.dumps({'cursor': cursor}))
+                return {'checked': checked, 'repaired': repaired, 'cursor': cursor}
+
+
+def log_repairs(device_log, keys, executor):
+    cached = read_hashes(device_log, keys)
+    latest = {}
+    log_ids = [key[len(latest_cache.DEVICE_LOG_PREFIX):] for key in cached]
+    device_log.query_latest_logs(log_ids, latest, executor)
+
+    repairs = []
+    for key, log_id in zip(cached, log_ids):
+        expected = latest.get(log_id)
+        if expected:
+            expected = {
+                'id': log_id,
+                'timestamp': expected['timestamp'],
+                'value': expected['value'] if expected['value'] != " " else ''
+            }
+        if differs(cached[key], expected, ['timestamp', 'value']):
+            repairs.append((key, cached[key].get('timestamp'), expected))
+    return repairs
+
+
+def status_repairs(device_network_status, keys, executor):
+    cached = read_hashes(device_network_status, keys)
+    latest = {}
+    device_ids = [
+        key[len(latest_cache.DEVICE_NETWORK_STATUS_PREFIX):] for key in cached]
+    device_network_status.query_latest_statuses(device_ids, latest, executor)
+
+    repairs = []
+    for key, device_id in zip(cached, device_ids):
+        expected = latest.get(device_id)
+        if differs(cached[key], expected, ['timestamp', 'status']):
+            repairs.append((key, cached[key].get('timestamp'), expected))
+    return repairs
+
+
+# Cached hashes in one pipeline, keyed by Redis key
+def read_hashes(model, keys):
+    if not keys:
+        return {}
+    pipe = model.elasticache.pipeline(transaction=False)
+    for key in keys:
+        pipe.hgetall(key)
+    return {
+        key: model.convert(res)
+        for key, res in zip(keys, pipe.execute()) if res}
+
+
+def differs(cached, expected, fields):
+    if not expected:
+        return True
+    return any(cached.get(field) != expected[field] for field in fields)
@@ -1,50 +1,73 @@
 import json
 import logging
-import sys
-from urllib import parse
-from urllib import request
-from urllib.error import HTTPError
-from urllib.error import URLError
+from functions.push_notifications import delivery
+from models.push_notification_retry import PushNotificationRetry
 
 logger = logging.getLogger('send_push_notification:async')
 logger.setLevel(logging.INFO)
 
 
+# Accepts one notification:
+#   {"reporting_id": ..., "object_id": ..., "timestamp": ..., "data": [...],
+#    "notify_url": ...}
+# or the notifications of a stream batch sent to the same destination:
+#   {"events": [{"reporting_id": ..., "object_id": ..., "timestamp": ...,
+#                "data": [...]}, ...],
+#    "notify_url": ...}
 def send_push_notification(event, context):
     logger.info(f'async:send_push_notification, request: {json.dumps(event)}')
+    if 'events' in event:
+        if not isinstance(event['events'], list):
+            logger.warning(f'BadRequest on async:send_push_notification (events "{event["events"]}" invalid.)')
+            return
+        events = [dict(e, notify_url=event.get('notify_url')) for e in event['events']]
+    else:
+        events = [event]
+
+    notifications = [
+        notification for notification in events if is_valid(notification)]
+    results = delivery.deliver([
+        (notification['notify_url'], {
+            'reporting_id': notification['reporting_id'],
+            'object_id': notification['object_id'],
+            'timestamp': notification['timestamp'],
+            'data': notification['data']
+        }) for notification in notifications])
+
+    # Failed deliveries are queued and retried by
+    # push_notifications/retries.drain instead of failing the invocation
+    retries = PushNotificationRetry()
+    for notification, result in zip(notifications, results):
+        notify_url = notification['notify_url']
+        if not isinstance(result, Exception):
+            logger.info(f'async:send_push_notification successfully sent notification to {notify_url}.')
+        elif delivery.is_retryable(result):
+            logger.warning(f'Error on async:send_push_notification to {notify_url} ({result}), queued for retry.')
+            retries.put(
+                notification['reporting_id'], notification['object_id'],
+                notification['timestamp'], notification['data'], notify_url)
+        elif isinstance(result, delivery.DeliveryError):
+            logger.error(f'Error {result.code} on async:send_push_notification to {notify_url}.')
+            logger.error(result.body)
+        else:  # pragma: no cover
+            logger.error(result)
+    logger.info(f'async:send_push_notification, delivery stats: {json.dumps(delivery.stats())}')
+
+
+def is_valid(event):
     if ('reporting_id' not in event or not isinstance(event['reporting_id'], str)):
-        logger.warning('BadRequest on async:send_push_notification (reporting_id "{event["reporting_id"]}" invalid.)')
-        return
+        logger.warning(f'BadRequest on async:send_push_notification (reporting_id "{event.get("reporting_id")}" invalid.)')
+        return False
     if ('object_id' not in event or not isinstance(event['object_id'], str)):
-        logger.warning('BadRequest on async:send_push_notification (object_id "{event["object_id"]}" invalid.)')
-        return
+        logger.warning(f'BadRequest on async:send_push_notification (object_id "{event.get("object_id")}" invalid.)')
+        return False
     if ('data' not in event or not isinstance(event['data'], list)):
-        logger.warning('BadRequest on async:send_push_notification (data "{event["data"]}" invalid.)')
-        return
+        logger.warning(f'BadRequest on async:send_push_notification (data "{event.get("data")}" invalid.)')
+        return False
     if ('timestamp' not in event or not isinstance(event['timestamp'], str)):
-        logger.warning('BadRequest on async:send_push_notification (timestamp "{event["timestamp"]}" invalid.)')
-        return
+        logger.warning(f'BadRequest on async:send_push_notification (timestamp "{event.get("timestamp")}" invalid.)')
+        return False
     if ('notify_url' not in event or not isinstance(event['notify_url'], str)):
-        logger.warning('BadRequest on async:send_push_notification (notify_url "{event["notify_url"]}" invalid.)')
-        return
-    notification_payload = {
-        'reporting_id': event['reporting_id'],
-        'object_id': event['object_id'],
-        'timestamp': event['timestamp'],
-        'data': event['data']
-    }
-    try:
-        data = parse.urlencode(notification_payload).encode('ascii')
-        request.urlopen(event['notify_url'], data)
-        logger.info(f'async:send_push_notification successfully sent notification to {event["notify_url"]}.')
-    except HTTPError as e:
-        if e.code not in range(400, 499):
-            raise
-        else:
-            logger.error(f'Error {e.code} on async:send_push_notification to {event["notify_url"]}.')
-            logger.error(e.read())
-    except URLError as e:
-        logger.error(f'Error on async:send_push_notification to {event["notify_url"]}.')
-        logger.error(e.read())
-    except:  # pragma: no cover
-        logger.error(sys.exc_info())
+        logger.warning(f'BadRequest on async:send_push_notification (notify_url "{event.get("notify_url")}" invalid.)')
+        return False
+    return True
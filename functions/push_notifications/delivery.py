@@ -0,0 +1,268 @@
+import concurrent.futures
+import http.client
+import threading
+import time
+from os import environ
+from urllib import parse
+from urllib import request
+
+# Delivery of push notifications over persistent HTTP(S) connections.
+# Idle connections are kept per notify_url host and reused across warm
+# invocations. The number of requests in flight to the same host is capped,
+# and hosts share a separately sized pool of delivery threads.
+# The http_proxy/https_proxy/no_proxy settings are honoured, redirects are
+# not followed and count as failed deliveries.
+
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 10
+DEFAULT_MAX_WORKERS = 32
+DEFAULT_TIMEOUT_SECONDS = 10
+CONTENT_TYPE = 'application/x-www-form-urlencoded'
+
+_lock = threading.Lock()
+_pools = {}
+
+
+class DeliveryError(Exception):
+    def __init__(self, url, status, body):
+        Exception.__init__(self, f'{status} from {url}')
+        self.url = url
+        self.code = status
+        self.body = body
+
+
+class HostConnectionPool(object):
+    def __init__(self, scheme, host, port, max_connections, timeout,
+                 proxy=None):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        # (host, port) of the proxy, if any
+        self.proxy = proxy
+        self.slots = threading.BoundedSemaphore(max_connections)
+        self.idle = []
+        self.lock = threading.Lock()
+        self.deliveries = 0
+        self.failures = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.connections_opened = 0
+
+    # POST the body to the path, returns (status, response body)
+    def post(self, path, body):
+        with self.slots:
+            start = time.perf_counter()
+            try:
+                status, response = self.request(path, body)
+            except Exception:
+                self.record(time.perf_counter() - start, False)
+                raise
+            self.record(time.perf_counter() - start, status < 300)
+            return status, response
+
+    def request(self, path, body):
+        connection, reused = self.acquire()
+        try:
+            status, response = self.send(connection, path, body)
+        except (http.client.HTTPException, ConnectionError):
+            connection.close()
+            if not reused:
+                raise
+            # The server closed the idle connection, retry on a new one
+            connection = self.new_connection()
+            try:
+                status, response = self.send(connection, path, body)
+            except Exception:
+                connection.close()
+                raise
+        except Exception:
+            connection.close()
+            raise
+        self.release(connection)
+        return status, response
+
+    def send(self, connection, path, body):
+        # A plain http proxy is sent the absolute url
+        if self.proxy and self.scheme == 'http':
+            path = f'http://{self.host}:{self.port}{path}'
+        connection.request(
+            'POST', path, body=body,
+            headers={'Content-Type': CONTENT_TYPE, 'Connection': 'keep-alive'})
+        response = connection.getresponse()
+        data = response.read()
+        if response.will_close:
+            connection.close()
+        return response.status, data
+
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), True
+        return self.new_connection(), False
+
+    def release(self, connection):
+        # A closed connection has no socket and is not kept
+        if connection.sock is None:
+            return
+        with self.lock:
+            self.idle.append(connection)
+
+    def new_connection(self):
+        with self.lock:
+            self.connections_opened += 1
+        host, port = self.proxy or (self.host, self.port)
+        if self.scheme == 'https':
+            connection = http.client.HTTPSConnection(
+                host, port, timeout=self.timeout)
+            if self.proxy:
+                # https goes through a CONNECT tunnel of the proxy
+                connection.set_tunnel(self.host, self.port)
+            return connection
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def record(self, latency, success):
+        with self.lock:
+            if success:
+                self.deliveries += 1
+            else:
+                self.failures += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def stats(self):
+        with self.lock:
+            requests = self.deliveries + self.failures
+            return {
+                'deliveries': self.deliveries,
+                'failures': self.failures,
+                'average_latency': self.total_latency / requests if requests else 0.0,
+                'max_latency': self.max_latency,
+                'connections_opened': self.connections_opened,
+                'idle_connections': len(self.idle)
+            }
+
+    def close(self):
+        with self.lock:
+            for connection in self.idle:
+                connection.close()
+            self.idle = []
+
+
+def pool_for(url):
+    parsed = parse.urlsplit(url)
+    scheme = parsed.scheme or 'http'
+    port = parsed.port or (443 if scheme == 'https' else 80)
+    proxy = proxy_for(scheme, parsed.hostname)
+    key = (scheme, parsed.hostname, port, proxy)
+    with _lock:
+        if key not in _pools:
+            _pools[key] = HostConnectionPool(
+                scheme, parsed.hostname, port,
+                max_connections_per_host(), timeout(), proxy)
+        return _pools[key]
+
+
+# (host, port) of the proxy of the environment for the scheme and host,
+# None for a direct connection
+def proxy_for(scheme, host):
+    proxy = request.getproxies().get(scheme)
+    if not proxy or request.proxy_bypass(host):
+        return None
+    if '://' not in proxy:
+        proxy = 'http://' + proxy
+    parsed = parse.urlsplit(proxy)
+    return parsed.hostname, parsed.port or 80
+
+
+# POST the url encoded payload to the url, raises DeliveryError on a HTTP
+# redirect or error status and OSError when the destination cannot be
+# reached
+def post(url, payload):
+    parsed = parse.urlsplit(url)
+    path = parsed.path or '/'
+    if parsed.query:
+        path += '?' + parsed.query
+    status, body = pool_for(url).post(
+        path, parse.urlencode(payload).encode('ascii'))
+    if status >= 300:
+        raise DeliveryError(url, status, body)
+    return status
+
+
+# Deliver several (url, payload) concurrently. Returns the result of each
+# delivery in order, either the HTTP status or the exception raised.
+# The deliveries to a host are split into at most max_connections_per_host
+# lanes sent one after the other, so a slow host only holds the threads of
+# its own lanes and never blocks the deliveries to other hosts.
+def deliver(deliveries, max_workers=None):
+    if len(deliveries) == 1:
+        return [_try_post(*deliveries[0])]
+    lanes_per_host = max_connections_per_host()
+    indexes = {}
+    for i, (url, _) in enumerate(deliveries):
+        indexes.setdefault(parse.urlsplit(url)[:2], []).append(i)
+    # Lanes of the different hosts are interleaved
+    lanes = [
+        host_indexes[lane::lanes_per_host]
+        for lane in range(lanes_per_host)
+        for host_indexes in indexes.values()
+        if host_indexes[lane::lanes_per_host]]
+
+    results = [None] * len(deliveries)
+
+    def send(lane):
+        for i in lane:
+            results[i] = _try_post(*deliveries[i])
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers or delivery_max_workers()) as executor:
+        for future in [executor.submit(send, lane) for lane in lanes]:
+            future.result()
+    return results
+
+
+# Server errors and unreachable destinations may succeed later, redirects
+# and client errors will not
+def is_retryable(error):
+    if isinstance(error, DeliveryError):
+        return error.code not in range(300, 499)
+    return isinstance(error, OSError)
+
+
+def _try_post(url, payload):
+    try:
+        return post(url, payload)
+    except Exception as e:
+        return e
+
+
+# Latency and failure counters of every destination host
+def stats():
+    with _lock:
+        pools = dict(_pools)
+    return {
+        f'{scheme}://{host}:{port}': pool.stats()
+        for (scheme, host, port, _), pool in pools.items()}
+
+
+def reset():
+    with _lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+def max_connections_per_host():
+    return int(environ.get(
+        'PUSH_NOTIFICATION_MAX_CONNECTIONS_PER_HOST',
+        DEFAULT_MAX_CONNECTIONS_PER_HOST))
+
+
+def delivery_max_workers():
+    return int(environ.get(
+        'PUSH_NOTIFICATION_MAX_WORKERS', DEFAULT_MAX_WORKERS))
+
+
+def timeout():
+    return float(environ.get(
+        'PUSH_NOTIFICATION_TIMEOUT', DEFAULT_TIMEOUT_SECONDS))
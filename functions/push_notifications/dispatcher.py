@@ -0,0 +1,52 @@
+import json
+from functions import helper
+
+SEND_PUSH_NOTIFICATION_ASYNC = 'send_push_notification'
+# Asynchronous invocations accept payloads of up to 256KB
+MAX_PAYLOAD_SIZE = 250 * 1024
+
+
+# Gather the push notifications of a whole stream batch and send them with
+# one send_push_notification invocation per notify_url:
+# {"events": [{"reporting_id": ..., "object_id": ..., "timestamp": ...,
+#              "data": [...]}, ...],
+#  "notify_url": ...}
+class PushNotificationDispatcher(object):
+    def __init__(self):
+        self.events = {}
+
+    def add(self, reporting_id, object_id, timestamp, data, notify_url):
+        # Count type notifications carry a single feature
+        if isinstance(data, dict):
+            data = [data]
+        self.events.setdefault(notify_url, []).append({
+            'reporting_id': reporting_id,
+            'object_id': object_id,
+            'timestamp': timestamp,
+            'data': data
+        })
+
+    def dispatch(self):
+        for notify_url, events in self.events.items():
+            for chunk in chunk_events(events, notify_url):
+                helper.invoke_async(
+                    SEND_PUSH_NOTIFICATION_ASYNC,
+                    json.dumps({'events': chunk, 'notify_url': notify_url}))
+        self.events = {}
+
+
+# Split the events of a destination so that every payload fits in one
+# asynchronous invocation
+def chunk_events(events, notify_url):
+    chunk = []
+    size = len(json.dumps({'events': [], 'notify_url': notify_url}))
+    for event in events:
+        event_size = len(json.dumps(event)) + 2
+        if chunk and size + event_size > MAX_PAYLOAD_SIZE:
+            yield chunk
+            chunk = []
+            size = len(json.dumps({'events': [], 'notify_url': notify_url}))
+        chunk.append(event)
+        size += event_size
+    if chunk:
+        yield chunk
@@ -0,0 +1,64 @@
+import logging
+from os import environ
+from functions.push_notifications import delivery
+from models import push_notification_retry
+from models.device_status import DeviceStatus
+from models.push_notification_retry import PushNotificationRetry
+
+logger = logging.getLogger('push_notifications:retries')
+logger.setLevel(logging.INFO)
+
+DEFAULT_RETRIES_PER_RUN = 100
+
+
+# Scheduled: deliver the queued push notifications whose next attempt is due,
+# up to PUSH_NOTIFICATION_RETRIES_PER_RUN per run. Every notification is
+# claimed before it is sent so overlapping runs do not deliver it twice.
+# Only the latest value of each feature is queued, and features whose status
+# has been notified again since are not sent.
+def drain(event, context):
+    retries = PushNotificationRetry()
+    items = [
+        item for item in retries.get_due(retries_per_run())
+        if retries.claim(item)]
+    logger.info(f'push_notifications:retries, {len(items)} due notifications')
+
+    statuses = DeviceStatus().batch_read(
+        [(item['reporting_id'], item['object_id']) for item in items])
+    pending = []
+    superseded = 0
+    for item in items:
+        features = push_notification_retry.pending_features(
+            item, statuses.get((item['reporting_id'], item['object_id'])))
+        if features:
+            pending.append((item, features))
+        else:
+            retries.delete(item)
+            superseded += 1
+
+    results = delivery.deliver([
+        (item['notify_url'], push_notification_retry.notification(item, features))
+        for item, features in pending])
+
+    delivered = rescheduled = dropped = 0
+    for (item, _), result in zip(pending, results):
+        if not isinstance(result, Exception):
+            retries.delete(item)
+            delivered += 1
+        elif delivery.is_retryable(result):
+            retries.reschedule(item)
+            rescheduled += 1
+        else:
+            logger.error(f'Error on push_notifications:retries to {item["notify_url"]}: {result}')
+            retries.delete(item)
+            dropped += 1
+
+    logger.info(f'push_notifications:retries, delivery stats: {delivery.stats()}')
+    return {
+        'delivered': delivered, 'rescheduled': rescheduled,
+        'dropped': dropped, 'superseded': superseded}
+
+
+def retries_per_run():
+    return int(environ.get(
+        'PUSH_NOTIFICATION_RETRIES_PER_RUN', DEFAULT_RETRIES_PER_RUN))
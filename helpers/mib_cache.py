@@ -0,0 +1,100 @@
+import copy
+import logging
+import threading
+import time
+from functools import lru_cache
+from models.service_oid import ServiceOid
+from pymib.mib import MIB
+from pymib.oid import OID
+
+# Process wide cache of the MIB metadata used on hot paths.
+# OID objects and everything derived from them only depend on the MIB shipped
+# with pymib, so they are computed once per (warm) Lambda container.
+
+MAX_CACHED_OIDS = 4096
+MAX_CACHED_SEARCHES = 1024
+# A failed warm up is not attempted again before this delay
+WARM_RETRY_SECONDS = 300
+
+logger = logging.getLogger('mib_cache')
+logger.setLevel(logging.INFO)
+
+_lock = threading.Lock()
+_warmed = False
+_retry_at = 0
+
+
+@lru_cache(maxsize=MAX_CACHED_OIDS)
+def oid(object_id):
+    return OID(object_id)
+
+
+def oid_type(object_id):
+    return oid(object_id).type
+
+
+# Exceptions are not cached, an OID without pair raises on every call
+@lru_cache(maxsize=MAX_CACHED_OIDS)
+def pair_oid(object_id):
+    return oid(object_id).pair_oid
+
+
+# 1 based position of every count_type_id in the id_map of a count type OID
+@lru_cache(maxsize=MAX_CACHED_OIDS)
+def count_type_index(object_id):
+    return {
+        count_type_id: i + 1
+        for i, count_type_id in enumerate(oid(object_id).id_map.keys())}
+
+
+@lru_cache(maxsize=MAX_CACHED_SEARCHES)
+def _search_oid(features):
+    return MIB.search_oid(list(features))
+
+
+# Same as MIB.search_oid, the result is a copy callers are free to modify
+def search_oid(features):
+    oids, missings = _search_oid(tuple(features))
+    return copy.deepcopy(oids), list(missings)
+
+
+# Precompute the metadata of every OID of every log service
+def warm():
+    global _warmed, _retry_at
+    if _warmed or time.monotonic() < _retry_at:
+        return
+    with _lock:
+        if _warmed or time.monotonic() < _retry_at:
+            return
+        try:
+            object_ids = set()
+            for log_service_id in ServiceOid.ids() or []:
+                service_oid = ServiceOid().read(log_service_id)
+                object_ids.update((service_oid or {}).get('oids', []))
+        except Exception as e:
+            # Metadata is then computed on first use, the invocations until
+            # the retry delay do not scan again
+            logger.warning(f'MIB cache not warmed: {e}')
+            _retry_at = time.monotonic() + WARM_RETRY_SECONDS
+            return
+        for object_id in object_ids:
+            try:
+                if oid_type(object_id) == 'count_type':
+                    count_type_index(object_id)
+                if oid_type(object_id) in ['count_type', 'counter']:
+                    pair_oid(object_id)
+            except Exception:
+                logger.warning(f'no MIB metadata for object_id {object_id}')
+        _warmed = True
+
+
+def clear():
+    global _warmed, _retry_at
+    with _lock:
+        oid.cache_clear()
+        pair_oid.cache_clear()
+        count_type_index.cache_clear()
+        _search_oid.cache_clear()
+        _warmed = False
+        _retry_at = 0
+_retry_at = 0
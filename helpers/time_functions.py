@@ -1,3 +1,4 @@
+import bisect
 from calendar import monthrange
 from datetime import datetime
 from datetime import timedelta
@@ -44,6 +45,62 @@ def break_time_period(from_time, to_time, time_unit):
 
     return time_periods
 
+# Half-open [start, end) bounds, as timestamp strings, of the time periods
+# returned by break_time_period
+
+
+def period_bounds(time_periods):
+    return [(unparse_time(period['start_time']),
+             unparse_time(period['end_time'] + timedelta(seconds=1)))
+            for period in time_periods]
+
+# Half-open one hour [start, end) bounds, as timestamp strings, from
+# start_time up to end_time. Hours are counted from start_time and the last
+# bound ends right after end_time, as in period_bounds.
+
+
+def hourly_bounds(start_time, end_time):
+    bounds = []
+    while start_time <= end_time:
+        end_unit = min(start_time + timedelta(hours=1),
+                       end_time + timedelta(seconds=1))
+        bounds.append((unparse_time(start_time), unparse_time(end_unit)))
+        start_time = end_unit
+    return bounds
+
+# Returns the latest record of each interval (None for empty intervals).
+# Timestamps are compared as strings, so records and bounds are bucketed in
+# one linear pass without parsing any timestamp.
+# For example: If bounds = [('2017-01-01T00:00:00', '2017-01-02T00:00:00')] and
+# records have timestamps 2017-01-01T03:00:00 and 2017-01-01T05:00:00,
+# the response is the record at 2017-01-01T05:00:00
+
+
+def latest_per_interval(records, bounds):
+    latest = [None] * len(bounds)
+    i = 0
+    for record in sorted(records, key=lambda record: record['timestamp']):
+        timestamp = record['timestamp']
+        while i < len(bounds) and timestamp >= bounds[i][1]:
+            i += 1
+        if i == len(bounds):
+            break
+        if timestamp >= bounds[i][0]:
+            latest[i] = record
+    return latest
+
+# Same as latest_per_interval for timestamps already sorted in ascending
+# order, returns the index of the latest timestamp of each interval (None
+# for empty intervals). Each interval is found by binary search.
+
+
+def latest_index_per_interval(timestamps, bounds):
+    latest = []
+    for start, end in bounds:
+        i = bisect.bisect_left(timestamps, end) - 1
+        latest.append(i if i >= 0 and timestamps[i] >= start else None)
+    return latest
+
 # Returns the end time for time periods
 # For example: If date_time = 2017-01-01 22:10:45 and time_unit = HOURLY,
 # end_time = 2017-01-01 22:59:59
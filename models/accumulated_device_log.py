@@ -1,111 +1,246 @@
 import logging
 from models.base import Base
 from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from os import environ
 from pymib.parse import parse
 from helpers import time_functions
+from constants.oids import BR_INFO_MAINTENANCE_OID
 from constants.oids import CHARSET_OID
 from models.device_log import DeviceLog
 
 logger = logging.getLogger('accumulated_device_logs')
 logger.setLevel(logging.INFO)
 
+# The logs of a month are stored in chunks: 'YYYY-MM', then 'YYYY-MM#001',
+# 'YYYY-MM#002'... A new chunk is started well before DynamoDB's 400KB
+# item size limit is reached.
+CHUNK_SIZE_LIMIT = 350 * 1024
+MAX_PUT_ATTEMPTS = 5
+
 class AccumulatedDeviceLog(Base):
     def __init__(self):
         super().__init__()
         self.table = self.dynamodb.Table('accumulated_device_logs')
-    
+
+    # Whether the history of the object ids can be served from the
+    # accumulated logs
+    def covers(self, object_ids, time_unit):
+        return (
+            time_unit == time_functions.DAILY and
+            bool(object_ids) and
+            set(object_ids) <= set(accumulated_log_oids()))
+
     def get_log_history(self, params, object_id_list, original_feature_list):
         device_id = params['device_id']
         from_time = params['from_time_unit']
         to_time = params['to_time_unit']
         device_log = DeviceLog()
+        logs_parsed = []
 
         # Get the charset record of the device from the Database
         charset = device_log.get_charset(device_id)
 
         for object_id in object_id_list.keys():
             logs_pre_parse = []
-            logs_parsed = []
-
-            # dynamodb query
-            db_res = self.table.query(
-                KeyConditionExpression=Key('id').eq(device_id + '#' + object_id) &
-                Key('year_month').between(
-                    from_time[0:7], to_time[0:7]),
-                )
-            # create data in order to parse value
-            if db_res['Items']:
-                for res in db_res['Items']:
-                    if res['accumulated_log']:
-                        for log in res['accumulated_log']:
-                            # pick up data between from_time to to_time
-                            if res['year_month'] == from_time[0:7] or res['year_month'] == to_time[0:7]:
-                                if log['timestamp'] < from_time or to_time < log['timestamp']:
-                                    continue
-                            logs_pre_parse.append({
-                                object_id: {
-                                    'id': device_id + '#' + object_id,
-                                    'value': log['value'],
-                                    'timestamp': (log['timestamp'])
-                                }
-                            })
-            
+
+            # Latest log of every day between from_time and to_time
+            logs = self.get_daily_logs(
+                device_id, object_id, from_time[0:7], to_time[0:7])
+            for log in logs:
+                if log['timestamp'] < from_time or to_time < log['timestamp']:
+                    continue
+                logs_pre_parse.append({
+                    object_id: {
+                        'id': device_id + '#' + object_id,
+                        'value': log['value'],
+                        'timestamp': (log['timestamp'])
+                    }
+                })
+
             # parse data
-            if logs_pre_parse:
-                for log in logs_pre_parse:
-                    if charset:
-                        log.update({CHARSET_OID: charset})
-                    log_parsed = parse(log)
-                    if log_parsed:
-                        # Filter the features which are in the original list
-                        log_parsed[object_id]['value'] = {
-                            key: val for key, val in log_parsed[object_id]['value'].items() if key in original_feature_list
-                            }
-                        # rename key
-                        log_parsed[object_id]['features'] = log_parsed[object_id].pop('value')
-                    
-                    logs_parsed.append(log_parsed[object_id])
+            for log in logs_pre_parse:
+                if charset:
+                    log.update({CHARSET_OID: charset})
+                log_parsed = parse(log)
+                if log_parsed:
+                    # Filter the features which are in the original list
+                    log_parsed[object_id]['value'] = {
+                        key: val for key, val in log_parsed[object_id]['value'].items() if key in original_feature_list
+                        }
+                    # rename key
+                    log_parsed[object_id]['features'] = log_parsed[object_id].pop('value')
+
+                logs_parsed.append(log_parsed[object_id])
 
         return logs_parsed
 
-    def read(self, device_id, object_id, timestamp):
-        ddb_res = self.table.get_item(
-            Key={
-                'id': f"{device_id}#{object_id}",
-                'year_month': timestamp[0:7]
-                }
-        )
-        if 'Item' in ddb_res:
-            self.device_id = device_id
-            self.object_id = object_id
-            self.year_month = ddb_res['Item']['year_month']
-            self.accumulated_log = ddb_res['Item']['accumulated_log']
-        else:
-            return None
+    # Retrieve the latest log of each day between two months,
+    # in chronological order
+    def get_daily_logs(self, device_id, object_id, from_month, to_month):
+        key_condition = Key('id').eq(device_id + '#' + object_id) & Key(
+            'year_month').between(from_month, to_month + '#~')
+        response = self.table.query(KeyConditionExpression=key_condition)
+        items = response['Items']
+        while 'LastEvaluatedKey' in response:
+            response = self.table.query(
+                KeyConditionExpression=key_condition,
+                ExclusiveStartKey=response['LastEvaluatedKey'])
+            items.extend(response['Items'])
 
-        return self
+        # Logs may arrive out of order, keep the latest one of each day
+        latest = {}
+        for item in items:
+            for log in item.get('accumulated_log', []):
+                date = log['timestamp'][0:10]
+                if date not in latest or latest[date]['timestamp'] < log['timestamp']:
+                    latest[date] = log
+        return [latest[date] for date in sorted(latest)]
 
-    def insert(self, device_id, object_id, timestamp, rawdata):
+    # Keep the log as the latest one of its day, using conditional updates
+    # on the current chunk of the month instead of rewriting the whole month
+    def put(self, device_id, object_id, timestamp, rawdata):
+        log_id = f"{device_id}#{object_id}"
+        log = {'value': rawdata, 'timestamp': timestamp}
+        for attempt in range(MAX_PUT_ATTEMPTS):
+            try:
+                chunk = self.get_latest_chunk(log_id, timestamp[0:7])
+                if not chunk:
+                    self.insert_chunk(log_id, timestamp[0:7], log)
+                elif 'log_count' not in chunk:
+                    # Chunk written before chunking, index it first
+                    self.index_chunk(log_id, chunk['year_month'])
+                    continue
+                elif chunk['last_timestamp'][0:10] == timestamp[0:10]:
+                    if chunk['last_timestamp'] < timestamp:
+                        self.replace_last_log(log_id, chunk, log)
+                elif chunk['log_size'] + log_size(log) > CHUNK_SIZE_LIMIT:
+                    self.insert_chunk(
+                        log_id, next_chunk(chunk['year_month']), log)
+                else:
+                    self.append_log(log_id, chunk, log)
+                return
+            except ClientError as e:
+                # Concurrent write on the same chunk, read it again
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+        logger.warning(
+            f'accumulated log of {log_id} at {timestamp} not saved '
+            f'after {MAX_PUT_ATTEMPTS} attempts')
+
+    def get_latest_chunk(self, log_id, year_month):
+        res = self.table.query(
+            KeyConditionExpression=Key('id').eq(log_id) &
+            Key('year_month').begins_with(year_month),
+            ProjectionExpression=(
+                'year_month, log_count, last_index, last_timestamp, '
+                'log_size, last_size'),
+            ScanIndexForward=False,
+            Limit=1
+        )
+        if res['Items']:
+            return res['Items'][0]
+
+    def insert_chunk(self, log_id, year_month, log):
         self.table.put_item(
-            Item = {
-                'id' : f"{device_id}#{object_id}",
-                'year_month' : timestamp[0:7],
-                'accumulated_log' : [{'value': rawdata, 'timestamp': timestamp}]
+            Item={
+                'id': log_id,
+                'year_month': year_month,
+                'accumulated_log': [log],
+                'log_count': 1,
+                'last_index': 0,
+                'last_timestamp': log['timestamp'],
+                'log_size': log_size(log),
+                'last_size': log_size(log)
+            },
+            ConditionExpression='attribute_not_exists(id)'
+        )
+
+    # Replace the latest log, which is of the same day. The chunk size
+    # changes by the size difference of the two logs.
+    def replace_last_log(self, log_id, chunk, log):
+        size = log_size(log)
+        self.table.update_item(
+            Key={'id': log_id, 'year_month': chunk['year_month']},
+            ExpressionAttributeNames={'#a': 'accumulated_log'},
+            UpdateExpression=(
+                f"set #a[{int(chunk['last_index'])}] = :log, "
+                "last_timestamp = :ts, log_size = log_size + :delta, "
+                "last_size = :size"),
+            ConditionExpression='log_count = :count AND last_timestamp = :last',
+            ExpressionAttributeValues={
+                ':log': log,
+                ':ts': log['timestamp'],
+                ':delta': size - chunk['last_size'],
+                ':size': size,
+                ':count': chunk['log_count'],
+                ':last': chunk['last_timestamp']
             }
         )
-    
-    def update(self, accumulated_log):
+
+    def append_log(self, log_id, chunk, log):
+        update_expression = (
+            'set #a = list_append(#a, :logs), log_count = log_count + :one, '
+            'log_size = log_size + :size')
+        values = {
+            ':logs': [log],
+            ':one': 1,
+            ':size': log_size(log),
+            ':count': chunk['log_count']
+        }
+        # A log of an earlier day arriving late does not become the last one
+        if chunk['last_timestamp'] < log['timestamp']:
+            update_expression += (
+                ', last_index = :count, last_timestamp = :ts, '
+                'last_size = :size')
+            values[':ts'] = log['timestamp']
         self.table.update_item(
-            Key={
-                'id': f"{self.device_id}#{self.object_id}",
-                'year_month': self.year_month
-            },
+            Key={'id': log_id, 'year_month': chunk['year_month']},
             ExpressionAttributeNames={'#a': 'accumulated_log'},
-            UpdateExpression="set #a = :a",
+            UpdateExpression=update_expression,
+            ConditionExpression='log_count = :count',
+            ExpressionAttributeValues=values
+        )
+
+    def index_chunk(self, log_id, year_month):
+        logs = self.table.get_item(
+            Key={'id': log_id, 'year_month': year_month}
+        )['Item'].get('accumulated_log', [])
+        last_index = max(
+            range(len(logs)), key=lambda i: logs[i]['timestamp'], default=0)
+        self.table.update_item(
+            Key={'id': log_id, 'year_month': year_month},
+            UpdateExpression=(
+                'set log_count = :count, last_index = :index, '
+                'last_timestamp = :ts, log_size = :size, '
+                'last_size = :last_size'),
+            ConditionExpression='attribute_not_exists(log_count)',
             ExpressionAttributeValues={
-                ':a': accumulated_log,
+                ':count': len(logs),
+                ':index': last_index,
+                ':ts': logs[last_index]['timestamp'] if logs else '',
+                ':size': sum(log_size(log) for log in logs),
+                ':last_size': log_size(logs[last_index]) if logs else 0
             }
         )
 
-    def is_existing(self):
-        return hasattr(self, 'device_id')
\ No newline at end of file
+
+# Object ids whose daily logs are accumulated, comma separated in
+# ACCUMULATED_LOG_OIDS
+def accumulated_log_oids():
+    return [
+        oid.strip() for oid in environ.get(
+            'ACCUMULATED_LOG_OIDS', BR_INFO_MAINTENANCE_OID).split(',')
+        if oid.strip()]
+
+
+def next_chunk(year_month):
+    month, _, chunk = year_month.partition('#')
+    return f'{month}#{int(chunk or 0) + 1:03d}'
+
+
+# Approximate stored size of a log entry in bytes, strings are stored as
+# UTF-8
+def log_size(log):
+    return (len(log['value'].encode('utf-8')) +
+            len(log['timestamp'].encode('utf-8')) + 20)
@@ -1,23 +1,38 @@
-import boto3
-import redis
 import datetime
-from os import environ
+import time
+from models import connections
+
+BATCH_GET_ITEM_LIMIT = 100
+BATCH_GET_BACKOFF_SECONDS = 0.05
+BATCH_GET_MAX_BACKOFF_SECONDS = 1.6
 
 
 class Base(object):
     def __init__(self):
-        if environ['DYNAMO_ENDPOINT_URL']:
-            environ['http_proxy'] = environ['PROXY']
-            self.dynamodb = boto3.resource(
-                'dynamodb', endpoint_url=environ['DYNAMO_ENDPOINT_URL'])
-        else:  # pragma: no cover
-            self.dynamodb = boto3.resource('dynamodb')
+        # Clients are shared across models and warm invocations
+        self.dynamodb = connections.dynamodb_resource()
+        self.elasticache = connections.redis_client()
 
-        if environ['REDIS_ENDPOINT_URL']:
-            self.elasticache = redis.StrictRedis(
-                host=environ['REDIS_ENDPOINT_URL'], port=6379)
-        else:
-            self.elasticache = None
+    # Retrieve items by primary key with BatchGetItem (100 keys per request).
+    # Unprocessed keys are retried with exponential backoff.
+    def batch_get_items(self, table_name, keys, **options):
+        items = []
+        unique_keys = list(
+            {tuple(sorted(key.items())): key for key in keys}.values())
+        for i in range(0, len(unique_keys), BATCH_GET_ITEM_LIMIT):
+            request = dict(options)
+            request['Keys'] = unique_keys[i:i + BATCH_GET_ITEM_LIMIT]
+            request_items = {table_name: request}
+            backoff = BATCH_GET_BACKOFF_SECONDS
+            while request_items:
+                response = self.dynamodb.batch_get_item(
+                    RequestItems=request_items)
+                items.extend(response['Responses'].get(table_name, []))
+                request_items = response.get('UnprocessedKeys')
+                if request_items:
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, BATCH_GET_MAX_BACKOFF_SECONDS)
+        return items
 
     def convert(self, data):
         if isinstance(data, bytes):
@@ -1,3 +1,4 @@
+import concurrent.futures
 from boto3.dynamodb.conditions import Key
 from models.base import Base
 
@@ -19,5 +20,21 @@ class CloudDevice(Base):
             self.device_id = result['Items'][0]['device_id']
             self.log_service_id = result['Items'][0]['log_service_id']
 
+    # Read the registrations of several devices, the cloud_devices index is
+    # queried concurrently. Returns a CloudDevice per registered device.
+    def batch_read(self, device_ids):
+        cloud_devices = {}
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            futures = {}
+            for device_id in set(device_ids):
+                cloud_device = CloudDevice()
+                futures[executor.submit(cloud_device.read, device_id)] = cloud_device
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+                cloud_device = futures[future]
+                if cloud_device.is_existing():
+                    cloud_devices[cloud_device.device_id] = cloud_device
+        return cloud_devices
+
     def is_existing(self):
         return hasattr(self, 'reporting_id')
@@ -0,0 +1,104 @@
+import threading
+import boto3
+import redis
+from botocore.client import Config
+from os import environ
+
+# Process wide registry of DynamoDB, Redis, Lambda and S3 clients.
+# Clients are built lazily on first use and then shared by every model for
+# the lifetime of the (warm) Lambda container.
+
+DEFAULT_DYNAMO_MAX_POOL_CONNECTIONS = 50
+DEFAULT_REDIS_MAX_CONNECTIONS = 50
+REDIS_PORT = 6379
+
+_lock = threading.RLock()
+_dynamodb = None
+_redis_pool = None
+_elasticache = None
+_lambda = None
+_s3 = {}
+
+
+def dynamodb_resource():
+    global _dynamodb
+    if _dynamodb is None:
+        with _lock:
+            if _dynamodb is None:
+                _dynamodb = _create_dynamodb_resource()
+    return _dynamodb
+
+
+def dynamodb_client():
+    # Low level client sharing the connection pool of the resource
+    return dynamodb_resource().meta.client
+
+
+def redis_client():
+    global _redis_pool, _elasticache
+    if not environ['REDIS_ENDPOINT_URL']:
+        return None
+    if _elasticache is None:
+        with _lock:
+            if _elasticache is None:
+                _redis_pool = redis.ConnectionPool(
+                    host=environ['REDIS_ENDPOINT_URL'], port=REDIS_PORT,
+                    max_connections=int(environ.get(
+                        'REDIS_MAX_CONNECTIONS',
+                        DEFAULT_REDIS_MAX_CONNECTIONS)))
+                _elasticache = redis.StrictRedis(connection_pool=_redis_pool)
+    return _elasticache
+
+
+def lambda_client():
+    global _lambda
+    if _lambda is None:
+        with _lock:
+            if _lambda is None:
+                _lambda = boto3.client('lambda')
+    return _lambda
+
+
+def s3_resource(region_name=None):
+    # One resource per region, mails are stored in the region of their topic
+    if region_name not in _s3:
+        with _lock:
+            if region_name not in _s3:
+                _s3[region_name] = _create_s3_resource(region_name)
+    return _s3[region_name]
+
+
+# Drop every cached client, e.g. when the endpoints have been changed by tests
+def reset():
+    global _dynamodb, _redis_pool, _elasticache, _lambda
+    with _lock:
+        if _redis_pool is not None:
+            _redis_pool.disconnect()
+        _dynamodb = None
+        _redis_pool = None
+        _elasticache = None
+        _lambda = None
+        _s3.clear()
+
+
+def _create_dynamodb_resource():
+    config = Config(max_pool_connections=int(environ.get(
+        'DYNAMO_MAX_POOL_CONNECTIONS', DEFAULT_DYNAMO_MAX_POOL_CONNECTIONS)))
+    if environ['DYNAMO_ENDPOINT_URL']:
+        environ['http_proxy'] = environ['PROXY']
+        return boto3.resource(
+            'dynamodb', endpoint_url=environ['DYNAMO_ENDPOINT_URL'],
+            config=config)
+    else:  # pragma: no cover
+        return boto3.resource('dynamodb', config=config)
+
+
+def _create_s3_resource(region_name):
+    if environ['S3_ENDPOINT_URL']:
+        return boto3.resource(
+            's3', endpoint_url=environ['S3_ENDPOINT_URL'],
+            aws_access_key_id=environ['S3_ACCESS_KEY'],
+            aws_secret_access_key=environ['S3_SECRET_KEY'],
+            config=Config(signature_version='s3v4'))
+    else:  # pragma: no cover
+        return boto3.resource('s3', region_name=region_name)
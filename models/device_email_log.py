@@ -1,4 +1,5 @@
 from boto3.dynamodb.conditions import Key
+import concurrent.futures
 from datetime import timedelta
 from helpers import time_functions
 from models.base import Base
@@ -13,65 +14,54 @@ class DeviceEmailLog(Base):
     def create(self, mail_data):
         self.table.put_item(Item=mail_data)
 
+    def batch_create(self, mail_data_list):
+        with self.table.batch_writer(
+                overwrite_by_pkeys=['serial_number', 'timestamp']) as batch:
+            for mail_data in mail_data_list:
+                batch.put_item(Item=mail_data)
+
     def get_latest_log_in_interval(
             self, db_query_params, original_feature_list):
-        expression_attribute_names = {"#ts": "timestamp"}
-        projection_expression = ['#ts']
-        for i, feature in enumerate(original_feature_list):
-            expression_attribute_names[f"#{i}"] = feature
-            projection_expression.append(f"#{i}")
         db_res = self.table.query(
             KeyConditionExpression=Key('serial_number').eq(
                 db_query_params['serial_number']) &
             Key('timestamp').between(
                 db_query_params['from_time'], db_query_params['to_time']
             ),
-            ProjectionExpression=', '.join(projection_expression),
-            ExpressionAttributeNames=expression_attribute_names,
-            ScanIndexForward=False, Limit=1
+            ScanIndexForward=False, Limit=1,
+            **projection(original_feature_list)
         )
         if db_res['Items']:
             return db_res['Items'][0]
 
-    def get_all_logs_in_interval(
+    # Every log of the interval, in ascending order of timestamp, as LogColumns
+    def get_log_columns_in_interval(
             self, db_query_params, original_feature_list):
-        expression_attribute_names = {"#ts": "timestamp"}
-        projection_expression = ['#ts']
-        for i, feature in enumerate(original_feature_list):
-            expression_attribute_names[f"#{i}"] = feature
-            projection_expression.append(f"#{i}")
-        response = self.table.query(
-            KeyConditionExpression=Key('serial_number').eq(
+        query_params = {
+            'KeyConditionExpression': Key('serial_number').eq(
                 db_query_params['serial_number']) &
             Key('timestamp').between(
-                db_query_params['from_time'], db_query_params['to_time']),
-            ProjectionExpression=', '.join(projection_expression),
-            ExpressionAttributeNames=expression_attribute_names
-        )
-        result = []
-
-        if not response['Items']:
-            return
-        else:
-            result.extend(response['Items'])
-
+                db_query_params['from_time'], db_query_params['to_time'])
+        }
+        query_params.update(projection(original_feature_list))
+        columns = LogColumns(original_feature_list)
+        response = self.table.query(**query_params)
+        columns.extend(response['Items'])
         while 'LastEvaluatedKey' in response:
             response = self.table.query(
-                KeyConditionExpression=Key('serial_number').eq(
-                    db_query_params['serial_number']) &
-                Key('timestamp').between(
-                    db_query_params['from_time'], db_query_params['to_time']),
-                ProjectionExpression=f"#ts, {', '.join(original_feature_list)}",
-                ExpressionAttributeNames={"#ts": "timestamp"},
-                ExclusiveStartKey=response['LastEvaluatedKey'])
-            if response['Items']:
-                result.extend(response['Items'])
-
-        return result
-
-    def get_log_history(self, params, original_feature_list):
+                ExclusiveStartKey=response['LastEvaluatedKey'], **query_params)
+            columns.extend(response['Items'])
+        return columns
+
+    # Periods are queried on the given executor, so that callers can share
+    # one across requests, or on a new one
+    def get_log_history(self, params, original_feature_list, executor=None):
+        if not executor:
+            with concurrent.futures.ThreadPoolExecutor() as executor:
+                return self.get_log_history(
+                    params, original_feature_list, executor)
+
         feature_response = []
-        db_res_pre = {}
         serial_number = params['serial_number']
 
         from_time = params['from_time_unit']
@@ -87,47 +77,31 @@ class DeviceEmailLog(Base):
             # Break time period into smaller periods based on threshold value
             time_periods = time_functions.break_time_period(
                 from_time, to_time, int(environ['THRESHOLD_TIME_UNIT_EMAIL']))
-            for period in time_periods:
-                db_query_params = {
-                    'serial_number': serial_number,
-                    'from_time': time_functions.unparse_time(period['start_time']),
-                    'to_time': time_functions.unparse_time(period['end_time'])
-                }
-                records = self.get_all_logs_in_interval(
-                    db_query_params, original_feature_list)
-                if records:
-                    start_unit = period['start_time']
-                    end_unit = start_unit + timedelta(hours=1)
-                    child_list = []
-                    # Loop for every hour
-                    while (start_unit <= period['end_time']):
-                        if end_unit >= time_functions.parse_time(
-                                records[0]['timestamp']):
-                            for item in records:
-                                if start_unit <= time_functions.parse_time(
-                                        item['timestamp']) < end_unit:
-                                    child_list.append(item)
-
-                        if child_list:
-                            db_res = child_list[-1]
-                            child_list = []
-                            feature_response.append(db_res)
-
-                        # Incremental condition of the loop
-                        start_unit = end_unit
-                        end_unit = start_unit + timedelta(hours=1)
+
+            # Periods are paginated concurrently, the latest log of every
+            # hour is then found in a single pass
+            futures = [executor.submit(
+                self.get_log_columns_in_interval,
+                period_query_params(serial_number, period),
+                original_feature_list) for period in time_periods]
+            for period, future in zip(time_periods, futures):
+                columns = future.result()
+                bounds = time_functions.hourly_bounds(
+                    period['start_time'], period['end_time'])
+                for i in time_functions.latest_index_per_interval(
+                        columns.timestamps, bounds):
+                    if i is not None:
+                        feature_response.append(columns.row(i))
 
         else:  # Normal Case
             time_periods = time_functions.break_time_period(
                 from_time, to_time, time_unit)
-            for period in time_periods:
-                db_query_params = {
-                    'serial_number': serial_number,
-                    'from_time': time_functions.unparse_time(period['start_time']),
-                    'to_time': time_functions.unparse_time(period['end_time']),
-                }
-                db_res = self.get_latest_log_in_interval(
-                    db_query_params, original_feature_list)
+            futures = [executor.submit(
+                self.get_latest_log_in_interval,
+                period_query_params(serial_number, period),
+                original_feature_list) for period in time_periods]
+            for future in futures:
+                db_res = future.result()
                 if db_res:
                     feature_response.append(db_res)
 
@@ -136,29 +110,23 @@ class DeviceEmailLog(Base):
         # History Logs API is called for reporting_id (offcourse because its email logs) & the following condition is satisfied:
         #       rid_activation_timestamp           from_time          to_time
         # -----------------|---------------------------|------------------|----------> time coordinate
-        if 'rid_activation_timestamp' in params:
-            rid_activation_timestamp = params['rid_activation_timestamp']
+        rid_activation_timestamp = params.get('rid_activation_timestamp')
 
         if 'log_pre_from' in params:
-            if (not 'rid_activation_timestamp' in params) or (rid_activation_timestamp < from_time):
+            if (not rid_activation_timestamp) or (rid_activation_timestamp < from_time):
                 if not feature_response or feature_response[0]['timestamp'] != from_time:
-                    expression_attribute_names = {"#ts": "timestamp"}
-                    projection_expression = ['#ts']
-                    for i, feature in enumerate(original_feature_list):
-                        expression_attribute_names[f"#{i}"] = feature
-                        projection_expression.append(f"#{i}")
-                        db_res_pre = self.table.query(
+                    db_res_pre = self.table.query(
                         KeyConditionExpression=Key('serial_number').eq(serial_number) &
-                            Key('timestamp').lte(from_time),
-                        ProjectionExpression=', '.join(projection_expression),
-                        ExpressionAttributeNames=expression_attribute_names,
-                        ScanIndexForward=False, Limit=1
-                        )
+                        Key('timestamp').lte(from_time),
+                        ScanIndexForward=False, Limit=1,
+                        **projection(original_feature_list)
+                    )
                     if db_res_pre['Items']:
                         # Note: Do not return the latest log before from_time if its timestamp is less than the reporting_id activation timestamp, i.e., the following case
                         #    log_pre_from       rid_activation_timestamp           from_time          to_time
                         # ----------|---------------------|---------------------------|------------------|----------> time coordinate
-                        if rid_activation_timestamp and db_res_pre['Items'][0]['timestamp'] >= rid_activation_timestamp:
+                        if (not rid_activation_timestamp or
+                                db_res_pre['Items'][0]['timestamp'] >= rid_activation_timestamp):
                             db_res_pre['Items'][0]['timestamp'] = from_time
                             feature_response.insert(0, db_res_pre['Items'][0])
 
@@ -171,3 +139,46 @@ class DeviceEmailLog(Base):
             final_response.append(result)
 
         return final_response
+
+
+# Logs kept as one list per feature instead of one dict per log, a dict is
+# only built for the logs which are returned
+class LogColumns(object):
+    def __init__(self, original_feature_list):
+        self.timestamps = []
+        self.columns = {feature: [] for feature in original_feature_list}
+
+    def extend(self, items):
+        for item in items:
+            self.timestamps.append(item['timestamp'])
+            for feature, column in self.columns.items():
+                column.append(item.get(feature))
+
+    def row(self, i):
+        row = {
+            feature: column[i] for feature, column in self.columns.items()
+            if column[i] is not None}
+        row['timestamp'] = self.timestamps[i]
+        return row
+
+
+# ProjectionExpression and ExpressionAttributeNames of the timestamp and the
+# features, every attribute name goes through a placeholder
+def projection(original_feature_list):
+    expression_attribute_names = {"#ts": "timestamp"}
+    projection_expression = ['#ts']
+    for i, feature in enumerate(original_feature_list):
+        expression_attribute_names[f"#{i}"] = feature
+        projection_expression.append(f"#{i}")
+    return {
+        'ProjectionExpression': ', '.join(projection_expression),
+        'ExpressionAttributeNames': expression_attribute_names
+    }
+
+
+def period_query_params(serial_number, period):
+    return {
+        'serial_number': serial_number,
+        'from_time': time_functions.unparse_time(period['start_time']),
+        'to_time': time_functions.unparse_time(period['end_time'])
+    }
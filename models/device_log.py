@@ -7,7 +7,10 @@ from datetime import timedelta
 from functions import helper
 from helpers import time_functions
 import logging
+from models import device_log_rollup
+from models import latest_cache
 from models.base import Base
+from models.device_log_rollup import DeviceLogRollup
 from models.service_oid import ServiceOid
 from os import environ
 from pymib.parse import parse
@@ -16,6 +19,15 @@ from pymib.parse import parse
 logger = logging.getLogger('device_logs')
 logger.setLevel(logging.INFO)
 
+DEFAULT_LATEST_LOGS_MAX_WORKERS = 32
+
+# History query planning
+RANGE_PLAN = 'range'
+BUCKET_PLAN = 'bucket'
+HISTORY_PROBE_LIMIT = 100
+# Log records are small, a read unit (4KB) covers about this many of them
+RECORDS_PER_READ_UNIT = 40
+
 
 class DeviceLog(Base):
     def __init__(self):
@@ -32,99 +44,142 @@ class DeviceLog(Base):
 
     def get_latest_logs(self, subscribed_data):
         #   Retrieve latest logs from either ElastiCache or DynamoDb.
-        table = self.dynamodb.Table('device_logs')
-        db_res = []
-        if subscribed_data:
-            device_id, log_service_id = subscribed_data[0]['id'].split('#')
-
+        if not subscribed_data:
+            return ({'Items': []})
+        device_id = subscribed_data[0]['id'].split('#')[0]
+        return self.get_latest_logs_for_devices(
+            {device_id: subscribed_data})[device_id]
+
+    # Retrieve latest logs of several devices at once.
+    # 'subscriptions' maps a device_id to its subscribed data. Every cached log
+    # is read in a single pipeline and the missing ones are queried from
+    # DynamoDb on one executor bounded by LATEST_LOGS_MAX_WORKERS.
+    def get_latest_logs_for_devices(self, subscriptions, executor=None):
+        service_oids = {}
+        object_ids = {}
+        for device_id, subscribed_data in subscriptions.items():
+            if not subscribed_data:
+                continue
+            log_service_id = subscribed_data[0]['id'].split('#')[1]
             if('oids' not in subscribed_data[0] and
                subscribed_data[0]['status'] == SUBSCRIBED_OFFLINE):
-                subscribed_data[0]['oids'] = []
-                for oid in ServiceOid().read(log_service_id)['oids']:
-                    subscribed_data[0]['oids'].append({'oid': oid})
-
-            if(self.elasticache):
-                redis_res = []
-                for data in subscribed_data[0]['oids']:
-                    res = self.elasticache.hgetall("device_log:%s" %
-                                                   (device_id + '#' + data['oid']))
-                    if not res:
-                        break
-                    else:
-                        redis_res.append(super().convert(res))
-                if len(redis_res) == len(subscribed_data):
-                    return ({'Items': redis_res})
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future_to_log = {executor.submit(
-                    self.get_log, data, device_id): data for data in subscribed_data[0]['oids']}
-                for future in concurrent.futures.as_completed(future_to_log):
-                    if 'Items' in future.result() and future.result()['Items']:
-                        db_res.append(future.result()['Items'][0])
-        return ({'Items': db_res})
+                if log_service_id not in service_oids:
+                    service_oids[log_service_id] = ServiceOid().read(
+                        log_service_id)['oids']
+                subscribed_data[0]['oids'] = [
+                    {'oid': oid} for oid in service_oids[log_service_id]]
+            object_ids[device_id] = [
+                data['oid'] for data in subscribed_data[0].get('oids', [])]
+
+        log_ids = [device_id + '#' + oid
+                   for device_id, oids in object_ids.items() for oid in oids]
+        logs = self.get_cached_logs(log_ids)
+
+        #   Only the logs missing from ElastiCache are retrieved from DynamoDb
+        missing = [log_id for log_id in log_ids if log_id not in logs]
+        if missing:
+            if executor:
+                self.query_latest_logs(missing, logs, executor)
+            else:
+                with concurrent.futures.ThreadPoolExecutor(
+                        max_workers=latest_logs_max_workers()) as executor:
+                    self.query_latest_logs(missing, logs, executor)
+
+        result = {device_id: {'Items': []} for device_id in subscriptions}
+        for device_id, oids in object_ids.items():
+            result[device_id]['Items'] = [
+                logs[device_id + '#' + oid] for oid in oids
+                if device_id + '#' + oid in logs]
+        return result
+
+    def query_latest_logs(self, log_ids, logs, executor):
+        future_to_log = {executor.submit(
+            self.get_log, {'oid': log_id.split('#', 1)[1]},
+            log_id.split('#', 1)[0]): log_id for log_id in log_ids}
+        for future in concurrent.futures.as_completed(future_to_log):
+            if 'Items' in future.result() and future.result()['Items']:
+                logs[future_to_log[future]] = future.result()['Items'][0]
+
+    # Retrieve the cached latest logs in one pipeline round trip
+    def get_cached_logs(self, log_ids):
+        logs = {}
+        if self.elasticache and log_ids:
+            pipe = self.elasticache.pipeline(transaction=False)
+            for log_id in log_ids:
+                pipe.hgetall("device_log:%s" % (log_id))
+            for log_id, res in zip(log_ids, pipe.execute()):
+                if res:
+                    logs[log_id] = super().convert(res)
+        return logs
 
     def is_exists_cache(self, notify_data):
         #   Verify if the notified data is already stored in ElastiCache or not.
-        response = []
-        response.extend(notify_data['notification'])
-        if(self.elasticache):
-            for data in notify_data['notification']:
-                res = self.elasticache.hgetall("device_log:%s" % (
-                    notify_data['device_id'] + '#' + data['object_id']))
-                res = super().convert(res)
-                if res and res['value'] == data['value']:
-                    response.remove(data)
-        notify_data['notification'] = response
+        #   Every object_id is checked in one pipeline round trip.
+        log_ids = [notify_data['device_id'] + '#' + data['object_id']
+                   for data in notify_data['notification']]
+        cached = self.get_cached_logs(log_ids)
+        notify_data['notification'] = [
+            data for data, log_id in zip(notify_data['notification'], log_ids)
+            if not (log_id in cached and
+                    cached[log_id].get('value') == data['value'])]
         return notify_data
 
-    def is_exists_db(self, notify_data):
+    def is_exists_db(self, notify_data, executor=None):
         #   Verify if the notified data is already stored in Dynamodb or not.
-        table = self.dynamodb.Table('device_logs')
+        #   The latest logs are queried concurrently.
+        log_ids = [notify_data['device_id'] + '#' + data['object_id']
+                   for data in notify_data['notification']]
+        latest = {}
+        if log_ids:
+            if executor:
+                self.query_latest_logs(set(log_ids), latest, executor)
+            else:
+                with concurrent.futures.ThreadPoolExecutor(
+                        max_workers=latest_logs_max_workers()) as executor:
+                    self.query_latest_logs(set(log_ids), latest, executor)
+
         response = []
-        for data in notify_data['notification']:
-            res = table.query(
-                Limit=1,
-                ScanIndexForward=False,
-                KeyConditionExpression=Key('id').eq(
-                    notify_data['device_id'] + '#' + data['object_id']
-                )
-            )['Items']
+        for data, log_id in zip(notify_data['notification'], log_ids):
             if not data['value']:
                 data['value'] = " "
-            if not res:
-                response.append(data)
-            elif res and res[0]['value'] != data['value']:
+            if log_id not in latest or latest[log_id]['value'] != data['value']:
                 response.append(data)
         notify_data['notification'] = response
         return notify_data
 
     def put_logs(self, notify_data):
-        #   Save the logs in the DynamoDb database for a particular device.
+        #   Save the logs in the DynamoDb database for a particular device,
+        #   then write them through to the latest logs in ElastiCache.
         table = self.dynamodb.Table('device_logs')
+        records = []
         with table.batch_writer(overwrite_by_pkeys=['id', 'timestamp']) as batch:
             for data in notify_data['notification']:
-                batch.put_item(
-                    Item={
-                        'id': (notify_data['device_id'] + '#' +
-                               data['object_id']),
-                        'timestamp': time_functions.time_convert(data['timestamp']),
-                        'value': (data['value']) if data['value'] else " ",
-                    }
-                )
+                item = {
+                    'id': (notify_data['device_id'] + '#' +
+                           data['object_id']),
+                    'timestamp': time_functions.time_convert(data['timestamp']),
+                    'value': (data['value']) if data['value'] else " ",
+                }
+                batch.put_item(Item=item)
+                records.append(item)
+        self.cache_logs(records)
 
     def update_logs(self, notified_event):
         #   Update the latest logs for the particular device in ElastiCache.
-        if(self.elasticache):
-            for data in notified_event['Records']:
-                log_id = data['dynamodb']['Keys']['id']['S']
-                timestamp = data['dynamodb']['NewImage']['timestamp']['S']
-                val = data['dynamodb']['NewImage']['value']['S']
-                value = val if val != " " else ''
-                self.elasticache.hmset("device_log:%s" % (log_id),
-                                       {
-                    'id': log_id,
-                    'timestamp': timestamp,
-                    'value': value,
-                })
+        self.cache_logs([{
+            'id': data['dynamodb']['Keys']['id']['S'],
+            'timestamp': data['dynamodb']['NewImage']['timestamp']['S'],
+            'value': data['dynamodb']['NewImage']['value']['S']
+        } for data in notified_event['Records']])
+
+    # Keep the latest of the device_logs records in ElastiCache
+    def cache_logs(self, records):
+        latest_cache.put_latest(self.elasticache, [
+            (latest_cache.device_log_key(record['id']), {
+                'id': record['id'],
+                'timestamp': record['timestamp'],
+                'value': record['value'] if record['value'] != " " else ''
+            }) for record in records])
 
     def get_charset(self, device_id):
         object_id = CHARSET_OID
@@ -202,7 +257,156 @@ class DeviceLog(Base):
 
         return result
 
-    def get_log_history(self, params, object_id_list, original_feature_list):
+    # Retrieve the latest log of each time period for every object_id.
+    # Each object_id is served by the cheaper of two plans:
+    #   RANGE_PLAN:  one paginated range query, downsampled in memory
+    #   BUCKET_PLAN: one Limit=1 query per time period
+    # The plan is picked from the record density observed by a probe query.
+    # Returns the latest logs and the plan of every object_id. Queries run on
+    # the given executor, or on a new one.
+    def get_latest_logs_per_period(
+            self, device_id, object_ids, time_periods, bounds, executor=None):
+        if not executor:
+            with concurrent.futures.ThreadPoolExecutor() as executor:
+                return self.get_latest_logs_per_period(
+                    device_id, object_ids, time_periods, bounds, executor)
+
+        db_query_params = {
+            'from_time': time_functions.unparse_time(
+                time_periods[0]['start_time']),
+            'to_time': time_functions.unparse_time(
+                max(period['end_time'] for period in time_periods))
+        }
+        latest = {}
+        plans = {}
+
+        futures = {
+            executor.submit(
+                self.plan_history_query, device_id + '#' + key,
+                db_query_params, len(bounds)): key for key in object_ids}
+        for future in concurrent.futures.as_completed(futures):
+            object_id = futures[future]
+            plan, estimated_records, records = future.result()
+            plans[object_id] = {
+                'plan': plan,
+                'estimated_records': estimated_records,
+                'buckets': len(bounds)}
+            if plan == RANGE_PLAN:
+                latest[object_id] = time_functions.latest_per_interval(
+                    records, bounds)
+
+        bucket_futures = {}
+        for object_id in object_ids:
+            if object_id in latest:
+                continue
+            latest[object_id] = [None] * len(bounds)
+            for i, period in enumerate(time_periods):
+                bucket_futures[executor.submit(
+                    self.get_latest_log_in_interval,
+                    device_id + '#' + object_id, {
+                        'from_time': time_functions.unparse_time(
+                            period['start_time']),
+                        'to_time': time_functions.unparse_time(
+                            period['end_time'])})] = (object_id, i)
+        for future in concurrent.futures.as_completed(bucket_futures):
+            object_id, i = bucket_futures[future]
+            if future.result()['Items']:
+                latest[object_id][i] = future.result()['Items'][0]
+
+        logger.info(
+            f"History query plan for device {device_id}: {plans}")
+        return latest, plans
+
+    # Retrieve the latest log of each time period for every object_id from
+    # the rollups, with one query per object_id. A period only covering part
+    # of its rollup bucket falls back to DynamoDb when the rolled up log is
+    # after the end of the period.
+    def get_rolled_up_logs_per_period(
+            self, device_id, object_ids, time_unit, bounds, executor=None):
+        if not executor:
+            with concurrent.futures.ThreadPoolExecutor() as executor:
+                return self.get_rolled_up_logs_per_period(
+                    device_id, object_ids, time_unit, bounds, executor)
+
+        rollup = DeviceLogRollup()
+        from_bucket = device_log_rollup.bucket(bounds[0][0], time_unit)
+        to_bucket = device_log_rollup.bucket(bounds[-1][0], time_unit)
+        latest = {}
+
+        futures = {
+            executor.submit(
+                rollup.get_rollups, device_id, key, time_unit,
+                from_bucket, to_bucket): key for key in object_ids}
+        fallback_futures = {}
+        for future in concurrent.futures.as_completed(futures):
+            object_id = futures[future]
+            rollups = future.result()
+            latest[object_id] = [None] * len(bounds)
+            for i, (start, end) in enumerate(bounds):
+                item = rollups.get(
+                    device_log_rollup.bucket(start, time_unit))
+                if not item or item['timestamp'] < start:
+                    continue
+                if item['timestamp'] < end:
+                    latest[object_id][i] = {
+                        'id': device_id + '#' + object_id,
+                        'timestamp': item['timestamp'],
+                        'value': item['value']}
+                else:
+                    fallback_futures[executor.submit(
+                        self.get_latest_log_in_interval,
+                        device_id + '#' + object_id, {
+                            'from_time': start,
+                            'to_time': time_functions.subtract_seconds(end, 1)
+                        })] = (object_id, i)
+        for future in concurrent.futures.as_completed(fallback_futures):
+            object_id, i = fallback_futures[future]
+            if future.result()['Items']:
+                latest[object_id][i] = future.result()['Items'][0]
+
+        return latest
+
+    # Probe the first records of the interval and choose the query plan.
+    # Returns the plan, the estimated record count and, for RANGE_PLAN,
+    # every record of the interval (the probe page is reused).
+    def plan_history_query(self, table_id, db_query_params, buckets):
+        key_condition = Key('id').eq(table_id) & Key('timestamp').between(
+            db_query_params['from_time'], db_query_params['to_time'])
+        response = self.table.query(
+            KeyConditionExpression=key_condition,
+            Limit=HISTORY_PROBE_LIMIT)
+        records = response['Items']
+        if 'LastEvaluatedKey' not in response:
+            return RANGE_PLAN, len(records), records
+
+        # Extrapolate the density of the probed records to the whole interval
+        from_time = time_functions.parse_time(db_query_params['from_time'])
+        covered = (time_functions.parse_time(records[-1]['timestamp']) -
+                   from_time).total_seconds() + 1
+        total = (time_functions.parse_time(db_query_params['to_time']) -
+                 from_time).total_seconds() + 1
+        estimated_records = int(len(records) * total / covered)
+
+        if estimated_records / RECORDS_PER_READ_UNIT > buckets:
+            return BUCKET_PLAN, estimated_records, None
+
+        while 'LastEvaluatedKey' in response:
+            response = self.table.query(
+                KeyConditionExpression=key_condition,
+                ExclusiveStartKey=response['LastEvaluatedKey'])
+            records.extend(response['Items'])
+        return RANGE_PLAN, estimated_records, records
+
+    # Queries run on the given executor, shared e.g. by the segments of a
+    # reporting_id, or on a new one
+    def get_log_history(
+            self, params, object_id_list, original_feature_list,
+            executor=None):
+        if not executor:
+            with concurrent.futures.ThreadPoolExecutor() as executor:
+                return self.get_log_history(
+                    params, object_id_list, original_feature_list, executor)
+
         feature_response = []
         res_pre_from = {}
         db_res_pre = {}
@@ -218,6 +422,7 @@ class DeviceLog(Base):
         # Get the charset record of the device from the Database
         charset = self.get_charset(device_id)
 
+        object_ids = list(object_id_list.keys())
         if (  # For reducing response time in case of Hourly data
             time_unit == time_functions.HOURLY and
                 (parsed_to_time - parsed_from_time) > timedelta(days=7)):
@@ -225,77 +430,67 @@ class DeviceLog(Base):
             time_periods = time_functions.break_time_period(
                 from_time, to_time, int(environ['THRESHOLD_TIME_UNIT_BOC']))
 
-            for period in time_periods:
-                db_query_params = {
-                    'from_time': time_functions.unparse_time(period['start_time']),
-                    'to_time': time_functions.unparse_time(period['end_time'])
-                }
+            # Hours are counted from from_time, rollups can only be used
+            # when from_time is on the hour
+            if (device_log_rollup.is_available(from_time) and
+                    parsed_from_time.minute == parsed_from_time.second == 0):
+                bounds = []
+                for period in time_periods:
+                    bounds.extend(time_functions.hourly_bounds(
+                        period['start_time'], period['end_time']))
+                latest = self.get_rolled_up_logs_per_period(
+                    device_id, object_ids, time_unit, bounds, executor)
+            else:
+                bounds = []
+                latest = {object_id: [] for object_id in object_ids}
+                for period in time_periods:
+                    db_query_params = {
+                        'from_time': time_functions.unparse_time(period['start_time']),
+                        'to_time': time_functions.unparse_time(period['end_time'])
+                    }
 
-                with concurrent.futures.ThreadPoolExecutor() as executor:
                     futures = {
                         executor.submit(
-                            self.get_all_logs_in_interval, device_id + '#' + key, db_query_params): key for key in object_id_list.keys()}
-                    start_unit = period['start_time']
-                    end_unit = start_unit + timedelta(hours=1)
-                    while (start_unit <= period['end_time']):
-                        db_res = {}
-                        for future in concurrent.futures.as_completed(futures):
-                            if future.result():
-                                records = future.result()
-                                child_list = []
-                                for item in records:
-                                    if start_unit <= time_functions.parse_time(
-                                            item['timestamp']) < end_unit:
-                                        child_list.append(item)
-
-                                if child_list:
-                                    required_item = child_list[-1]
-                                    child_list = []
-                                    object_id = required_item['id'].split('#')[
-                                        1]
-                                    db_res.update({object_id: required_item})
-                        # Parse the retrieved data
-                        if db_res:
-                            if charset:
-                                db_res.update(
-                                    {CHARSET_OID: charset})
-                            feature_response.extend(
-                                self.parse_oid_value_for_history(
-                                    object_id_list, original_feature_list, db_res))
-
-                        start_unit = end_unit
-                        end_unit = start_unit + timedelta(hours=1)
+                            self.get_all_logs_in_interval, device_id + '#' + key, db_query_params): key for key in object_ids}
+                    records = {
+                        futures[future]: future.result()
+                        for future in concurrent.futures.as_completed(futures)}
+
+                    # Assign the records of every object_id to hourly buckets
+                    # in a single pass
+                    period_bounds = time_functions.hourly_bounds(
+                        period['start_time'], period['end_time'])
+                    bounds.extend(period_bounds)
+                    for object_id in object_ids:
+                        latest[object_id].extend(
+                            time_functions.latest_per_interval(
+                                records[object_id] or [], period_bounds))
 
         else:  # Normal Approach for BOC devices
             # Break the time period into smaller periods
             time_periods = time_functions.break_time_period(
                 from_time, to_time, time_unit)
 
-            for period in time_periods:
-                db_res = {}
-                db_query_params = {
-                    'from_time': time_functions.unparse_time(period['start_time']),
-                    'to_time': time_functions.unparse_time(period['end_time'])
-                }
-
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    futures = {
-                        executor.submit(
-                            self.get_latest_log_in_interval, device_id + '#' + key, db_query_params): key for key in object_id_list.keys()}
-                    for future in concurrent.futures.as_completed(futures):
-                        if future.result()['Items']:
-                            record = future.result()['Items'][0]
-                            object_id = record['id'].split('#')[1]
-                            item = {object_id: record}
-                            db_res.update(item)
-
-                # Parse the retrieved data
-                if db_res:
-                    if charset:
-                        db_res.update({CHARSET_OID: charset})
-                    feature_response.extend(
-                        self.parse_oid_value_for_history(
-                            object_id_list, original_feature_list, db_res))
+            bounds = time_functions.period_bounds(time_periods)
+            if device_log_rollup.is_available(from_time):
+                latest = self.get_rolled_up_logs_per_period(
+                    device_id, object_ids, time_unit, bounds, executor)
+            else:
+                latest, _ = self.get_latest_logs_per_period(
+                    device_id, object_ids, time_periods, bounds, executor)
+
+        for i in range(len(bounds)):
+            db_res = {
+                object_id: latest[object_id][i]
+                for object_id in object_ids if latest[object_id][i]}
+
+            # Parse the retrieved data
+            if db_res:
+                if charset:
+                    db_res.update({CHARSET_OID: charset})
+                feature_response.extend(
+                    self.parse_oid_value_for_history(
+                        object_id_list, original_feature_list, db_res))
 
         # Optional functionality
         # Get the latest log before from_time only in the following 2 cases:
@@ -370,3 +565,8 @@ class DeviceLog(Base):
                     'features'].items() if key in original_feature_list}
 
         return response
+
+
+def latest_logs_max_workers():
+    return int(environ.get(
+        'LATEST_LOGS_MAX_WORKERS', DEFAULT_LATEST_LOGS_MAX_WORKERS))
@@ -0,0 +1,89 @@
+import logging
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from helpers import time_functions
+from models.base import Base
+from os import environ
+
+logger = logging.getLogger('device_log_rollups')
+logger.setLevel(logging.INFO)
+
+# Length of the timestamp prefix identifying the bucket of each time unit
+# For example: 2017-01-12T12:23:07 is in hourly bucket 2017-01-12T12,
+# daily bucket 2017-01-12 and monthly bucket 2017-01
+BUCKET_LENGTHS = {
+    time_functions.HOURLY: 13,
+    time_functions.DAILY: 10,
+    time_functions.MONTHLY: 7
+}
+
+
+# Latest log of every hour, day and month for each device_id#object_id
+class DeviceLogRollup(Base):
+    def __init__(self):
+        super().__init__()
+        self.table = self.dynamodb.Table('device_log_rollups')
+
+    # Keep the log in every bucket it belongs to, unless the bucket
+    # already holds a more recent log
+    def put(self, device_id, object_id, timestamp, value):
+        for time_unit in BUCKET_LENGTHS:
+            self.put_bucket(device_id, object_id, time_unit, timestamp, value)
+
+    def put_bucket(self, device_id, object_id, time_unit, timestamp, value):
+        try:
+            self.table.update_item(
+                Key={
+                    'id': rollup_id(device_id, object_id, time_unit),
+                    'bucket': bucket(timestamp, time_unit)
+                },
+                UpdateExpression='SET #ts = :ts, #v = :v',
+                ConditionExpression='attribute_not_exists(#ts) OR #ts < :ts',
+                ExpressionAttributeNames={'#ts': 'timestamp', '#v': 'value'},
+                ExpressionAttributeValues={':ts': timestamp, ':v': value}
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return False
+
+    # Retrieve the rollups of a device_id#object_id between two buckets,
+    # keyed by bucket
+    def get_rollups(self, device_id, object_id, time_unit, from_bucket, to_bucket):
+        key_condition = Key('id').eq(
+            rollup_id(device_id, object_id, time_unit)) & Key(
+                'bucket').between(from_bucket, to_bucket)
+        response = self.table.query(KeyConditionExpression=key_condition)
+        items = response['Items']
+        while 'LastEvaluatedKey' in response:
+            response = self.table.query(
+                KeyConditionExpression=key_condition,
+                ExclusiveStartKey=response['LastEvaluatedKey'])
+            items.extend(response['Items'])
+        return {item['bucket']: item for item in items}
+
+
+def rollup_id(device_id, object_id, time_unit):
+    return f'{device_id}#{object_id}#{time_unit}'
+
+
+def bucket(timestamp, time_unit):
+    return timestamp[0:BUCKET_LENGTHS[time_unit]]
+
+
+# Latest of the device_logs records in each bucket, keyed by bucket
+def latest_per_bucket(records, time_unit):
+    latest = {}
+    for record in records:
+        key = bucket(record['timestamp'], time_unit)
+        if key not in latest or latest[key]['timestamp'] < record['timestamp']:
+            latest[key] = record
+    return latest
+
+
+# Rollups are complete for logs stored after DEVICE_LOG_ROLLUPS_FROM,
+# i.e. since they were backfilled
+def is_available(from_time):
+    rollups_from = environ.get('DEVICE_LOG_ROLLUPS_FROM')
+    return bool(rollups_from) and rollups_from <= from_time
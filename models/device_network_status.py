@@ -1,5 +1,7 @@
 from boto3.dynamodb.conditions import Key
+import concurrent.futures
 from helpers import time_functions
+from models import latest_cache
 from models.base import Base
 
 
@@ -9,91 +11,118 @@ class DeviceNetworkStatus(Base):
 
     def get_latest_status(self, device_id):
         #   Retrieve latest network status from either ElastiCache or DynamoDb.
-        table = self.dynamodb.Table('device_network_statuses')
         if device_id:
-            if(self.elasticache):
-                redis_res = self.elasticache.hgetall(
-                    "device_network_status:%s" % (device_id))
+            return self.get_latest_statuses([device_id]).get(device_id)
+
+    # Retrieve latest network statuses of several devices at once.
+    # ElastiCache is read in one pipeline, devices missing from the cache
+    # are queried concurrently from DynamoDb.
+    def get_latest_statuses(self, device_ids, executor=None):
+        statuses = {}
+        missing = list(device_ids)
+        if(self.elasticache):
+            pipe = self.elasticache.pipeline(transaction=False)
+            for device_id in device_ids:
+                pipe.hgetall("device_network_status:%s" % (device_id))
+            missing = []
+            for device_id, redis_res in zip(device_ids, pipe.execute()):
                 if redis_res:
-                    return(super().convert(redis_res))
-            db_res = table.query(
-                Limit=1,
-                ScanIndexForward=False,
-                KeyConditionExpression=Key('id').eq(device_id)
-            )['Items']
-            return (db_res)
+                    statuses[device_id] = super().convert(redis_res)
+                else:
+                    missing.append(device_id)
+
+        if missing:
+            if executor:
+                self.query_latest_statuses(missing, statuses, executor)
+            else:
+                with concurrent.futures.ThreadPoolExecutor() as executor:
+                    self.query_latest_statuses(missing, statuses, executor)
+        return statuses
+
+    def query_latest_statuses(self, device_ids, statuses, executor):
+        table = self.dynamodb.Table('device_network_statuses')
+        future_to_device = {executor.submit(
+            table.query,
+            Limit=1,
+            ScanIndexForward=False,
+            KeyConditionExpression=Key('id').eq(device_id)
+        ): device_id for device_id in device_ids}
+        for future in concurrent.futures.as_completed(future_to_device):
+            if future.result()['Items']:
+                statuses[future_to_device[future]] = future.result()['Items'][0]
 
     def is_exists_cache(self, notify_data, event_timestamp):
         #   Verify if the notified data is already stored in ElastiCache or not.
-        response = []
-        response.extend(notify_data)
-        if(self.elasticache):
-            for data in notify_data:
-                res = self.elasticache.hgetall("device_network_status:%s" %
-                                               (data['device_id']))
-                res = super().convert(res)
-                status = (data['event'].split('_')[0])
-                time = time_functions.time_convert(data['timestamp'])
-                if res and res['timestamp'] == time:
-                    if res['status'] == status:
-                        response.remove(data)
-                    elif('event_timestamp' not in res[0] or
-                         ('event_timestamp' in res[0] and
-                         time_functions.parse_time(res[0]['event_timestamp']) > event_timestamp)):
-                        response.remove(data)
-        return response
+        #   Events are deduplicated per device and timestamp, the latest
+        #   status of every device is read in one pipeline.
+        events = unique_events(notify_data)
+        if not self.elasticache:
+            return events
+        device_ids = list({data['device_id']: None for data in events})
+        pipe = self.elasticache.pipeline(transaction=False)
+        for device_id in device_ids:
+            pipe.hgetall("device_network_status:%s" % (device_id))
+        cached = {
+            device_id: super(DeviceNetworkStatus, self).convert(res)
+            for device_id, res in zip(device_ids, pipe.execute()) if res}
+        return [
+            data for data in events
+            if not is_stored(cached.get(data['device_id']), data, event_timestamp)]
 
     def is_exists_db(self, notify_data, event_timestamp):
         #   Verify if the notified data is already stored in Dynamodb or not.
-        table = self.dynamodb.Table('device_network_statuses')
-        response = []
-        response.extend(notify_data)
-        for data in notify_data:
-            iso_time = time_functions.time_convert(data['timestamp'])
-            res = table.query(
-                KeyConditionExpression=Key('id').eq(
-                    data['device_id']) & Key('timestamp').eq(iso_time)
-            )['Items']
-
-            status = (data['event'].split('_')[0])
-            if res:
-                if res[0]['status'] == status:
-                    response.remove(data)
-                elif('event_timestamp' not in res[0] or
-                     ('event_timestamp' in res[0] and
-                     time_functions.parse_time(res[0]['event_timestamp']) > event_timestamp)):
-                    response.remove(data)
-        return response
+        #   The records at the notified timestamps are read with BatchGetItem.
+        events = unique_events(notify_data)
+        items = self.batch_get_items('device_network_statuses', [
+            {'id': data['device_id'],
+             'timestamp': time_functions.time_convert(data['timestamp'])}
+            for data in events])
+        stored = {(item['id'], item['timestamp']): item for item in items}
+        return [
+            data for data in events
+            if not is_stored(stored.get((
+                data['device_id'],
+                time_functions.time_convert(data['timestamp']))),
+                data, event_timestamp)]
 
     def put_status(self, notify_data, event_timestamp):
-        #   Save the network status in the DynamoDb database for a particular device.
+        #   Save the network status in the DynamoDb database for a particular
+        #   device, then write it through to the latest statuses in ElastiCache.
         table = self.dynamodb.Table('device_network_statuses')
+        records = []
         with table.batch_writer(overwrite_by_pkeys=['id', 'timestamp']) as batch:
             for data in notify_data:
                 status = (data['event'].split('_')[0])
-                batch.put_item(
-                    Item={
-                        'id': (data['device_id']),
-                        'timestamp': time_functions.time_convert(data['timestamp']),
-                        'status': status,
-                        'event_timestamp': time_functions.unparse_time(event_timestamp)
-                    }
-                )
+                item = {
+                    'id': (data['device_id']),
+                    'timestamp': time_functions.time_convert(data['timestamp']),
+                    'status': status,
+                    'event_timestamp': time_functions.unparse_time(event_timestamp)
+                }
+                batch.put_item(Item=item)
+                records.append(item)
+        self.cache_statuses(records)
 
     def update_status(self, notified_event):
         #   Update the latest network status (Online or Offline) for
         #   the particular device in ElastiCache.
-        if(self.elasticache):
-            for data in notified_event['Records']:
-                device_id = (data['dynamodb']['Keys']['id']['S'])
-                timestamp = (data['dynamodb']['NewImage']['timestamp']['S'])
-                status = (data['dynamodb']['NewImage']['status']['S'])
-                self.elasticache.hmset("device_network_status:%s" % (device_id),
-                                       {
-                    'id': device_id,
-                    'timestamp': timestamp,
-                    'status': status,
-                })
+        self.cache_statuses([{
+            'id': data['dynamodb']['Keys']['id']['S'],
+            'timestamp': data['dynamodb']['NewImage']['timestamp']['S'],
+            'status': data['dynamodb']['NewImage']['status']['S']
+        } for data in notified_event['Records']])
+
+    # Keep the latest of the device_network_statuses records in ElastiCache,
+    # only the newest record of each device is written
+    def cache_statuses(self, records):
+        latest = {}
+        for record in records:
+            if (record['id'] not in latest or
+                    latest[record['id']]['timestamp'] <= record['timestamp']):
+                latest[record['id']] = record
+        latest_cache.put_latest(self.elasticache, [
+            (latest_cache.device_network_status_key(device_id), record)
+            for device_id, record in latest.items()])
 
     # Retrieve one previous record from the timestamp
     # value 'from_time' for the 'device_id'
@@ -153,3 +182,24 @@ class DeviceNetworkStatus(Base):
                 result.extend(response['Items'])
 
         return result
+
+
+# Last event of every device_id and timestamp, in order of appearance
+def unique_events(notify_data):
+    events = {}
+    for data in notify_data:
+        events[(data['device_id'],
+                time_functions.time_convert(data['timestamp']))] = data
+    return list(events.values())
+
+
+# Whether the status notified by the event is already stored in the record,
+# or the record comes from a more recent message and has to be kept
+def is_stored(record, data, event_timestamp):
+    if not record or record['timestamp'] != time_functions.time_convert(
+            data['timestamp']):
+        return False
+    if record['status'] == data['event'].split('_')[0]:
+        return True
+    return ('event_timestamp' not in record or
+            time_functions.parse_time(record['event_timestamp']) > event_timestamp)
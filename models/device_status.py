@@ -23,6 +23,42 @@ class DeviceStatus(Base):
 
         return self
 
+    # Read the statuses of several (reporting_id, object_id) keys with
+    # BatchGetItem. Returns a DeviceStatus per existing key.
+    def batch_read(self, keys):
+        items = self.batch_get_items(
+            'device_statuses',
+            [{'reporting_id': reporting_id, 'object_id': object_id}
+             for reporting_id, object_id in keys])
+        statuses = {}
+        for item in items:
+            device_status = DeviceStatus()
+            device_status.reporting_id = item['reporting_id']
+            device_status.object_id = item['object_id']
+            device_status.timestamp = item['timestamp']
+            device_status.data = item['data']
+            device_status.created_at = item.get('created_at')
+            statuses[(item['reporting_id'], item['object_id'])] = device_status
+        return statuses
+
+    # Save several statuses at once with BatchWriteItem, a status is written
+    # as a whole so created_at is kept from the status read before
+    def batch_write(self, statuses):
+        now = datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+        with self.table.batch_writer(
+                overwrite_by_pkeys=['reporting_id', 'object_id']) as batch:
+            for device_status in statuses:
+                batch.put_item(
+                    Item={
+                        'reporting_id': device_status.reporting_id,
+                        'object_id': device_status.object_id,
+                        'timestamp': device_status.timestamp,
+                        'data': device_status.data,
+                        'created_at': getattr(
+                            device_status, 'created_at', None) or now,
+                        'updated_at': now
+                    })
+
     def insert(self, reporting_id, object_id, timestamp, data):
         created_at = datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
         self.table.put_item(
@@ -1,8 +1,9 @@
 from boto3.dynamodb.conditions import Key
-from boto3.dynamodb.conditions import Attr
 from botocore.exceptions import ClientError
 import datetime
+import json
 import re
+from os import environ
 from models.base import Base
 from models.service_oid import ServiceOid
 from constants.device_response_codes import *
@@ -17,6 +18,10 @@ ERROR_OFFSET = 400
 TO_SUBSCRIBE = 'subscribe'
 TO_UNSUBSCRIBE = 'unsubscribe'
 
+SUBSCRIPTION_CACHE_PREFIX = 'device_subscriptions'
+DEFAULT_SUBSCRIPTION_CACHE_TTL = 86400  # In Seconds
+CACHED_FIELDS = ('status', 'message', 'created_at', 'updated_at')
+
 
 class DeviceSubscription(Base):
     def __init__(self):
@@ -33,6 +38,8 @@ class DeviceSubscription(Base):
         self.log_service_id = log_service_id
         self.status = int(subscription['status'])
         self.message = subscription['message']
+        self.snapshot = DeviceSubscriptionSnapshot(
+            device_id, log_service_id, subscription)
 
         if 'latest_async_id' in subscription:
             self.latest_async_id = subscription['latest_async_id']
@@ -40,45 +47,126 @@ class DeviceSubscription(Base):
         return self
 
     def get_record(self, device_id, log_service_id):
-        subscription = {}
-
-        if (self.elasticache):
-            ec_id = self.elasticache.keys(
-                f'device_subscriptions:{device_id}#{log_service_id}')
-            if len(ec_id) == 1:
-                ec_id = self.convert(ec_id[0])
-                sub = self.convert(self.elasticache.hgetall(ec_id))
-                subscription = {
-                    'id': device_id,
-                    'log_service_id': log_service_id,
-                    'status': sub['status'],
-                    'message': sub['message'],
-                    'created_at': sub['created_at'],
-                    'updated_at': sub['updated_at']}
-                if 'latest_async_id' in sub:
-                    subscription['latest_async_id'] = sub['latest_async_id']
-
-        if not subscription:
-            table = self.dynamodb.Table('device_subscriptions')
-            ddb_res = table.get_item(Key={
-                    'id': f'{device_id}#{log_service_id}'
-                })
-
-            if 'Item' in ddb_res:
-                    subscription = {
-                        'id': device_id,
-                        'log_service_id': log_service_id,
-                        'status': ddb_res['Item']['status'],
-                        'message': ddb_res['Item']['message'],
-                        'created_at': ddb_res['Item']['created_at'],
-                        'updated_at': ddb_res['Item']['updated_at']}
-                    if 'latest_async_id' in ddb_res['Item']:
-                        subscription['latest_async_id'] = ddb_res['Item']['latest_async_id']
-            else:
-                return None
+        return self.get_records([device_id], log_service_id).get(device_id)
 
+    # Snapshots of the subscriptions of several devices, loaded at once
+    def get_snapshots(self, device_ids, log_service_id):
+        subscriptions = self.get_records(device_ids, log_service_id)
+        return {
+            device_id: DeviceSubscriptionSnapshot(
+                device_id, log_service_id, subscriptions.get(device_id))
+            for device_id in device_ids}
+
+    # Snapshot of the subscription read by read or read_for_history_logs,
+    # it is read from DynamoDB when there is none
+    def get_snapshot(self):
+        snapshot = getattr(self, 'snapshot', None)
+        if (not snapshot or snapshot.device_id != self.device_id or
+                snapshot.log_service_id != self.log_service_id):
+            snapshot = self.refresh_snapshot()
+        return snapshot
+
+    # Read the subscription again with a consistent read, e.g. after a write
+    # made by another process
+    def refresh_snapshot(self):
+        table = self.dynamodb.Table('device_subscriptions')
+        ddb_res = table.get_item(
+            Key={'id': f'{self.device_id}#{self.log_service_id}'},
+            ConsistentRead=True)
+        subscription = None
+        if 'Item' in ddb_res:
+            subscription = self.format_record(
+                self.device_id, self.log_service_id, ddb_res['Item'])
+        self.snapshot = DeviceSubscriptionSnapshot(
+            self.device_id, self.log_service_id, subscription)
+        return self.snapshot
+
+    # Retrieve the subscription records of several devices at once.
+    # ElastiCache is read with one pipelined HGETALL per device; devices
+    # missing from the cache are fetched with BatchGetItem and cached.
+    def get_records(self, device_ids, log_service_id):
+        subscriptions = {}
+        missing_ids = list(device_ids)
+
+        if self.elasticache:
+            pipe = self.elasticache.pipeline(transaction=False)
+            for device_id in device_ids:
+                pipe.hgetall(subscription_cache_key(device_id, log_service_id))
+            missing_ids = []
+            for device_id, sub in zip(device_ids, pipe.execute()):
+                sub = self.convert(sub)
+                if sub and 'status' in sub:
+                    subscriptions[device_id] = self.format_record(
+                        device_id, log_service_id, sub)
+                else:
+                    missing_ids.append(device_id)
+
+        if missing_ids:
+            items = self.batch_get_items(
+                'device_subscriptions',
+                [{'id': f'{device_id}#{log_service_id}'}
+                 for device_id in missing_ids])
+            for item in items:
+                device_id = item['id'].split('#')[0]
+                subscriptions[device_id] = self.format_record(
+                    device_id, log_service_id, item)
+                self.cache_record(item)
+
+        return subscriptions
+
+    def format_record(self, device_id, log_service_id, item):
+        subscription = {
+            'id': device_id,
+            'log_service_id': log_service_id,
+            'status': item['status'],
+            'message': item['message'],
+            'created_at': item['created_at'],
+            'updated_at': item['updated_at']}
+        if 'latest_async_id' in item:
+            subscription['latest_async_id'] = item['latest_async_id']
+        if 'oids' in item:
+            oids = item['oids']
+            if isinstance(oids, str):
+                try:
+                    oids = json.loads(oids)
+                except ValueError:
+                    oids = None
+            if oids is not None:
+                subscription['oids'] = oids
         return subscription
 
+    # Write-through of a full device_subscriptions item into ElastiCache
+    def cache_record(self, item):
+        if not self.elasticache:
+            return
+        if not all(field in item for field in CACHED_FIELDS):
+            # Incomplete item, let the next read repopulate the cache
+            self.elasticache.delete(f"{SUBSCRIPTION_CACHE_PREFIX}:{item['id']}")
+            return
+        value = {field: item[field] for field in CACHED_FIELDS}
+        for field in ('latest_async_id', 'oids'):
+            if field in item:
+                value[field] = item[field]
+        self.write_cache(item['id'], value)
+
+    # Item written by this instance, kept in ElastiCache and in the snapshot
+    def write_through(self, item):
+        self.cache_record(item)
+        self.snapshot = DeviceSubscriptionSnapshot(
+            self.device_id, self.log_service_id,
+            self.format_record(self.device_id, self.log_service_id, item))
+
+    def write_cache(self, ec_id, value):
+        value = {
+            key: (json.dumps(val, default=str) if key == 'oids' else str(val))
+            for key, val in value.items()}
+        key = f'{SUBSCRIPTION_CACHE_PREFIX}:{ec_id}'
+        pipe = self.elasticache.pipeline()
+        pipe.delete(key)
+        pipe.hmset(key, value)
+        pipe.expire(key, subscription_cache_ttl())
+        pipe.execute()
+
     def read_for_history_logs(self, device_id, log_service_id):
         subscription = self.get_record(device_id, log_service_id)
 
@@ -88,6 +176,8 @@ class DeviceSubscription(Base):
 
         self.device_id = device_id
         self.log_service_id = log_service_id
+        self.snapshot = DeviceSubscriptionSnapshot(
+            device_id, log_service_id, subscription)
 
     def insert(self, device_id, log_service_id, error_code):
         self.device_id = device_id
@@ -102,16 +192,18 @@ class DeviceSubscription(Base):
             return None
 
         table = self.dynamodb.Table('device_subscriptions')
+        item = {
+            'id': f'{self.device_id}#{self.log_service_id}',
+            'status': self.status,
+            'message': self.message,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
         try:
             table.put_item(
                 ConditionExpression='attribute_not_exists(id)',
-                Item={
-                    'id': f'{self.device_id}#{self.log_service_id}',
-                    'status': self.status,
-                    'message': self.message,
-                    'created_at': self.created_at,
-                    'updated_at': self.updated_at
-                })
+                Item=item)
+            self.write_through(item)
         except ClientError as e:
             if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
                 self.update(error_code)
@@ -119,7 +211,7 @@ class DeviceSubscription(Base):
     def write_to_ec(self, keys, image):
         ec_id = self.format_key(keys)
         ec_value = self.format_value(image)
-        self.elasticache.hmset(f'device_subscriptions:{ec_id}', ec_value)
+        self.write_cache(ec_id, ec_value)
 
     def update(self, error_code, message=None):
         table = self.dynamodb.Table('device_subscriptions')
@@ -129,7 +221,7 @@ class DeviceSubscription(Base):
         else:
             self.message = device_error_message(self.status)
 
-        table.update_item(
+        res = table.update_item(
             Key={'id': f'{self.device_id}#{self.log_service_id}'},
             ExpressionAttributeNames={'#s': 'status'},
             UpdateExpression="set #s = :s, message = :m, updated_at = :u",
@@ -137,8 +229,10 @@ class DeviceSubscription(Base):
                 ':s': self.status,
                 ':m': self.message,
                 ':u': datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
-                }
+                },
+            ReturnValues='ALL_NEW'
         )
+        self.write_through(res['Attributes'])
 
     def update_as_subscribe_error(self, error, message):
         self.update(error + SUBSCRIBE_CODE_OFFSET, message)
@@ -169,7 +263,7 @@ class DeviceSubscription(Base):
                         'messsage': subscription['message']
                     })
 
-            table.update_item(
+            res = table.update_item(
                 Key={'id': f'{self.device_id}#{self.log_service_id}'},
                 ExpressionAttributeNames={'#s': 'status'},
                 UpdateExpression="set oids = :o, #s = :s, message = :m, updated_at = :u, latest_async_id = :r",
@@ -179,7 +273,9 @@ class DeviceSubscription(Base):
                     ':m': device_error_message(SUBSCRIBED),
                     ':u': datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
                     ':r': async_id
-                    })
+                    },
+                ReturnValues='ALL_NEW')
+            self.write_through(res['Attributes'])
 
             boc_response['subscribe'] = updated_res
         return boc_response
@@ -199,7 +295,7 @@ class DeviceSubscription(Base):
                         'oid': subscription['object_id'],
                         'error_code': subscription['error_code']
                     })
-            table.update_item(
+            res = table.update_item(
                 Key={'id': f'{self.device_id}#{self.log_service_id}'},
                 ExpressionAttributeNames={'#s': 'status'},
                 UpdateExpression="set oids = :o, #s = :s, message = :m, updated_at = :u, latest_async_id = :r",
@@ -209,14 +305,16 @@ class DeviceSubscription(Base):
                     ':m': device_error_message(SUBSCRIBED),
                     ':u': datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
                     ':r': async_id
-                    })
+                    },
+                ReturnValues='ALL_NEW')
+            self.write_through(res['Attributes'])
 
             boc_response['notifications'] = updated_res
         return boc_response
 
     def delete_from_ec(self, keys):
         ec_id = self.format_key(keys)
-        self.elasticache.delete(f'device_subscriptions:{ec_id}')
+        self.elasticache.delete(f'{SUBSCRIPTION_CACHE_PREFIX}:{ec_id}')
 
     def get_message(self):
         return self.message
@@ -228,30 +326,10 @@ class DeviceSubscription(Base):
         return self.log_service_id
 
     def get_subscribed_oids(self):
-        table = self.dynamodb.Table('device_subscriptions')
-        ddb_res = table.get_item(Key={
-            'id': f'{self.device_id}#{self.log_service_id}'
-        })
-
-        if 'Item' in ddb_res and 'oids' in ddb_res['Item']:
-            oid_list = []
-            for subscription in ddb_res['Item']['oids']:
-                oid_list.append(subscription['oid'])
-
-            return oid_list
-        else:  # subscribed but device_offline
-            return ServiceOid().read(self.log_service_id)['oids']
+        return self.get_snapshot().get_subscribed_oids()
 
     def has_oids_field(self):
-        table = self.dynamodb.Table('device_subscriptions')
-        ddb_res = table.get_item(Key={
-            'id': f'{self.device_id}#{self.log_service_id}'
-        })
-        if ('Item' in ddb_res and 'oids' in ddb_res['Item']
-            and ddb_res['Item']['oids']):
-            return True
-        else:
-            return False
+        return self.get_snapshot().has_oids_field()
 
     def is_existing(self):
         return hasattr(self, 'device_id')
@@ -299,12 +377,16 @@ class DeviceSubscription(Base):
         }
 
     def get_device_status(self, device_id, service_id):
-        table = self.dynamodb.Table('device_subscriptions')
-        status = table.query(
-            KeyConditionExpression=Key('id').eq(device_id + '#' + service_id),
-            FilterExpression=Attr('status').eq(1200) | Attr('status').eq(1201)
-        )
-        return status['Items']
+        return self.get_device_statuses([device_id], service_id).get(device_id, [])
+
+    # Subscribed (online or offline) records of several devices,
+    # retrieved with BatchGetItem and keyed by device_id
+    def get_device_statuses(self, device_ids, service_id):
+        items = self.batch_get_items(
+            'device_subscriptions',
+            [{'id': device_id + '#' + service_id} for device_id in device_ids])
+        return {item['id'].split('#')[0]: [item] for item in items
+                if item.get('status') in (SUBSCRIBED, SUBSCRIBED_OFFLINE)}
 
     def verify_subscribe(self, device_id, service_id):
         table = self.dynamodb.Table('device_subscriptions')
@@ -316,6 +398,64 @@ class DeviceSubscription(Base):
         else:
             return False
 
+# Subscription record of a device read once (from ElastiCache or DynamoDB),
+# its fields are then served from memory. 'record' is the formatted record
+# of DeviceSubscription.format_record, None when the device is not found.
+class DeviceSubscriptionSnapshot(object):
+    def __init__(self, device_id, log_service_id, record):
+        self.device_id = device_id
+        self.log_service_id = log_service_id
+        self.record = record
+
+    def is_existing(self):
+        return self.record is not None
+
+    def get(self, field):
+        return self.record.get(field) if self.record else None
+
+    def get_status(self):
+        status = self.get('status')
+        return int(status) if status is not None else None
+
+    def get_message(self):
+        return self.get('message')
+
+    def get_latest_async_id(self):
+        return self.get('latest_async_id')
+
+    def get_created_at(self):
+        return self.get('created_at')
+
+    def get_updated_at(self):
+        return self.get('updated_at')
+
+    # Object ids of the 'oids' field, None when the record has none
+    def get_oids(self):
+        oids = self.get('oids')
+        if oids is None:
+            return None
+        return [subscription['oid'] for subscription in oids]
+
+    def has_oids_field(self):
+        return bool(self.get('oids'))
+
+    def get_subscribed_oids(self):
+        oids = self.get_oids()
+        if oids is not None:
+            return oids
+        else:  # subscribed but device_offline
+            return ServiceOid().read(self.log_service_id)['oids']
+
+
+def subscription_cache_key(device_id, log_service_id):
+    return f'{SUBSCRIPTION_CACHE_PREFIX}:{device_id}#{log_service_id}'
+
+
+def subscription_cache_ttl():
+    return int(environ.get(
+        'SUBSCRIPTION_CACHE_TTL', DEFAULT_SUBSCRIPTION_CACHE_TTL))
+
+
 def device_error_message(error_code):
     error_map = {
         NOT_SUBSCRIBED: 'Not subscribed',
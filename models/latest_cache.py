@@ -0,0 +1,84 @@
+import logging
+from redis import RedisError
+
+# Latest log of every device_id#object_id and latest network status of every
+# device, kept in ElastiCache hashes by the ingestion path (write-through).
+# Hashes are versioned by their timestamp: a record older than the cached
+# one is ignored, so that writes arriving out of order never move the cache
+# backwards.
+
+logger = logging.getLogger('latest_cache')
+logger.setLevel(logging.INFO)
+
+DEVICE_LOG_PREFIX = 'device_log:'
+DEVICE_NETWORK_STATUS_PREFIX = 'device_network_status:'
+
+# KEYS[1]: hash, ARGV[1]: timestamp of the record, ARGV[2..]: field, value...
+SET_IF_NOT_OLDER = """
+local current = redis.call('HGET', KEYS[1], 'timestamp')
+if current and current > ARGV[1] then
+    return 0
+end
+redis.call('HMSET', KEYS[1], unpack(ARGV, 2))
+return 1
+"""
+
+# KEYS[1]: hash, ARGV[1]: timestamp observed before ('' when missing),
+# ARGV[2..]: field, value... of the replacement, none to delete the hash
+REPLACE_IF_UNCHANGED = """
+local current = redis.call('HGET', KEYS[1], 'timestamp')
+if (current or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+if #ARGV > 1 then
+    redis.call('HMSET', KEYS[1], unpack(ARGV, 2))
+end
+return 1
+"""
+
+
+def device_log_key(log_id):
+    return DEVICE_LOG_PREFIX + log_id
+
+
+def device_network_status_key(device_id):
+    return DEVICE_NETWORK_STATUS_PREFIX + device_id
+
+
+# Cache several records in one pipeline. 'records' is a list of
+# (key, mapping), every mapping has a 'timestamp'. The cache is best effort:
+# it is repaired by functions/latest_cache/handler.reconcile.
+def put_latest(elasticache, records):
+    if not elasticache or not records:
+        return
+    try:
+        script = elasticache.register_script(SET_IF_NOT_OLDER)
+        pipe = elasticache.pipeline(transaction=False)
+        for key, mapping in records:
+            script(keys=[key], args=[mapping['timestamp']] + fields(mapping),
+                   client=pipe)
+        return pipe.execute()
+    except RedisError as e:
+        logger.warning(f'latest cache not updated: {e}')
+
+
+# Replace (or delete when the mapping is None) hashes unless they changed
+# since they were read. 'repairs' is a list of (key, observed timestamp,
+# mapping).
+def replace_latest(elasticache, repairs):
+    if not repairs:
+        return []
+    script = elasticache.register_script(REPLACE_IF_UNCHANGED)
+    pipe = elasticache.pipeline(transaction=False)
+    for key, observed, mapping in repairs:
+        script(keys=[key], args=[observed or ''] + fields(mapping or {}),
+               client=pipe)
+    return pipe.execute()
+
+
+def fields(mapping):
+    args = []
+    for field, value in mapping.items():
+        args.extend([field, value])
+    return args
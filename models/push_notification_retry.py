@@ -0,0 +1,243 @@
+import datetime
+import logging
+import random
+import zlib
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from helpers import time_functions
+from models.base import Base
+
+logger = logging.getLogger('push_notification_retries')
+logger.setLevel(logging.INFO)
+
+# Push notifications which could not be delivered, one per
+# reporting_id#object_id: the features of a newer notification are merged
+# into the queued one, every feature keeping its most recent value.
+# Deliveries are retried with an exponential backoff, up to MAX_ATTEMPTS.
+# Queued notifications are spread over QUEUE_SHARDS partitions
+# (retry_queue 'queued#0' to 'queued#9') of the due_notifications index,
+# sorted by next_attempt_at, so that no single partition takes every write.
+RETRY_BASE_SECONDS = 60
+RETRY_MAX_SECONDS = 3600
+MAX_ATTEMPTS = 10
+MAX_PUT_ATTEMPTS = 5
+DUE_INDEX = 'due_notifications'
+QUEUE = 'queued'
+QUEUE_SHARDS = 10
+# A claimed notification is due again after CLAIM_SECONDS, twice the timeout
+# of a drain, in case the drain claiming it does not complete
+CLAIM_SECONDS = 600
+
+
+class PushNotificationRetry(Base):
+    def __init__(self):
+        super().__init__()
+        self.table = self.dynamodb.Table('push_notification_retries')
+
+    # Queue the notification, merged per feature with the one already
+    # queued for the same reporting_id#object_id. The backoff of the queued
+    # notification is kept. Writes are conditional on the version of the
+    # queued notification so concurrent writers retry.
+    def put(self, reporting_id, object_id, timestamp, data, notify_url):
+        key = retry_id(reporting_id, object_id)
+        for attempt in range(MAX_PUT_ATTEMPTS):
+            queued = self.table.get_item(
+                Key={'id': key}, ConsistentRead=True).get('Item')
+            try:
+                if queued:
+                    self.merge(queued, timestamp, data, notify_url)
+                else:
+                    self.insert(
+                        key, reporting_id, object_id, timestamp, data,
+                        notify_url)
+                return True
+            except ClientError as e:
+                # Concurrent write on the same notification, read it again
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+        logger.warning(
+            f'push notification {key} at {timestamp} not queued '
+            f'after {MAX_PUT_ATTEMPTS} attempts')
+        return False
+
+    def insert(self, key, reporting_id, object_id, timestamp, data, notify_url):
+        now = datetime.datetime.now()
+        self.table.put_item(
+            Item={
+                'id': key,
+                'reporting_id': reporting_id,
+                'object_id': object_id,
+                'timestamp': timestamp,
+                'data': merge_features([], timestamp, data),
+                'notify_url': notify_url,
+                'version': 1,
+                'retry_queue': queue_shard(key),
+                'attempts': 1,
+                'next_attempt_at': time_functions.unparse_time(
+                    now + datetime.timedelta(seconds=backoff_seconds(1))),
+                'created_at': time_functions.unparse_time(now),
+                'updated_at': time_functions.unparse_time(now)
+            },
+            ConditionExpression='attribute_not_exists(id)')
+
+    # The notification takes the timestamp and notify_url of the most
+    # recent of the two
+    def merge(self, queued, timestamp, data, notify_url):
+        latest = timestamp
+        if queued['timestamp'] > timestamp:
+            latest = queued['timestamp']
+            notify_url = queued['notify_url']
+        self.table.update_item(
+            Key={'id': queued['id']},
+            UpdateExpression=(
+                'SET #ts = :ts, #d = :d, notify_url = :u, updated_at = :now, '
+                'version = version + :one'),
+            ConditionExpression='version = :v',
+            ExpressionAttributeNames={'#ts': 'timestamp', '#d': 'data'},
+            ExpressionAttributeValues={
+                ':ts': latest,
+                ':d': merge_features(queued['data'], timestamp, data),
+                ':u': notify_url,
+                ':now': time_functions.unparse_time(datetime.datetime.now()),
+                ':one': 1,
+                ':v': queued['version']
+            })
+
+    # Up to limit queued notifications whose next attempt is due, only the
+    # due ones of every shard are read from the index. Shards are read from
+    # a random one so that a backlog in the first shards does not starve the
+    # others.
+    def get_due(self, limit):
+        now = time_functions.unparse_time(datetime.datetime.now())
+        first = random.randrange(QUEUE_SHARDS)
+        items = []
+        for i in range(QUEUE_SHARDS):
+            query_params = {
+                'IndexName': DUE_INDEX,
+                'KeyConditionExpression': (
+                    Key('retry_queue').eq(f'{QUEUE}#{(first + i) % QUEUE_SHARDS}') &
+                    Key('next_attempt_at').lte(now))}
+            response = {}
+            while len(items) < limit:
+                if 'LastEvaluatedKey' in response:
+                    query_params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+                response = self.table.query(
+                    Limit=limit - len(items), **query_params)
+                items.extend(response['Items'])
+                if 'LastEvaluatedKey' not in response:
+                    break
+        return items
+
+    # Push the next attempt of a due notification CLAIM_SECONDS forward
+    # before sending it. Overlapping drains which read the same
+    # notification fail to claim it and skip it.
+    def claim(self, item):
+        try:
+            self.table.update_item(
+                Key={'id': item['id']},
+                UpdateExpression='SET next_attempt_at = :claimed',
+                ConditionExpression='version = :v AND next_attempt_at = :next',
+                ExpressionAttributeValues={
+                    ':claimed': time_functions.unparse_time(
+                        datetime.datetime.now() +
+                        datetime.timedelta(seconds=CLAIM_SECONDS)),
+                    ':v': item['version'],
+                    ':next': item['next_attempt_at']
+                })
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return False
+
+    # Delete the notification unless features have been merged into it in
+    # the meantime
+    def delete(self, item):
+        try:
+            self.table.delete_item(
+                Key={'id': item['id']},
+                ConditionExpression='version = :v',
+                ExpressionAttributeValues={':v': item['version']})
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return False
+
+    # Schedule the next attempt, or give up after MAX_ATTEMPTS
+    def reschedule(self, item):
+        attempts = int(item['attempts']) + 1
+        if attempts > MAX_ATTEMPTS:
+            logger.error(
+                f'push notification {item["id"]} at {item["timestamp"]} '
+                f'to {item["notify_url"]} dropped after {MAX_ATTEMPTS} attempts')
+            return self.delete(item)
+        now = datetime.datetime.now()
+        try:
+            self.table.update_item(
+                Key={'id': item['id']},
+                UpdateExpression=(
+                    'SET attempts = :attempts, next_attempt_at = :next, '
+                    'updated_at = :now'),
+                ConditionExpression='version = :v',
+                ExpressionAttributeValues={
+                    ':attempts': attempts,
+                    ':next': time_functions.unparse_time(now + datetime.timedelta(
+                        seconds=backoff_seconds(attempts))),
+                    ':now': time_functions.unparse_time(now),
+                    ':v': item['version']
+                })
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return False
+
+
+def retry_id(reporting_id, object_id):
+    return f'{reporting_id}#{object_id}'
+
+
+# Partition of the due_notifications index of a notification, stable
+# across invocations unlike hash()
+def queue_shard(key):
+    return f'{QUEUE}#{zlib.crc32(key.encode()) % QUEUE_SHARDS}'
+
+
+# Features of the queued notification updated by the features of a
+# notification at timestamp. Every feature keeps the timestamp of its value.
+def merge_features(queued, timestamp, data):
+    features = {feature['feature_name']: feature for feature in queued}
+    for feature in data:
+        name = feature['feature_name']
+        if name not in features or features[name]['timestamp'] <= timestamp:
+            features[name] = dict(feature, timestamp=timestamp)
+    return list(features.values())
+
+
+# Features of the item without those whose status has been updated since,
+# their newer value has already been notified or merged into the item
+def pending_features(item, status):
+    if not status:
+        return item['data']
+    return [
+        feature for feature in item['data']
+        if feature['feature_name'] not in status.data or
+        status.data[feature['feature_name']]['timestamp'] <= feature['timestamp']]
+
+
+# Push notification payload of the item
+def notification(item, features):
+    return {
+        'reporting_id': item['reporting_id'],
+        'object_id': item['object_id'],
+        'timestamp': item['timestamp'],
+        'data': [
+            {'feature_name': feature['feature_name'], 'value': feature['value']}
+            for feature in features]
+    }
+
+
+# Delay before the next attempt once `attempts` deliveries have failed
+def backoff_seconds(attempts):
+    return min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
@@ -20,3 +20,19 @@ class PushNotificationSubscription(Base):
 
     def is_subscribed(self):
         return hasattr(self, 'notify_url')
+
+    # Read the subscriptions of several (log_service_id, object_id) keys with
+    # BatchGetItem. Returns a PushNotificationSubscription per existing key.
+    def batch_read(self, keys):
+        items = self.batch_get_items(
+            'push_notification_subscriptions',
+            [{'log_service_id': log_service_id, 'object_id': object_id}
+             for log_service_id, object_id in keys])
+        subscriptions = {}
+        for item in items:
+            subscription = PushNotificationSubscription()
+            subscription.log_service_id = item['log_service_id']
+            subscription.object_id = item['object_id']
+            subscription.notify_url = item['notify_url']
+            subscriptions[(item['log_service_id'], item['object_id'])] = subscription
+        return subscriptions
@@ -1,5 +1,19 @@
+import copy
+import threading
+import time
+from os import environ
 from models.base import Base
 
+# Process wide catalog of the service_oids table. The table is small and
+# rarely changes, so it is scanned once per (warm) Lambda container and
+# scanned again after SERVICE_OID_CATALOG_TTL seconds.
+
+DEFAULT_SERVICE_OID_CATALOG_TTL = 300  # In Seconds
+
+_lock = threading.Lock()
+_catalog = None
+_loaded_at = 0
+
 
 class ServiceOid(Base):
     def __init__(self):
@@ -7,21 +21,68 @@ class ServiceOid(Base):
 
     @classmethod
     def ids(cls):
-        t = ServiceOid().dynamodb.Table('service_oids')
-        result = t.scan(AttributesToGet=['id'])
-        if 'Items' in result:
-            return [item['id'] for item in result['Items']]
+        return list(ServiceOid().catalog().keys())
+
+    # Items are copies callers are free to modify
+    def read(self, log_service_id):
+        item = self.catalog().get(log_service_id)
+        if item is None:
+            item = self.read_missing(log_service_id)
+        if item:
+            return copy.deepcopy(item)
         else:
             return False
 
-    def read(self, log_service_id):
+    # Items of the table by id, in scan order
+    def catalog(self):
+        global _catalog, _loaded_at
+        if _catalog is None or is_expired(_loaded_at):
+            with _lock:
+                if _catalog is None or is_expired(_loaded_at):
+                    _catalog = self.scan()
+                    _loaded_at = time.monotonic()
+        return _catalog
+
+    def scan(self):
+        table = self.dynamodb.Table('service_oids')
+        response = table.scan()
+        items = response['Items']
+        while 'LastEvaluatedKey' in response:
+            response = table.scan(
+                ExclusiveStartKey=response['LastEvaluatedKey'])
+            items.extend(response['Items'])
+        return {item['id']: item for item in items}
+
+    # A service added since the catalog was loaded is read and added to it
+    def read_missing(self, log_service_id):
+        global _catalog
         table = self.dynamodb.Table('service_oids')
         result = table.get_item(
             Key={
                 'id': log_service_id
             }
         )
-        if 'Item' in result:
-            return result['Item']
-        else:
-            return False
+        if 'Item' not in result:
+            return None
+        with _lock:
+            if _catalog is not None:
+                _catalog = dict(_catalog)
+                _catalog[log_service_id] = result['Item']
+        return result['Item']
+
+
+def is_expired(loaded_at):
+    return time.monotonic() - loaded_at >= catalog_ttl()
+
+
+def catalog_ttl():
+    return int(environ.get(
+        'SERVICE_OID_CATALOG_TTL', DEFAULT_SERVICE_OID_CATALOG_TTL))
+
+
+# Drop the catalog, e.g. when the table has been changed by tests
+def reset():
+    global _catalog, _loaded_at
+    with _lock:
+        _catalog = None
+        _loaded_at = 0
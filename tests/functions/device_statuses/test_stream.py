@@ -1,4 +1,5 @@
 import unittest
+import copy
 import json
 import logging
 from os import path
@@ -91,7 +92,7 @@ class StreamTestCase(unittest.TestCase):
             self.assertTrue('value' in data)
             self.assertTrue('timestamp' in data)
             self.assertEqual(data['timestamp'], input['Records'][0]['dynamodb']['NewImage']['timestamp']['S'])
-        mock.assert_called_with('invoking lambda function:send_push_notification with payload: {"reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0000", "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0", "timestamp": "2017-02-01T12:23:01", "data": [{"feature_name": "Drum_Unit", "value": "1"}, {"feature_name": "Drum_Count", "value": "11"}, {"feature_name": "TonerInk_Black", "value": "1"}, {"feature_name": "TonerInk_LifeBlack", "value": "9900"}, {"feature_name": "LaserUnit_Status", "value": "1"}, {"feature_name": "FuserUnit_Status", "value": "1"}, {"feature_name": "PFKitMP_Status", "value": "1"}, {"feature_name": "PFKit1_Status", "value": "1"}, {"feature_name": "PFKit2_Status", "value": "1"}, {"feature_name": "PFKit3_Status", "value": "1"}, {"feature_name": "PFKit4_Status", "value": "1"}, {"feature_name": "PFKit5_Status", "value": "1"}], "notify_url": "http://dummy.com"}')
+        mock.assert_called_with('invoking lambda function:send_push_notification with payload: {"events": [{"reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0000", "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0", "timestamp": "2017-02-01T12:23:01", "data": [{"feature_name": "Drum_Unit", "value": "1"}, {"feature_name": "Drum_Count", "value": "11"}, {"feature_name": "TonerInk_Black", "value": "1"}, {"feature_name": "TonerInk_LifeBlack", "value": "9900"}, {"feature_name": "LaserUnit_Status", "value": "1"}, {"feature_name": "FuserUnit_Status", "value": "1"}, {"feature_name": "PFKitMP_Status", "value": "1"}, {"feature_name": "PFKit1_Status", "value": "1"}, {"feature_name": "PFKit2_Status", "value": "1"}, {"feature_name": "PFKit3_Status", "value": "1"}, {"feature_name": "PFKit4_Status", "value": "1"}, {"feature_name": "PFKit5_Status", "value": "1"}]}], "notify_url": "http://dummy.com"}')
 
     def test_updated_cloud_device_status(self):
         with open(
@@ -137,6 +138,85 @@ class StreamTestCase(unittest.TestCase):
         after = get_cloud_device_status(self, id[0], id[1])
         self.assertEqual(before, after)
 
+    def test_cloud_device_status_batch(self):
+        with open(
+                f'{self.path}/../../data/device_statuses/stream/cloud/updated_status.json'
+                ) as data_file:
+            input = json.load(data_file)
+        record = input['Records'][0]
+        id = record['dynamodb']['Keys']['id']['S'].split('#')
+        before = get_cloud_device_status(self, id[0], id[1])
+
+        # A record of an unregistered device does not stop the batch and
+        # a later unchanged record of the same key is collapsed
+        unregistered = copy.deepcopy(record)
+        unregistered['dynamodb']['Keys']['id']['S'] = '00000000-0000-0000-0000-000000000000#' + id[1]
+        unchanged = copy.deepcopy(record)
+        unchanged['dynamodb']['NewImage']['timestamp']['S'] = '2017-02-05T12:23:01'
+        input['Records'] = [unregistered, record, unchanged]
+        stream.save_cloud_device_status(input, 'dummy')
+
+        after = get_cloud_device_status(self, id[0], id[1])
+        self.assertEqual(after['timestamp'], record['dynamodb']['NewImage']['timestamp']['S'])
+        self.assertEqual(after['created_at'], before['created_at'])
+        self.assertNotEqual(
+            after['data']['TonerInk_LifeBlack']['value'],
+            before['data']['TonerInk_LifeBlack']['value'])
+
+    @patch('logging.info')
+    def test_failed_key_of_cloud_device_status_batch(self, mock):
+        records = []
+        for name in ['new_status', 'updated_status']:
+            with open(
+                    f'{self.path}/../../data/device_statuses/stream/cloud/{name}.json'
+                    ) as data_file:
+                records.extend(json.load(data_file)['Records'])
+        new_id = records[0]['dynamodb']['Keys']['id']['S'].split('#')
+        updated_id = records[1]['dynamodb']['Keys']['id']['S'].split('#')
+        before = get_cloud_device_status(self, updated_id[0], updated_id[1])
+
+        # Applying the logs of the updated key fails, the new key of the
+        # same batch is still saved and notified
+        apply_cloud_device_logs = stream.apply_cloud_device_logs
+
+        def apply_or_fail(reporting_id, object_id, status, records):
+            if status is not None:
+                raise KeyError('Drum_Unit')
+            return apply_cloud_device_logs(
+                reporting_id, object_id, status, records)
+
+        with patch.object(stream, 'apply_cloud_device_logs',
+                          side_effect=apply_or_fail):
+            stream.save_cloud_device_status({'Records': records}, 'dummy')
+
+        self.assertTrue(get_cloud_device_status(self, new_id[0], new_id[1]))
+        self.assertEqual(
+            get_cloud_device_status(self, updated_id[0], updated_id[1]), before)
+        mock.assert_called_once()
+        self.assertIn(
+            '"reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0000"',
+            mock.call_args[0][0])
+        self.assertNotIn(
+            '"reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0001"',
+            mock.call_args[0][0])
+
+    def test_failed_read_of_cloud_device_status_batch(self):
+        with open(
+                f'{self.path}/../../data/device_statuses/stream/cloud/updated_status.json'
+                ) as data_file:
+            json_data = json.load(data_file)
+        device_id, object_id = json_data['Records'][0]['dynamodb']['Keys']['id']['S'].split('#')
+        before = get_cloud_device_status(self, device_id, object_id)
+
+        # A failed read of the batch raises so that the stream retries it
+        with patch.object(stream.DeviceStatus, 'batch_read',
+                          side_effect=KeyError('device_status')):
+            with self.assertRaises(KeyError):
+                stream.save_cloud_device_status(json_data, 'dummy')
+
+        self.assertEqual(
+            get_cloud_device_status(self, device_id, object_id), before)
+
     @patch('logging.info')
     def test_unsubscribed_cloud_device_status(self, mock):
         with open(
@@ -208,7 +288,7 @@ class StreamTestCase(unittest.TestCase):
                 self.assertEqual(data['timestamp'], timestamp)
                 self.assertEqual(data['value'], input['Records'][0]['dynamodb']['NewImage'][feature]['S'])
 
-        mock.assert_called_with('invoking lambda function:send_push_notification with payload: {"reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0005", "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0", "timestamp": "2017-02-01T12:23:01", "data": [{"feature_name": "Drum_Count", "value": "2"}, {"feature_name": "TonerInk_Black", "value": "40"}, {"feature_name": "TonerInk_Cyan", "value": "50"}], "notify_url": "http://dummy.com"}')
+        mock.assert_called_with('invoking lambda function:send_push_notification with payload: {"events": [{"reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0005", "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0", "timestamp": "2017-02-01T12:23:01", "data": [{"feature_name": "Drum_Count", "value": "2"}, {"feature_name": "TonerInk_Black", "value": "40"}, {"feature_name": "TonerInk_Cyan", "value": "50"}]}], "notify_url": "http://dummy.com"}')
 
     @patch('logging.info')
     def test_updated_email_device_status(self, mock):
@@ -228,7 +308,7 @@ class StreamTestCase(unittest.TestCase):
                     self.assertEqual(device_status['timestamp'], timestamp)
                     self.assertEqual(data['timestamp'], timestamp)
                     self.assertEqual(data['value'], input['Records'][0]['dynamodb']['NewImage'][feature]['S'])
-        mock.assert_called_with('invoking lambda function:send_push_notification with payload: {"reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0006", "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0", "timestamp": "2017-02-05T12:23:01", "data": [{"feature_name": "Drum_Count", "value": "2"}, {"feature_name": "TonerInk_Black", "value": "40"}, {"feature_name": "TonerInk_Cyan", "value": "50"}], "notify_url": "http://dummy.com"}')
+        mock.assert_called_with('invoking lambda function:send_push_notification with payload: {"events": [{"reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0006", "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0", "timestamp": "2017-02-05T12:23:01", "data": [{"feature_name": "Drum_Count", "value": "2"}, {"feature_name": "TonerInk_Black", "value": "40"}, {"feature_name": "TonerInk_Cyan", "value": "50"}]}], "notify_url": "http://dummy.com"}')
 
     @patch('logging.info')
     def test_unchanged_email_device_status(self, mock):
@@ -320,8 +400,11 @@ class StreamTestCase(unittest.TestCase):
                 self.assertTrue('value' in data)
                 self.assertTrue('timestamp' in data)
                 self.assertEqual(data['timestamp'], timestamp)
-        self.assertEqual(mock.call_count, 4)
-        mock.assert_called_with('invoking lambda function:send_push_notification with payload: {"reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0005", "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.52.3.1.3.17", "timestamp": "2017-02-01T12:23:01", "data": {"feature_name": "counter_value", "value": "2"}, "notify_url": "http://dummy.com"}')
+        self.assertEqual(mock.call_count, 1)
+        payload = json.loads(mock.call_args[0][0].split('payload: ', 1)[1])
+        self.assertEqual(payload['notify_url'], 'http://dummy.com')
+        self.assertEqual(len(payload['events']), 4)
+        self.assertEqual(payload['events'][-1], {"reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0005", "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.52.3.1.3.17", "timestamp": "2017-02-01T12:23:01", "data": [{"feature_name": "counter_value", "value": "2"}]})
 
     @patch('logging.info')
     def test_updated_email_count_type_status(self, mock):
@@ -345,7 +428,7 @@ class StreamTestCase(unittest.TestCase):
                 self.assertTrue(device_status in before)
         self.assertEqual(updated_count, 2)
         self.assertEqual(mock.call_count, 1)
-        mock.assert_called_with('invoking lambda function:send_push_notification with payload: {"reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0007", "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.52.3.1.3.1", "timestamp": "2017-02-02T12:23:01", "data": {"feature_name": "counter_value", "value": "updated"}, "notify_url": "http://dummy.com"}')
+        mock.assert_called_with('invoking lambda function:send_push_notification with payload: {"events": [{"reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0007", "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.52.3.1.3.1", "timestamp": "2017-02-02T12:23:01", "data": [{"feature_name": "counter_value", "value": "updated"}]}], "notify_url": "http://dummy.com"}')
 
 
 def get_cloud_device_status(self, device_id, object_id):
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+from functions.email_notifications import country_config
+
+
+class CountryConfigTestCase(unittest.TestCase):
+    def setUp(self):
+        country_config.reset()
+        fd, self.path = tempfile.mkstemp(suffix='.yml')
+        os.close(fd)
+        self.write(
+            "CountryConfig:\n"
+            "  de:\n"
+            "    email_enabled: true\n"
+            "    subject_list: 'E-Mail-Bericht|E-mail Report'\n"
+            "  fr:\n"
+            "    email_enabled: false\n"
+            "    subject_list: 'Rapport de courriel'\n", 1000000000)
+
+    def tearDown(self):
+        country_config.reset()
+        os.remove(self.path)
+
+    def write(self, content, mtime):
+        with open(self.path, 'w') as config:
+            config.write(content)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_countries(self):
+        countries = country_config.countries(self.path)
+        self.assertTrue(countries['de'].email_enabled)
+        self.assertFalse(countries['fr'].email_enabled)
+        self.assertEqual(
+            ['E-Mail-Bericht', 'E-mail Report'], countries['de'].subject_list)
+        self.assertTrue(countries['de'].is_report_subject('Fw: E-mail Report 2'))
+        self.assertFalse(countries['de'].is_report_subject('E-mail (Report)'))
+
+    def test_config_is_cached_until_modified(self):
+        countries = country_config.countries(self.path)
+        self.assertIs(countries, country_config.countries(self.path))
+
+        self.write(
+            "CountryConfig:\n"
+            "  fr:\n"
+            "    email_enabled: true\n"
+            "    subject_list: 'Rapport (courriel)'\n", 1000000001)
+        countries = country_config.countries(self.path)
+        self.assertNotIn('de', countries)
+        self.assertTrue(countries['fr'].is_report_subject('Rapport (courriel)'))
+
+    def test_stage_config(self):
+        countries = country_config.countries(country_config.config_path('local'))
+        self.assertIn('de', countries)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,6 @@
+import base64
+import email
+import io
 import logging
 import unittest
 import json
@@ -37,7 +40,7 @@ class EmailNotificationTestCase(unittest.TestCase):
 		self.assertEqual(None, res)
 		self.assertRaises(ValueError)
 
-	@patch.object(DeviceEmailLog, 'create')
+	@patch.object(DeviceEmailLog, 'batch_create')
 	def test_database_connection_error_on_email_notifications(self, mock):
 		mock.side_effect = ConnectionError
 		event_data = json.load(open('tests/data/email_notifications/successful_csv_event.json'))
@@ -135,6 +138,102 @@ class EmailNotificationTestCase(unittest.TestCase):
 		self.assertTrue('serial_number' in after_keys[0])
 		self.assertTrue('timestamp' in after_keys[0])
 
+	def test_read_attachments(self):
+		with open('tests/data/email/DL-FB CSV.eml', 'rb') as eml:
+			raw_email = eml.read()
+		attachment = raw_email[
+			raw_email.rindex(b'--boundary_str\r\n'):raw_email.rindex(b'--boundary_str--')]
+		raw_email = raw_email.replace(
+			b'--boundary_str--',
+			b'--boundary_str\r\nContent-Type: text/plain\r\n\r\n' +
+			b'x' * 10 * handler.MAIL_CHUNK_SIZE + b'\r\n' +
+			attachment.replace(b'Report.csv', b'Report2.csv') +
+			b'--boundary_str--')
+		attachments = handler.read_attachments(io.BytesIO(raw_email))
+		self.assertEqual(
+			['Report.csv', 'Report2.csv'],
+			[attachment.get_filename() for attachment in attachments])
+		self.assertTrue(
+			attachments[1].get_payload(decode=True).startswith(b'URL,'))
+
+	def test_successful_batch_of_mails(self):
+		table = self.dynamodb.Table('device_email_logs')
+		before_keys = table.scan()['Items']
+		event_data = json.load(open('tests/data/email_notifications/successful_csv_event.json'))
+		xml_event_data = json.load(open('tests/data/email_notifications/successful_xml_event_with_charset.json'))
+		invalid_event_data = json.load(open('tests/data/email_notifications/invalid_request_event.json'))
+		event_data['Records'].extend(
+			invalid_event_data['Records'] + xml_event_data['Records'])
+		res = run_func(
+			event = event_data,
+			context = []
+			)
+		after_keys = table.scan()['Items']
+		self.assertEqual(None, res)
+		self.assertEqual((len(after_keys)-len(before_keys)), 2)
+
+	def test_malformed_xml_in_batch_of_mails(self):
+		with open('tests/data/email/DL-FBwithoutChar XML.eml', 'rb') as eml:
+			msg = email.message_from_bytes(eml.read())
+		for part in msg.walk():
+			if part.get_filename() == 'Report.xml':
+				part.set_payload(
+					base64.b64encode(b'<Report><Total>1</Report>').decode())
+		self.s3client.Bucket('email-test').put_object(
+			Key='Malformed XML.eml', Body=msg.as_bytes())
+
+		table = self.dynamodb.Table('device_email_logs')
+		before_keys = table.scan()['Items']
+		event_data = json.load(open('tests/data/email_notifications/successful_csv_event.json'))
+		malformed_event_data = json.load(open('tests/data/email_notifications/successful_xml_event_without_charset.json'))
+		for record in malformed_event_data['Records']:
+			message = json.loads(record['Sns']['Message'])
+			message['receipt']['action']['objectKey'] = 'Malformed XML.eml'
+			record['Sns']['Message'] = json.dumps(message)
+		xml_event_data = json.load(open('tests/data/email_notifications/successful_xml_event_with_charset.json'))
+		event_data['Records'].extend(
+			malformed_event_data['Records'] + xml_event_data['Records'])
+		res = run_func(
+			event = event_data,
+			context = []
+			)
+		after_keys = table.scan()['Items']
+		self.assertEqual(None, res)
+		self.assertEqual((len(after_keys)-len(before_keys)), 2)
+
+	def test_parse_xml(self):
+		res = handler.parse_xml(
+			'<?xml version="1.0" encoding="UTF-8"?>'
+			'<r:Info xmlns:r="http://schemas.brother.info/mfc/mailreports/">'
+			'<r:Date>ignored</r:Date>'
+			'<r:DeviceInfo><r:SerialNumber>000g01a3p145339</r:SerialNumber>'
+			'<r:ModelName></r:ModelName></r:DeviceInfo>'
+			'<r:DeviceReport><r:RemainingLife>'
+			'<r:DrumUnit Unit="pages">24645</r:DrumUnit>'
+			'<r:DrumUnit Unit="percent">99.00</r:DrumUnit>'
+			'</r:RemainingLife><r:Unknown><r:Total>1</r:Total></r:Unknown>'
+			'</r:DeviceReport></r:Info>')
+		self.assertEqual({
+			'serial_number': '000G01A3P145339',
+			'Device_Type': ' ',
+			'Drum_Unit_Remaining_Life': '24645'}, res)
+
+
+	def test_parse_csv_with_trailing_blank_line(self):
+		res = handler.parse_csv(
+			'Serial,Total\r\nabc,10\r\n\r\n',
+			{'Serial': 'serial_number', 'Total': 'total'})
+		self.assertEqual({'serial_number': 'ABC', 'total': '10'}, res)
+
+	@patch.object(handler, 'parse_attachment')
+	@patch.object(handler, 'retrieve_attachments')
+	def test_report_without_serial_number(self, retrieve_mock, parse_mock):
+		retrieve_mock.return_value = [handler.MailPart([])]
+		parse_mock.return_value = {'serial_number': ' ', 'total': '10'}
+		self.assertEqual([], handler.mail_reports({
+			'bucket_name': 'bucket', 'object_key': 'key',
+			'region_name': 'us-east-1', 'timestamp': '2018-01-01T00:00:00'}))
+
 
 def main():
 	unittest.main()
@@ -5,6 +5,7 @@ import json
 import logging
 from models.device_email_log import DeviceEmailLog
 from models.device_log import DeviceLog
+from models.device_subscription import DeviceSubscription
 from os import path
 from tests.functions import test_helper
 import unittest
@@ -808,6 +809,24 @@ class TestGetHistoryLogs(unittest.TestCase):
         self.assertEqual(output['code'], 204)
         self.assertEqual(output['message'], 'Logs Not Found')
 
+    def test_email_boc_segments_on_get_history_logs(self):
+        with open(
+                f'{self.path}/../../data/history_logs/success/get_history_logs_email_and_boc_devices.json'
+        ) as data_file:
+            input = json.dumps(json.load(data_file)[5])
+        with patch.object(
+                DeviceSubscription, 'get_records', autospec=True,
+                side_effect=DeviceSubscription.get_records) as get_records:
+            output = handler.get_history_logs({'body': input}, 'dummy')
+        # One read of the subscriptions of every cloud device
+        get_records.assert_called_once_with(
+            unittest.mock.ANY, ['ffffffff-ffff-ffff-ffff-ffffffff0001'], '0')
+        output = json.loads(output['body'])
+        self.assertTrue(output['code'] in (200, 207))
+        updated = output['data'][0]['updated']
+        # Email and cloud segments are merged in time order
+        self.assertEqual(updated, sorted(updated))
+
     def test_email_boc_devices_on_get_history_logs(self):
         with open(
                 f'{self.path}/../../data/history_logs/success/get_history_logs_email_and_boc_devices.json'
@@ -1,73 +1,133 @@
 import unittest
 import logging
-from unittest.mock import patch, Mock
+from unittest.mock import patch
 from os import path
 from urllib import parse
-from urllib.error import HTTPError
+from tests.functions.stub_notification_server import StubNotificationServer
 from functions.push_notifications import async
+from functions.push_notifications import delivery
 from tests.functions import test_helper
 
 
 class AsyncSendPushNotificationTestCase(unittest.TestCase):
     def setUp(self):
         test_helper.set_env_var(self)
+        test_helper.create_table(self)
         self.path = path.dirname(__file__)
         logging.getLogger('push_notifications:async').setLevel(100)
 
-    @patch('urllib.request.urlopen')
+    def tearDown(self):
+        delivery.reset()
+        test_helper.clear_db(self)
+
     @patch('functions.push_notifications.async.logger')
-    def test_send_push_notification_success(self, mock_logger, mock):
-        url_read_mock = Mock()
-        url_read_mock.code = 200
-        mock.return_value = url_read_mock
-        async.send_push_notification({
-            "reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0001",
-            "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0",
-            "timestamp": "2017-02-04T12:23:01",
-            "data": [{"feature_name": "TonerInk_LifeBlack", "value": "6000"}],
-            "notify_url": "http://dummy.com"}, 'dummy')
-        mock.assert_called_with(
-            'http://dummy.com',
-            parse.urlencode(
-                {
-                    "reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0001",
-                    "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0",
-                    "timestamp": "2017-02-04T12:23:01",
-                    "data": [{"feature_name": "TonerInk_LifeBlack", "value": "6000"}]
-                }
-            ).encode('ascii')
-        )
-        self.assertEqual(mock_logger.info.call_count, 2)
-        mock_logger.info.assert_called_with('async:send_push_notification successfully sent notification to http://dummy.com.')
+    def test_send_push_notification_success(self, mock_logger):
+        with StubNotificationServer() as stub:
+            async.send_push_notification({
+                "reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0001",
+                "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0",
+                "timestamp": "2017-02-04T12:23:01",
+                "data": [{"feature_name": "TonerInk_LifeBlack", "value": "6000"}],
+                "notify_url": stub.url}, 'dummy')
+        self.assertEqual(stub.requests, [parse.parse_qs(parse.urlencode(
+            {
+                "reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0001",
+                "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0",
+                "timestamp": "2017-02-04T12:23:01",
+                "data": [{"feature_name": "TonerInk_LifeBlack", "value": "6000"}]
+            }
+        ))])
+        self.assertEqual(mock_logger.info.call_count, 3)
+        mock_logger.info.assert_any_call(f'async:send_push_notification successfully sent notification to {stub.url}.')
         mock_logger.error.assert_not_called()
 
-    @patch('urllib.request.urlopen')
     @patch('functions.push_notifications.async.logger')
-    def test_send_notification_server_error(self, mock_logger, mock):
-        mock.side_effect = HTTPError('http://dummy.com', 500, 'Internal Server Error', 'test', Mock(return_value='test'))
-        with self.assertRaises(HTTPError):
+    def test_send_notification_server_error(self, mock_logger):
+        with StubNotificationServer(status=500) as stub:
             async.send_push_notification({
                 "reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0001",
                 "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0",
                 "timestamp": "2017-02-04T12:23:01",
                 "data": [{"feature_name": "TonerInk_LifeBlack", "value": "6000"}],
-                "notify_url": "http://dummy.com"}, 'dummy')
-        self.assertEqual(mock_logger.info.call_count, 1)
+                "notify_url": stub.url}, 'dummy')
+        self.assertEqual(mock_logger.info.call_count, 2)
+        self.assertEqual(mock_logger.warning.call_count, 1)
         mock_logger.error.assert_not_called()
+        retry = get_push_notification_retry(
+            self, 'eeeeeeee-eeee-eeee-eeee-eeeeeeee0001#1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0')
+        self.assertEqual(retry['timestamp'], '2017-02-04T12:23:01')
+        self.assertEqual(retry['notify_url'], stub.url)
+        self.assertEqual(retry['attempts'], 1)
 
-    @patch('urllib.request.urlopen')
     @patch('functions.push_notifications.async.logger')
-    def test_send_notification_client_error(self, mock_logger, mock):
-        mock.side_effect = HTTPError('http://dummy.com', 404, 'Internal Server Error', 'test', Mock(return_value='test'))
-        async.send_push_notification({
-            "reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0001",
-            "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0",
-            "timestamp": "2017-02-04T12:23:01",
-            "data": [{"feature_name": "TonerInk_LifeBlack", "value": "6000"}],
-            "notify_url": "http://dummy.com"}, 'dummy')
-        self.assertEqual(mock_logger.info.call_count, 1)
+    def test_send_notification_client_error(self, mock_logger):
+        with StubNotificationServer(status=404) as stub:
+            async.send_push_notification({
+                "reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0001",
+                "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0",
+                "timestamp": "2017-02-04T12:23:01",
+                "data": [{"feature_name": "TonerInk_LifeBlack", "value": "6000"}],
+                "notify_url": stub.url}, 'dummy')
+        self.assertEqual(mock_logger.info.call_count, 2)
         self.assertEqual(mock_logger.error.call_count, 2)
 
+    @patch('functions.push_notifications.async.logger')
+    def test_send_batched_push_notifications(self, mock_logger):
+        events = [
+            {
+                "reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0001",
+                "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0",
+                "timestamp": "2017-02-04T12:23:01",
+                "data": [{"feature_name": "TonerInk_LifeBlack", "value": "6000"}]
+            },
+            {
+                "reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0002",
+                "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0",
+                "timestamp": "2017-02-04T12:23:02",
+                "data": [{"feature_name": "TonerInk_LifeBlack", "value": "5000"}]
+            }
+        ]
+        with StubNotificationServer() as stub:
+            async.send_push_notification(
+                {"events": events, "notify_url": stub.url}, 'dummy')
+        self.assertEqual(len(stub.requests), 2)
+        self.assertIn(
+            parse.parse_qs(parse.urlencode(events[1])), stub.requests)
+        self.assertEqual(mock_logger.info.call_count, 4)
+        mock_logger.error.assert_not_called()
+
+    @patch('functions.push_notifications.async.logger')
+    def test_send_batched_notifications_server_error(self, mock_logger):
+        with StubNotificationServer(status=503) as stub:
+            async.send_push_notification({
+                "events": [
+                    {
+                        "reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0001",
+                        "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0",
+                        "timestamp": "2017-02-04T12:23:01",
+                        "data": [{"feature_name": "TonerInk_LifeBlack", "value": "6000"}]
+                    },
+                    {
+                        "reporting_id": "eeeeeeee-eeee-eeee-eeee-eeeeeeee0002",
+                        "object_id": "1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0",
+                        "timestamp": "2017-02-04T12:23:02",
+                        "data": [{"feature_name": "TonerInk_LifeBlack", "value": "5000"}]
+                    }
+                ],
+                "notify_url": stub.url}, 'dummy')
+        # Every event is tried and queued for retry
+        self.assertEqual(len(stub.requests), 2)
+        self.assertEqual(delivery.stats()[stub.url.rsplit('/', 1)[0]]['failures'], 2)
+        self.assertTrue(get_push_notification_retry(
+            self, 'eeeeeeee-eeee-eeee-eeee-eeeeeeee0001#1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0'))
+        self.assertTrue(get_push_notification_retry(
+            self, 'eeeeeeee-eeee-eeee-eeee-eeeeeeee0002#1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0'))
+
+
+def get_push_notification_retry(self, id):
+    return self.dynamodb.Table('push_notification_retries').get_item(
+        Key={'id': id}).get('Item')
+
 
 def main():
     unittest.main()
@@ -0,0 +1,106 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from tests.functions.stub_notification_server import StubNotificationServer
+from tests.functions.stub_notification_server import payload
+from functions.push_notifications import delivery
+
+
+class DeliveryTestCase(unittest.TestCase):
+    def setUp(self):
+        delivery.reset()
+
+    def tearDown(self):
+        delivery.reset()
+
+    def test_connections_are_reused(self):
+        with StubNotificationServer() as stub:
+            for i in range(5):
+                self.assertEqual(delivery.post(stub.url, payload(i)), 200)
+            self.assertEqual(stub.connections, 1)
+            self.assertEqual(len(stub.requests), 5)
+            self.assertEqual(stub.requests[4]['reporting_id'], ['eeeeeeee-eeee-eeee-eeee-eeeeeeee0001'])
+
+        stats = delivery.stats()[stub.url.rsplit('/', 1)[0]]
+        self.assertEqual(stats['deliveries'], 5)
+        self.assertEqual(stats['failures'], 0)
+        self.assertEqual(stats['connections_opened'], 1)
+
+    def test_closed_connection_is_reopened(self):
+        with StubNotificationServer(drop_connections=True) as stub:
+            self.assertEqual(delivery.post(stub.url, payload(0)), 200)
+            self.assertEqual(delivery.post(stub.url, payload(1)), 200)
+            self.assertEqual(len(stub.requests), 2)
+            self.assertEqual(stub.connections, 2)
+
+    @patch.dict('os.environ', {'PUSH_NOTIFICATION_MAX_CONNECTIONS_PER_HOST': '4'})
+    def test_concurrency_is_capped_per_host(self):
+        with StubNotificationServer(delay=0.02) as stub:
+            results = delivery.deliver(
+                [(stub.url, payload(i)) for i in range(40)], max_workers=16)
+            self.assertEqual(results, [200] * 40)
+            self.assertLessEqual(stub.max_in_flight, 4)
+            self.assertGreater(stub.max_in_flight, 1)
+            self.assertLessEqual(stub.connections, 4)
+
+    @patch.dict('os.environ', {
+        'PUSH_NOTIFICATION_MAX_CONNECTIONS_PER_HOST': '2',
+        'PUSH_NOTIFICATION_MAX_WORKERS': '4'})
+    def test_slow_host_does_not_block_other_hosts(self):
+        with StubNotificationServer(delay=0.5) as slow, \
+                StubNotificationServer() as fast:
+            deliveries = threading.Thread(target=delivery.deliver, args=(
+                [(slow.url, payload(i)) for i in range(8)] +
+                [(fast.url, payload(i)) for i in range(20)],))
+            deliveries.start()
+            # The fast host is served by the other threads while both lanes
+            # of the slow host are still sending
+            deadline = time.time() + 1
+            while len(fast.requests) < 20 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(len(fast.requests), 20)
+            self.assertLess(len(slow.requests), 8)
+            deliveries.join()
+            self.assertEqual(len(slow.requests), 8)
+            self.assertLessEqual(slow.max_in_flight, 2)
+
+    def test_error_status(self):
+        with StubNotificationServer(status=500) as stub:
+            results = delivery.deliver([(stub.url, payload(0))])
+        self.assertIsInstance(results[0], delivery.DeliveryError)
+        self.assertEqual(results[0].code, 500)
+        self.assertEqual(results[0].body, b'ok')
+        self.assertEqual(delivery.stats()[stub.url.rsplit('/', 1)[0]]['failures'], 1)
+
+    def test_redirect_is_not_delivered(self):
+        with StubNotificationServer(status=302) as stub:
+            results = delivery.deliver([(stub.url, payload(0))])
+            self.assertEqual(len(stub.requests), 1)
+        self.assertIsInstance(results[0], delivery.DeliveryError)
+        self.assertEqual(results[0].code, 302)
+        self.assertFalse(delivery.is_retryable(results[0]))
+
+    def test_http_proxy(self):
+        with StubNotificationServer() as proxy:
+            with patch.dict('os.environ', {
+                    'http_proxy': proxy.url.rsplit('/', 1)[0],
+                    'no_proxy': ''}):
+                self.assertEqual(delivery.post(
+                    'http://notify.example/notify?id=1', payload(0)), 200)
+            self.assertEqual(
+                proxy.paths, ['http://notify.example:80/notify?id=1'])
+
+    def test_unreachable_destination(self):
+        with StubNotificationServer() as stub:
+            url = stub.url
+        results = delivery.deliver([(url, payload(0))])
+        self.assertIsInstance(results[0], OSError)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import unittest
+import json
+from unittest.mock import patch
+from functions.push_notifications import dispatcher
+from functions.push_notifications.dispatcher import PushNotificationDispatcher
+from tests.functions import test_helper
+
+
+class PushNotificationDispatcherTestCase(unittest.TestCase):
+    def setUp(self):
+        test_helper.set_env_var(self)
+
+    @patch('functions.helper.invoke_async')
+    def test_dispatch_per_notify_url(self, mock):
+        push_notifications = PushNotificationDispatcher()
+        for i in range(3):
+            push_notifications.add(
+                'eeeeeeee-eeee-eeee-eeee-eeeeeeee0001',
+                '1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0',
+                f'2017-02-04T12:23:0{i}',
+                [{'feature_name': 'TonerInk_LifeBlack', 'value': str(i)}],
+                'http://dummy.com')
+        push_notifications.add(
+            'eeeeeeee-eeee-eeee-eeee-eeeeeeee0002',
+            '1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.52.3.1.3.1',
+            '2017-02-04T12:23:01',
+            {'feature_name': 'counter_value', 'value': '2'},
+            'http://other.com')
+        push_notifications.dispatch()
+
+        self.assertEqual(mock.call_count, 2)
+        payloads = {
+            payload['notify_url']: payload for payload in
+            [json.loads(call[0][1]) for call in mock.call_args_list]}
+        self.assertEqual(len(payloads['http://dummy.com']['events']), 3)
+        self.assertEqual(
+            [event['timestamp'] for event in payloads['http://dummy.com']['events']],
+            ['2017-02-04T12:23:00', '2017-02-04T12:23:01', '2017-02-04T12:23:02'])
+        self.assertEqual(
+            payloads['http://other.com']['events'][0]['data'],
+            [{'feature_name': 'counter_value', 'value': '2'}])
+
+        # Events are only sent once
+        push_notifications.dispatch()
+        self.assertEqual(mock.call_count, 2)
+
+    @patch('functions.helper.invoke_async')
+    @patch('functions.push_notifications.dispatcher.MAX_PAYLOAD_SIZE', 500)
+    def test_dispatch_large_batch(self, mock):
+        push_notifications = PushNotificationDispatcher()
+        for i in range(10):
+            push_notifications.add(
+                'eeeeeeee-eeee-eeee-eeee-eeeeeeee0001',
+                '1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0',
+                '2017-02-04T12:23:01',
+                [{'feature_name': 'TonerInk_LifeBlack', 'value': str(i)}],
+                'http://dummy.com')
+        push_notifications.dispatch()
+
+        self.assertGreater(mock.call_count, 1)
+        events = []
+        for call in mock.call_args_list:
+            self.assertLessEqual(len(call[0][1]), dispatcher.MAX_PAYLOAD_SIZE)
+            events.extend(json.loads(call[0][1])['events'])
+        self.assertEqual(len(events), 10)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
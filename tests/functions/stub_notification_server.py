@@ -0,0 +1,78 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib import parse
+
+# Local notify_url for the push notification tests and benchmark. Requests
+# are recorded, the status, a delay and dropped connections can be set.
+
+
+class StubNotificationServer(object):
+    def __init__(self, status=200, delay=0.0, drop_connections=False):
+        self.status = status
+        self.delay = delay
+        # Close every connection after its response without telling the client
+        self.drop_connections = drop_connections
+        self.lock = threading.Lock()
+        self.requests = []
+        self.paths = []
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler())
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/notify'
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stub.lock:
+                    stub.connections += 1
+
+            def do_POST(self):
+                with stub.lock:
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                if stub.delay:
+                    time.sleep(stub.delay)
+                with stub.lock:
+                    stub.in_flight -= 1
+                    stub.requests.append(parse.parse_qs(body.decode('ascii')))
+                    stub.paths.append(self.path)
+                self.send_response(stub.status)
+                if 300 <= stub.status < 400:
+                    self.send_header('Location', stub.url)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'ok')
+                if stub.drop_connections:
+                    self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def payload(i):
+    return {
+        'reporting_id': 'eeeeeeee-eeee-eeee-eeee-eeeeeeee0001',
+        'object_id': '1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0',
+        'timestamp': '2017-02-04T12:23:01',
+        'data': [{'feature_name': 'TonerInk_LifeBlack', 'value': str(i)}]}
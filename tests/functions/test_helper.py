@@ -7,6 +7,8 @@ import boto3
 from botocore.exceptions import ClientError
 from boto3.dynamodb.conditions import Key
 from botocore.client import Config
+from models import connections
+from models import service_oid as service_oid_catalog
 
 path = os.path.dirname(__file__)
 
@@ -17,6 +19,8 @@ def set_env_var(self):
         for env_var in env_vars:
             environ[env_var] = env_vars[env_var]
         environ['http_proxy'] = ''
+    connections.reset()
+    service_oid_catalog.reset()
 
 
 def seed_ec_subscriptions(self):
@@ -259,8 +263,52 @@ def create_table(self):
                 AttributeDefinitions=schema['AttributeDefinitions'],
                 ProvisionedThroughput=schema['ProvisionedThroughput']
             )
+    with open(
+            f'{path}/../../db/migrations/device_log_rollups.json'
+    ) as json_file:
+        schema = json.load(json_file)['Table']
+    try:
+        self.dynamodb.create_table(
+            TableName=schema['TableName'],
+            KeySchema=schema['KeySchema'],
+            AttributeDefinitions=schema['AttributeDefinitions'],
+            ProvisionedThroughput=schema['ProvisionedThroughput']
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ResourceInUseException':
+            self.dynamodb.Table('device_log_rollups').delete()
+            self.dynamodb.create_table(
+                TableName=schema['TableName'],
+                KeySchema=schema['KeySchema'],
+                AttributeDefinitions=schema['AttributeDefinitions'],
+                ProvisionedThroughput=schema['ProvisionedThroughput']
+            )
+    with open(
+            f'{path}/../../db/migrations/push_notification_retries.json'
+    ) as json_file:
+        schema = json.load(json_file)['Table']
+    try:
+        self.dynamodb.create_table(
+            TableName=schema['TableName'],
+            KeySchema=schema['KeySchema'],
+            AttributeDefinitions=schema['AttributeDefinitions'],
+            ProvisionedThroughput=schema['ProvisionedThroughput'],
+            GlobalSecondaryIndexes=schema['GlobalSecondaryIndexes']
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ResourceInUseException':
+            self.dynamodb.Table('push_notification_retries').delete()
+            self.dynamodb.create_table(
+                TableName=schema['TableName'],
+                KeySchema=schema['KeySchema'],
+                AttributeDefinitions=schema['AttributeDefinitions'],
+                ProvisionedThroughput=schema['ProvisionedThroughput'],
+                GlobalSecondaryIndexes=schema['GlobalSecondaryIndexes']
+            )
+
 
 def seed_service_oids_table(self, fixtures_path):
+    service_oid_catalog.reset()
     table = self.dynamodb.Table('service_oids')
     with open(
             f'{path}/../fixtures/{fixtures_path}'
@@ -538,6 +586,9 @@ def clear_db(self):
     self.dynamodb.Table('reporting_registrations').delete()
     self.dynamodb.Table('device_email_logs').delete()
     self.dynamodb.Table('accumulated_device_logs').delete()
+    self.dynamodb.Table('device_log_rollups').delete()
+    self.dynamodb.Table('push_notification_retries').delete()
+    service_oid_catalog.reset()
 
 
 def clear_cache(self):
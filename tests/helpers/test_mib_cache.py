@@ -0,0 +1,57 @@
+import unittest
+from unittest.mock import patch
+from helpers import mib_cache
+from models.service_oid import ServiceOid
+from tests.functions import test_helper
+
+COUNT_TYPE_OID = '1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.52.2.1.2.7'
+COUNTER_OID = '1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.52.2.1.3.7'
+
+
+class TestMibCache(unittest.TestCase):
+    def setUp(self):
+        test_helper.set_env_var(self)
+        test_helper.seed_ddb_device_statuses(self)
+        mib_cache.clear()
+
+    def tearDown(self):
+        mib_cache.clear()
+        test_helper.clear_db(self)
+        test_helper.create_table(self)
+
+    def test_oid_is_memoized(self):
+        self.assertIs(mib_cache.oid(COUNTER_OID), mib_cache.oid(COUNTER_OID))
+        self.assertEqual(mib_cache.oid_type(COUNTER_OID), 'counter')
+
+    def test_count_type_index(self):
+        id_map = mib_cache.oid(COUNT_TYPE_OID).id_map
+        index = mib_cache.count_type_index(COUNT_TYPE_OID)
+        for count_type_id in id_map:
+            self.assertEqual(
+                index[count_type_id],
+                list(id_map.keys()).index(count_type_id) + 1)
+
+    def test_search_oid_returns_copies(self):
+        oids, missings = mib_cache.search_oid(['Location', 'Unknown_Feature'])
+        self.assertEqual(missings, ['Unknown_Feature'])
+        oids.clear()
+        missings.clear()
+        self.assertTrue(mib_cache.search_oid(['Location', 'Unknown_Feature'])[0])
+
+    def test_warm(self):
+        mib_cache.warm()
+        self.assertGreater(mib_cache.oid.cache_info().currsize, 0)
+
+    @patch.object(ServiceOid, 'ids')
+    def test_failed_warm_is_not_retried_at_once(self, mock):
+        mock.side_effect = ConnectionError
+        mib_cache.warm()
+        mib_cache.warm()
+        mock.assert_called_once()
+        self.assertEqual(mib_cache.oid_type(COUNTER_OID), 'counter')
+
+        with patch('helpers.mib_cache.WARM_RETRY_SECONDS', 0):
+            mib_cache.clear()
+            mib_cache.warm()
+            mib_cache.warm()
+        self.assertEqual(mock.call_count, 3)
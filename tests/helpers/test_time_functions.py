@@ -0,0 +1,45 @@
+import unittest
+from datetime import datetime
+from helpers import time_functions
+
+
+class TestLatestPerInterval(unittest.TestCase):
+    def test_hourly_buckets_relative_to_start(self):
+        bounds = time_functions.hourly_bounds(
+            datetime(2017, 1, 1, 10, 30, 0), datetime(2017, 1, 1, 12, 59, 59))
+        self.assertEqual(bounds, [
+            ('2017-01-01T10:30:00', '2017-01-01T11:30:00'),
+            ('2017-01-01T11:30:00', '2017-01-01T12:30:00'),
+            ('2017-01-01T12:30:00', '2017-01-01T13:00:00')])
+
+        records = [{'timestamp': timestamp} for timestamp in [
+            '2017-01-01T10:30:00', '2017-01-01T11:29:59',
+            '2017-01-01T12:45:00', '2017-01-01T12:30:00']]
+        self.assertEqual(
+            time_functions.latest_per_interval(records, bounds), [
+                {'timestamp': '2017-01-01T11:29:59'}, None,
+                {'timestamp': '2017-01-01T12:45:00'}])
+
+    def test_latest_index_per_interval(self):
+        bounds = time_functions.hourly_bounds(
+            datetime(2017, 1, 1, 10, 30, 0), datetime(2017, 1, 1, 12, 59, 59))
+        timestamps = [
+            '2017-01-01T10:29:59', '2017-01-01T10:30:00', '2017-01-01T11:29:59',
+            '2017-01-01T12:30:00', '2017-01-01T12:45:00', '2017-01-01T13:30:00']
+        self.assertEqual(
+            time_functions.latest_index_per_interval(timestamps, bounds),
+            [2, None, 4])
+        self.assertEqual(
+            time_functions.latest_index_per_interval([], bounds),
+            [None, None, None])
+
+    def test_daily_buckets(self):
+        bounds = time_functions.period_bounds(time_functions.break_time_period(
+            '2017-01-01T12:00:00', '2017-01-03T06:00:00', time_functions.DAILY))
+        records = [{'timestamp': timestamp} for timestamp in [
+            '2017-01-01T11:59:59', '2017-01-01T23:59:59',
+            '2017-01-03T06:00:00', '2017-01-03T06:00:01']]
+        self.assertEqual(
+            time_functions.latest_per_interval(records, bounds), [
+                {'timestamp': '2017-01-01T23:59:59'}, None,
+                {'timestamp': '2017-01-03T06:00:00'}])
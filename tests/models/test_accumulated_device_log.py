@@ -0,0 +1,87 @@
+import unittest
+from unittest.mock import patch
+from models.accumulated_device_log import AccumulatedDeviceLog
+from models.accumulated_device_log import log_size
+from tests.functions import test_helper
+
+DEVICE_ID = 'ffffffff-ffff-ffff-ffff-ffffffff0012'
+OBJECT_ID = '1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0'
+
+
+class TestAccumulatedDeviceLog(unittest.TestCase):
+    def setUp(self):
+        test_helper.set_env_var(self)
+        test_helper.seed_ddb_device_statuses(self)
+        self.accumulated_device_log = AccumulatedDeviceLog()
+        self.table = self.dynamodb.Table('accumulated_device_logs')
+
+    def tearDown(self):
+        test_helper.clear_db(self)
+        test_helper.create_table(self)
+
+    def get_item(self, year_month):
+        return self.table.get_item(Key={
+            'id': f'{DEVICE_ID}#{OBJECT_ID}', 'year_month': year_month})['Item']
+
+    def test_put_on_legacy_item(self):
+        self.accumulated_device_log.put(
+            DEVICE_ID, OBJECT_ID, '2018-05-09T10:00:00', 'A')
+        self.accumulated_device_log.put(
+            DEVICE_ID, OBJECT_ID, '2018-05-09T12:00:00', 'B')
+        self.accumulated_device_log.put(
+            DEVICE_ID, OBJECT_ID, '2018-05-09T11:00:00', 'C')
+        item = self.get_item('2018-05')
+        self.assertEqual(item['log_count'], 2)
+        self.assertEqual(item['accumulated_log'][0]['timestamp'], '2018-05-08T12:23:01')
+        self.assertEqual(item['accumulated_log'][1], {
+            'timestamp': '2018-05-09T12:00:00', 'value': 'B'})
+
+    def test_late_log_of_earlier_day(self):
+        self.accumulated_device_log.put(
+            DEVICE_ID, OBJECT_ID, '2018-05-10T10:00:00', 'A')
+        self.accumulated_device_log.put(
+            DEVICE_ID, OBJECT_ID, '2018-05-09T10:00:00', 'B')
+        self.accumulated_device_log.put(
+            DEVICE_ID, OBJECT_ID, '2018-05-10T11:00:00', 'C')
+        logs = self.accumulated_device_log.get_daily_logs(
+            DEVICE_ID, OBJECT_ID, '2018-05', '2018-05')
+        self.assertEqual([log['value'] for log in logs[1:]], ['B', 'C'])
+
+    @patch('models.accumulated_device_log.CHUNK_SIZE_LIMIT', 100)
+    def test_put_splits_chunks(self):
+        for day in range(1, 4):
+            self.accumulated_device_log.put(
+                DEVICE_ID, OBJECT_ID, f'2018-06-0{day}T10:00:00', 'A' * 40)
+        self.assertEqual(self.get_item('2018-06')['log_count'], 1)
+        self.assertEqual(self.get_item('2018-06#001')['log_count'], 1)
+        self.assertEqual(self.get_item('2018-06#002')['log_count'], 1)
+        logs = self.accumulated_device_log.get_daily_logs(
+            DEVICE_ID, OBJECT_ID, '2018-06', '2018-06')
+        self.assertEqual(
+            [log['timestamp'][0:10] for log in logs],
+            ['2018-06-01', '2018-06-02', '2018-06-03'])
+
+    def test_replaced_log_size(self):
+        for hour, value in [(10, 'A' * 40), (11, 'B' * 10), (12, 'C' * 20)]:
+            self.accumulated_device_log.put(
+                DEVICE_ID, OBJECT_ID, f'2018-06-01T{hour}:00:00', value)
+        item = self.get_item('2018-06')
+        self.assertEqual(item['log_count'], 1)
+        self.assertEqual(item['log_size'], log_size(item['accumulated_log'][0]))
+        self.assertEqual(item['last_size'], item['log_size'])
+
+    def test_log_size_in_bytes(self):
+        self.assertEqual(
+            log_size({'value': '\u00e9' * 10, 'timestamp': '2018-06-01T10:00:00'}),
+            20 + 19 + 20)
+
+    def test_covers(self):
+        self.assertTrue(
+            self.accumulated_device_log.covers([OBJECT_ID], 'daily'))
+        self.assertFalse(
+            self.accumulated_device_log.covers([OBJECT_ID], 'hourly'))
+        with patch.dict('os.environ', {'ACCUMULATED_LOG_OIDS': f'{OBJECT_ID}, 1.2.3'}):
+            self.assertTrue(self.accumulated_device_log.covers(
+                [OBJECT_ID, '1.2.3'], 'daily'))
+        self.assertFalse(self.accumulated_device_log.covers(
+            [OBJECT_ID, '1.2.3'], 'daily'))
@@ -0,0 +1,34 @@
+import unittest
+from models import connections
+from models.device_log import DeviceLog
+from models.service_oid import ServiceOid
+from tests.functions import test_helper
+
+
+class TestConnections(unittest.TestCase):
+    def setUp(self):
+        test_helper.set_env_var(self)
+        connections.reset()
+
+    def tearDown(self):
+        connections.reset()
+
+    def test_clients_are_shared_between_models(self):
+        device_log = DeviceLog()
+        service_oid = ServiceOid()
+        self.assertIs(device_log.dynamodb, service_oid.dynamodb)
+        self.assertIs(device_log.elasticache, service_oid.elasticache)
+        self.assertIs(connections.dynamodb_client(), device_log.dynamodb.meta.client)
+
+    def test_reset_rebuilds_clients(self):
+        dynamodb = connections.dynamodb_resource()
+        elasticache = connections.redis_client()
+        connections.reset()
+        self.assertIsNot(dynamodb, connections.dynamodb_resource())
+        self.assertIsNot(elasticache, connections.redis_client())
+
+    def test_s3_resource_is_reused(self):
+        s3 = connections.s3_resource('us-east-1')
+        self.assertIs(s3, connections.s3_resource('us-east-1'))
+        connections.reset()
+        self.assertIsNot(s3, connections.s3_resource('us-east-1'))
@@ -0,0 +1,59 @@
+import unittest
+from models.device_email_log import DeviceEmailLog
+from tests.functions import test_helper
+
+SERIAL_NUMBER = 'E00000000000001'
+
+
+class TestDeviceEmailLog(unittest.TestCase):
+    def setUp(self):
+        test_helper.set_env_var(self)
+        test_helper.create_table(self)
+        self.device_email_log = DeviceEmailLog()
+        self.device_email_log.batch_create([
+            {'serial_number': SERIAL_NUMBER, 'timestamp': timestamp,
+             'Total_Page_Count': str(i), 'Date': timestamp[:10]}
+            for i, timestamp in enumerate([
+                '2017-12-31T23:00:00', '2018-01-01T00:10:00',
+                '2018-01-01T00:50:00', '2018-01-01T02:00:00',
+                '2018-01-09T23:59:00'])])
+
+    def tearDown(self):
+        test_helper.clear_db(self)
+
+    def test_hourly_log_history(self):
+        res = self.device_email_log.get_log_history({
+            'serial_number': SERIAL_NUMBER,
+            'from_time_unit': '2018-01-01T00:00:00',
+            'to_time_unit': '2018-01-10T00:00:00',
+            'time_unit': 'hourly'
+        }, ['Total_Page_Count', 'Date'])
+        self.assertEqual(res, [
+            {'timestamp': '2018-01-01T00:50:00',
+             'features': {'Total_Page_Count': '2', 'Date': '2018-01-01'}},
+            {'timestamp': '2018-01-01T02:00:00',
+             'features': {'Total_Page_Count': '3', 'Date': '2018-01-01'}},
+            {'timestamp': '2018-01-09T23:59:00',
+             'features': {'Total_Page_Count': '4', 'Date': '2018-01-09'}}])
+
+    def test_log_before_from_time(self):
+        res = self.device_email_log.get_log_history({
+            'serial_number': SERIAL_NUMBER,
+            'from_time_unit': '2018-01-01T00:00:00',
+            'to_time_unit': '2018-01-01T23:59:59',
+            'time_unit': 'daily',
+            'log_pre_from': True
+        }, ['Total_Page_Count'])
+        self.assertEqual(res, [
+            {'timestamp': '2018-01-01T00:00:00',
+             'features': {'Total_Page_Count': '0'}},
+            {'timestamp': '2018-01-01T02:00:00',
+             'features': {'Total_Page_Count': '3'}}])
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
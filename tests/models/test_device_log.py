@@ -0,0 +1,141 @@
+import concurrent.futures
+import unittest
+from unittest.mock import patch
+from helpers import time_functions
+from models.device_log import BUCKET_PLAN
+from models.device_log import DeviceLog
+from models.device_log import RANGE_PLAN
+from tests.functions import test_helper
+
+DEVICE_ID = 'ffffffff-ffff-ffff-ffff-ffffffff0001'
+
+
+class TestDeviceLogLatestLogs(unittest.TestCase):
+    def setUp(self):
+        test_helper.set_env_var(self)
+        test_helper.seed_ddb_device_logs(self)
+        self.device_log = DeviceLog()
+        self.elasticache = self.device_log.elasticache
+        self.elasticache.flushall()
+        self.subscription = self.dynamodb.Table('device_subscriptions').get_item(
+            Key={'id': f'{DEVICE_ID}#0'})['Item']
+
+    def tearDown(self):
+        test_helper.clear_cache(self)
+        test_helper.clear_db(self)
+
+    def test_partial_cache_hit_is_merged_with_dynamodb(self):
+        self.elasticache.hmset(f'device_log:{DEVICE_ID}#1.3.6.1.2.1.1.6.0', {
+            'id': f'{DEVICE_ID}#1.3.6.1.2.1.1.6.0',
+            'timestamp': '2017-01-12T12:30:00',
+            'value': 'cached'})
+        items = self.device_log.get_latest_logs([self.subscription])['Items']
+        logs = {item['id'].split('#')[1]: item for item in items}
+        self.assertEqual(logs['1.3.6.1.2.1.1.6.0']['value'], 'cached')
+        self.assertEqual(logs['1.3.6.1.2.1.2.2.1.6.1']['value'], '67055C7HGTF5')
+        self.assertEqual(
+            logs['1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0']['timestamp'],
+            '2017-01-12T12:23:05')
+
+    def test_full_cache_hit(self):
+        for data in self.subscription['oids']:
+            self.elasticache.hmset(f"device_log:{DEVICE_ID}#{data['oid']}", {
+                'id': f"{DEVICE_ID}#{data['oid']}",
+                'timestamp': '2017-01-12T12:30:00',
+                'value': 'cached'})
+        items = self.device_log.get_latest_logs([self.subscription])['Items']
+        self.assertEqual(len(items), len(self.subscription['oids']))
+        self.assertTrue(all(item['value'] == 'cached' for item in items))
+
+    def test_latest_logs_for_devices(self):
+        self.elasticache.hmset(f'device_log:{DEVICE_ID}#1.3.6.1.2.1.1.6.0', {
+            'id': f'{DEVICE_ID}#1.3.6.1.2.1.1.6.0',
+            'timestamp': '2017-01-12T12:30:00',
+            'value': 'cached'})
+        res = self.device_log.get_latest_logs_for_devices({
+            DEVICE_ID: [self.subscription],
+            'ffffffff-ffff-ffff-ffff-fffffffffff0': []})
+        self.assertEqual(
+            [item['id'] for item in res[DEVICE_ID]['Items']],
+            [f"{DEVICE_ID}#{data['oid']}" for data in self.subscription['oids']])
+        self.assertEqual(res[DEVICE_ID]['Items'][0]['value'], 'cached')
+        self.assertEqual(
+            res['ffffffff-ffff-ffff-ffff-fffffffffff0'], {'Items': []})
+
+
+class TestDeviceLogNotificationDedup(unittest.TestCase):
+    def setUp(self):
+        test_helper.set_env_var(self)
+        test_helper.seed_ddb_device_logs(self)
+        self.device_log = DeviceLog()
+        self.elasticache = self.device_log.elasticache
+        self.elasticache.flushall()
+
+    def tearDown(self):
+        test_helper.clear_cache(self)
+        test_helper.clear_db(self)
+
+    def test_only_new_values_are_kept(self):
+        self.elasticache.hmset(f'device_log:{DEVICE_ID}#1.3.6.1.2.1.1.6.0', {
+            'id': f'{DEVICE_ID}#1.3.6.1.2.1.1.6.0',
+            'timestamp': '2017-01-12T12:30:00',
+            'value': 'cached'})
+        notification = [
+            {'object_id': '1.3.6.1.2.1.1.6.0', 'value': 'cached',
+             'timestamp': '1484224200'},
+            {'object_id': '1.3.6.1.2.1.2.2.1.6.1', 'value': '67055C7HGTF5',
+             'timestamp': '1484224200'},
+            {'object_id': '1.3.6.1.2.1.2.2.1.6.1', 'value': 'changed',
+             'timestamp': '1484224201'},
+            {'object_id': '1.3.6.1.2.1.1.5.0', 'value': '',
+             'timestamp': '1484224200'}
+        ]
+        res = self.device_log.is_exists_db(self.device_log.is_exists_cache(
+            {'device_id': DEVICE_ID, 'notification': list(notification)}))
+        self.assertEqual(res['notification'], [
+            {'object_id': '1.3.6.1.2.1.2.2.1.6.1', 'value': 'changed',
+             'timestamp': '1484224201'},
+            {'object_id': '1.3.6.1.2.1.1.5.0', 'value': ' ',
+             'timestamp': '1484224200'}
+        ])
+
+class TestDeviceLogHistoryPlan(unittest.TestCase):
+    def setUp(self):
+        test_helper.set_env_var(self)
+        test_helper.seed_ddb_history_logs(self)
+        self.device_log = DeviceLog()
+        self.object_id = '1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.10.0'
+        self.time_periods = time_functions.break_time_period(
+            '2017-01-01T00:00:00', '2017-08-31T23:59:59', time_functions.DAILY)
+        self.bounds = time_functions.period_bounds(self.time_periods)
+
+    def tearDown(self):
+        test_helper.clear_db(self)
+
+    def get_latest(self):
+        return self.device_log.get_latest_logs_per_period(
+            DEVICE_ID, [self.object_id], self.time_periods, self.bounds)
+
+    def test_sparse_logs_use_range_plan(self):
+        latest, plans = self.get_latest()
+        self.assertEqual(plans[self.object_id]['plan'], RANGE_PLAN)
+        self.assertEqual(len(latest[self.object_id]), len(self.bounds))
+        self.assertTrue(any(latest[self.object_id]))
+
+    def test_plans_return_same_records(self):
+        range_latest, _ = self.get_latest()
+        with patch('models.device_log.HISTORY_PROBE_LIMIT', 1), \
+                patch('models.device_log.RECORDS_PER_READ_UNIT', 0.001):
+            bucket_latest, plans = self.get_latest()
+        self.assertEqual(plans[self.object_id]['plan'], BUCKET_PLAN)
+        self.assertEqual(range_latest, bucket_latest)
+
+    def test_shared_executor(self):
+        # Queries run on the executor of the caller
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor, \
+                patch('concurrent.futures.ThreadPoolExecutor') as new_executor:
+            latest, plans = self.device_log.get_latest_logs_per_period(
+                DEVICE_ID, [self.object_id], self.time_periods, self.bounds,
+                executor)
+        new_executor.assert_not_called()
+        self.assertEqual((latest, plans), self.get_latest())
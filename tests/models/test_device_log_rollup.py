@@ -0,0 +1,84 @@
+import unittest
+from functions.device_log_rollups import handler
+from helpers import time_functions
+from models.device_log import DeviceLog
+from models.device_log_rollup import DeviceLogRollup
+from tests.functions import test_helper
+
+DEVICE_ID = 'ffffffff-ffff-ffff-ffff-ffffffff0001'
+OBJECT_ID = '1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.10.0'
+
+
+class TestDeviceLogRollup(unittest.TestCase):
+    def setUp(self):
+        test_helper.set_env_var(self)
+        test_helper.seed_ddb_history_logs(self)
+        self.rollup = DeviceLogRollup()
+        self.device_log = DeviceLog()
+
+    def tearDown(self):
+        test_helper.clear_db(self)
+
+    def test_put_keeps_latest_log(self):
+        self.rollup.put(DEVICE_ID, OBJECT_ID, '2017-01-12T08:28:01', 'new')
+        self.rollup.put(DEVICE_ID, OBJECT_ID, '2017-01-12T08:20:01', 'old')
+        for time_unit, bucket in [(time_functions.HOURLY, '2017-01-12T08'),
+                                  (time_functions.DAILY, '2017-01-12'),
+                                  (time_functions.MONTHLY, '2017-01')]:
+            rollups = self.rollup.get_rollups(
+                DEVICE_ID, OBJECT_ID, time_unit, bucket, bucket)
+            self.assertEqual(rollups[bucket]['value'], 'new')
+
+    def test_rollups_match_raw_logs(self):
+        handler.backfill({}, None)
+        for time_unit, from_time, to_time in [
+                (time_functions.HOURLY, '2017-01-12T08:25:00', '2017-01-12T10:25:00'),
+                (time_functions.DAILY, '2017-01-12T09:00:00', '2017-02-12T06:00:00'),
+                (time_functions.MONTHLY, '2017-01-12T09:00:00', '2017-08-03T00:00:00')]:
+            time_periods = time_functions.break_time_period(
+                from_time, to_time, time_unit)
+            bounds = time_functions.period_bounds(time_periods)
+            raw, _ = self.device_log.get_latest_logs_per_period(
+                DEVICE_ID, [OBJECT_ID], time_periods, bounds)
+            rolled_up = self.device_log.get_rolled_up_logs_per_period(
+                DEVICE_ID, [OBJECT_ID], time_unit, bounds)
+            self.assertEqual(
+                [item and (item['timestamp'], item['value'])
+                 for item in rolled_up[OBJECT_ID]],
+                [item and (item['timestamp'], item['value'])
+                 for item in raw[OBJECT_ID]])
+
+    def test_hourly_rollups_end_at_to_time(self):
+        # The rollup of the last hour holds a log written after to_time,
+        # the latest log up to to_time is returned instead
+        for timestamp, value in [('2017-01-20T10:20:00', 'in'),
+                                 ('2017-01-20T10:40:00', 'after')]:
+            self.dynamodb.Table('device_logs').put_item(Item={
+                'id': DEVICE_ID + '#' + OBJECT_ID,
+                'timestamp': timestamp, 'value': value})
+            self.rollup.put(DEVICE_ID, OBJECT_ID, timestamp, value)
+
+        bounds = []
+        for period in time_functions.break_time_period(
+                '2017-01-12T00:00:00', '2017-01-20T10:30:00', 16):
+            bounds.extend(time_functions.hourly_bounds(
+                period['start_time'], period['end_time']))
+        self.assertEqual(bounds[-1], ('2017-01-20T10:00:00', '2017-01-20T10:30:01'))
+        rolled_up = self.device_log.get_rolled_up_logs_per_period(
+            DEVICE_ID, [OBJECT_ID], time_functions.HOURLY, bounds)
+        self.assertEqual(
+            (rolled_up[OBJECT_ID][-1]['timestamp'], rolled_up[OBJECT_ID][-1]['value']),
+            ('2017-01-20T10:20:00', 'in'))
+
+    def test_check_reports_and_repairs_mismatches(self):
+        params = {
+            'device_id': DEVICE_ID, 'object_ids': [OBJECT_ID],
+            'time_unit': time_functions.MONTHLY,
+            'from_time': '2017-01-01T00:00:00', 'to_time': '2017-03-31T23:59:59'}
+        self.rollup.put(DEVICE_ID, OBJECT_ID, '2017-01-12T08:20:01', 'old')
+        res = handler.check(dict(params, repair=True), None)
+        self.assertEqual(res['checked'], 3)
+        self.assertEqual(
+            [mismatch['bucket'] for mismatch in res['mismatches']],
+            ['2017-01', '2017-02', '2017-03'])
+        self.assertEqual(handler.check(params, None)['mismatches'], [])
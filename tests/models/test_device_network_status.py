@@ -0,0 +1,75 @@
+import unittest
+from datetime import datetime
+from models.device_network_status import DeviceNetworkStatus
+from tests.functions import test_helper
+
+DEVICE_ID = 'ffffffff-ffff-ffff-ffff-ffffffff0001'
+
+
+class TestDeviceNetworkStatus(unittest.TestCase):
+    def setUp(self):
+        test_helper.set_env_var(self)
+        test_helper.create_table(self)
+        self.device_network_status = DeviceNetworkStatus()
+        self.device_network_status.elasticache.flushall()
+        self.event_timestamp = datetime(2017, 7, 4, 8, 40, 0)
+
+    def tearDown(self):
+        test_helper.clear_cache(self)
+        test_helper.clear_db(self)
+
+    def events(self, count, devices=1, event='online_hook'):
+        return [
+            {'device_id': f'ffffffff-ffff-ffff-ffff-ffffffff{i % devices:04}',
+             'event': event,
+             'timestamp': str(1499157000 + i // devices)}
+            for i in range(count)]
+
+    def filter(self, notify_data, event_timestamp=None):
+        event_timestamp = event_timestamp or self.event_timestamp
+        notify_data = self.device_network_status.is_exists_cache(
+            notify_data, event_timestamp)
+        return self.device_network_status.is_exists_db(
+            notify_data, event_timestamp)
+
+    def test_duplicated_events(self):
+        events = self.events(5) + self.events(5, event='offline_hook')
+        res = self.filter(events)
+        self.assertEqual(len(res), 5)
+        self.assertTrue(all(data['event'] == 'offline_hook' for data in res))
+
+    def test_stored_events_are_filtered(self):
+        events = self.events(3000, devices=30)
+        self.device_network_status.put_status(events, self.event_timestamp)
+        self.assertEqual(self.filter(events), [])
+
+        # Only the newest status of every device is cached
+        self.device_network_status.elasticache.flushall()
+        self.device_network_status.put_status(events, self.event_timestamp)
+        self.assertEqual(
+            len(self.device_network_status.elasticache.keys(
+                'device_network_status:*')), 30)
+
+    def test_status_overwritten_by_later_message(self):
+        events = self.events(1)
+        self.device_network_status.put_status(events, self.event_timestamp)
+        offline = self.events(1, event='offline_hook')
+
+        # Same timestamp, notified before the stored status
+        self.assertEqual(
+            self.filter(offline, datetime(2017, 7, 4, 8, 30, 0)), [])
+        # Same timestamp, notified after the stored status
+        self.assertEqual(
+            self.filter(offline, datetime(2017, 7, 4, 8, 50, 0)), offline)
+
+        self.device_network_status.elasticache.flushall()
+        self.assertEqual(
+            self.filter(offline, datetime(2017, 7, 4, 8, 50, 0)), offline)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+import unittest
+from models.device_status import DeviceStatus
+from tests.functions import test_helper
+
+REPORTING_ID = 'eeeeeeee-eeee-eeee-eeee-eeeeeeee0001'
+
+
+class TestDeviceStatus(unittest.TestCase):
+    def setUp(self):
+        test_helper.set_env_var(self)
+        test_helper.seed_ddb_device_statuses(self)
+
+    def tearDown(self):
+        test_helper.clear_db(self)
+        test_helper.create_table(self)
+
+    def test_batch_read(self):
+        keys = [
+            (REPORTING_ID, '1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0'),
+            (REPORTING_ID, '1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.52.2.1.3.11'),
+            (REPORTING_ID, '1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0'),
+            ('eeeeeeee-eeee-eeee-eeee-eeeeeeeeffff', '1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0')]
+        statuses = DeviceStatus().batch_read(keys)
+        self.assertEqual(sorted(statuses.keys()), sorted(set(keys[:2])))
+        for (reporting_id, object_id), device_status in statuses.items():
+            expected = DeviceStatus().read(reporting_id, object_id)
+            self.assertEqual(device_status.timestamp, expected.timestamp)
+            self.assertEqual(device_status.data, expected.data)
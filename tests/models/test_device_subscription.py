@@ -0,0 +1,92 @@
+import unittest
+from models.device_subscription import DeviceSubscription
+from models.device_subscription import subscription_cache_key
+from constants.device_response_codes import *
+from tests.functions import test_helper
+
+
+class TestDeviceSubscriptionCache(unittest.TestCase):
+    def setUp(self):
+        test_helper.set_env_var(self)
+        test_helper.seed_ddb_subscriptions(self)
+        self.device_subscription = DeviceSubscription()
+        self.elasticache = self.device_subscription.elasticache
+        self.elasticache.flushall()
+
+    def tearDown(self):
+        test_helper.clear_cache(self)
+        test_helper.clear_db(self)
+
+    def test_get_record_populates_cache(self):
+        key = subscription_cache_key('ffffffff-ffff-ffff-ffff-ffffff000000', '0')
+        self.assertFalse(self.elasticache.exists(key))
+        record = self.device_subscription.get_record(
+            'ffffffff-ffff-ffff-ffff-ffffff000000', '0')
+        self.assertEqual(int(record['status']), SUBSCRIBED)
+        self.assertTrue(self.elasticache.exists(key))
+        self.assertGreater(self.elasticache.ttl(key), 0)
+
+        cached = self.device_subscription.get_record(
+            'ffffffff-ffff-ffff-ffff-ffffff000000', '0')
+        self.assertEqual(int(cached['status']), SUBSCRIBED)
+        self.assertEqual(cached['oids'][0]['oid'], '1.3.6.1.2.1.1.6.0')
+
+    def test_get_records_mixes_cached_and_missing_devices(self):
+        self.device_subscription.get_record(
+            'ffffffff-ffff-ffff-ffff-ffffff000000', '0')
+        records = self.device_subscription.get_records([
+            'ffffffff-ffff-ffff-ffff-ffffff000000',
+            'ffffffff-ffff-ffff-ffff-ffffff000001',
+            'ffffffff-ffff-ffff-ffff-fffffffffff0'], '0')
+        self.assertEqual(
+            sorted(records.keys()),
+            ['ffffffff-ffff-ffff-ffff-ffffff000000',
+             'ffffffff-ffff-ffff-ffff-ffffff000001'])
+
+    def test_update_writes_through_cache(self):
+        self.device_subscription.read(
+            'ffffffff-ffff-ffff-ffff-ffffff000000', '0')
+        self.device_subscription.update(UNSUBSCRIBE_ACCEPTED)
+        cached = test_helper.convert(self.elasticache.hgetall(
+            subscription_cache_key('ffffffff-ffff-ffff-ffff-ffffff000000', '0')))
+        self.assertEqual(int(cached['status']), UNSUBSCRIBE_ACCEPTED)
+        self.assertEqual(cached['created_at'], '2017-06-01T00:00:00')
+
+    def test_insert_writes_through_cache(self):
+        self.device_subscription.insert(
+            'ffffffff-ffff-ffff-ffff-fffffffffff1', '0', SUBSCRIBE_ACCEPTED)
+        cached = test_helper.convert(self.elasticache.hgetall(
+            subscription_cache_key('ffffffff-ffff-ffff-ffff-fffffffffff1', '0')))
+        self.assertEqual(int(cached['status']), SUBSCRIBE_ACCEPTED)
+
+    def test_snapshot_is_read_once(self):
+        self.device_subscription.read_for_history_logs(
+            'ffffffff-ffff-ffff-ffff-ffffff000000', '0')
+        table = self.device_subscription.dynamodb.Table('device_subscriptions')
+        table.delete_item(
+            Key={'id': 'ffffffff-ffff-ffff-ffff-ffffff000000#0'})
+        # Served from the snapshot, the deleted item is not read again
+        self.assertTrue(self.device_subscription.has_oids_field())
+        self.assertEqual(
+            self.device_subscription.get_subscribed_oids()[0],
+            '1.3.6.1.2.1.1.6.0')
+        self.assertFalse(
+            self.device_subscription.refresh_snapshot().is_existing())
+
+    def test_snapshot_follows_writes(self):
+        self.device_subscription.read(
+            'ffffffff-ffff-ffff-ffff-ffffff000000', '0')
+        self.device_subscription.update(UNSUBSCRIBE_ACCEPTED)
+        snapshot = self.device_subscription.get_snapshot()
+        self.assertEqual(snapshot.get_status(), UNSUBSCRIBE_ACCEPTED)
+        self.assertEqual(snapshot.get_created_at(), '2017-06-01T00:00:00')
+
+    def test_get_snapshots(self):
+        snapshots = self.device_subscription.get_snapshots([
+            'ffffffff-ffff-ffff-ffff-ffffff000000',
+            'ffffffff-ffff-ffff-ffff-fffffffffff0'], '0')
+        self.assertEqual(
+            snapshots['ffffffff-ffff-ffff-ffff-ffffff000000'].get_status(),
+            SUBSCRIBED)
+        self.assertFalse(
+            snapshots['ffffffff-ffff-ffff-ffff-fffffffffff0'].is_existing())
@@ -0,0 +1,87 @@
+import unittest
+from datetime import datetime
+from functions.latest_cache import handler
+from models.device_log import DeviceLog
+from models.device_network_status import DeviceNetworkStatus
+from tests.functions import test_helper
+
+DEVICE_ID = 'ffffffff-ffff-ffff-ffff-ffffffff0001'
+OBJECT_ID = '1.3.6.1.2.1.2.2.1.6.1'
+LOG_KEY = f'device_log:{DEVICE_ID}#{OBJECT_ID}'
+STATUS_KEY = f'device_network_status:{DEVICE_ID}'
+
+
+class TestLatestCache(unittest.TestCase):
+    def setUp(self):
+        test_helper.set_env_var(self)
+        test_helper.seed_ddb_device_logs(self)
+        self.device_log = DeviceLog()
+        self.device_network_status = DeviceNetworkStatus()
+        self.elasticache = self.device_log.elasticache
+        self.elasticache.flushall()
+
+    def tearDown(self):
+        test_helper.clear_cache(self)
+        test_helper.clear_db(self)
+
+    def cached(self, key):
+        return self.device_log.convert(self.elasticache.hgetall(key))
+
+    def put_log(self, timestamp, value):
+        self.device_log.put_logs({'device_id': DEVICE_ID, 'notification': [
+            {'object_id': OBJECT_ID, 'value': value, 'timestamp': timestamp}]})
+
+    def test_put_logs_writes_through(self):
+        # 2017-07-04T08:35:35 and 2017-07-04T08:35:34
+        self.put_log(1499157335, 'new')
+        self.assertEqual(self.cached(LOG_KEY)['value'], 'new')
+        self.assertEqual(self.cached(LOG_KEY)['timestamp'], '2017-07-04T08:35:35')
+
+        # An older log arriving late does not move the cache backwards
+        self.put_log(1499157334, 'old')
+        self.assertEqual(self.cached(LOG_KEY)['value'], 'new')
+
+        self.put_log(1499157336, '')
+        self.assertEqual(self.cached(LOG_KEY)['value'], '')
+
+    def test_put_status_writes_through(self):
+        event_timestamp = datetime(2017, 7, 4, 8, 35, 40)
+        self.device_network_status.put_status([
+            {'device_id': DEVICE_ID, 'event': 'offline_hook', 'timestamp': '1499157335'},
+            {'device_id': DEVICE_ID, 'event': 'online_hook', 'timestamp': '1499157334'}
+        ], event_timestamp)
+        status = self.cached(STATUS_KEY)
+        self.assertEqual(status['status'], 'offline')
+        self.assertEqual(status['timestamp'], '2017-07-04T08:35:35')
+        self.assertEqual(status['event_timestamp'], '2017-07-04T08:35:40')
+
+    def test_reconcile_repairs_drift(self):
+        self.elasticache.hmset(LOG_KEY, {
+            'id': f'{DEVICE_ID}#{OBJECT_ID}',
+            'timestamp': '2017-01-12T12:23:03',
+            'value': 'stale'})
+        self.elasticache.hmset(f'device_log:{DEVICE_ID}#1.3.6.1.2.1.1.5.0', {
+            'id': f'{DEVICE_ID}#1.3.6.1.2.1.1.5.0',
+            'timestamp': '2017-01-12T12:23:03',
+            'value': 'not in device_logs'})
+        self.elasticache.hmset(STATUS_KEY, {
+            'id': DEVICE_ID,
+            'timestamp': '2017-01-12T12:45:06',
+            'status': 'online'})
+        self.elasticache.hmset('other', {'timestamp': 'ignored'})
+
+        res = handler.reconcile({}, None)
+        self.assertEqual(res, {'checked': 3, 'repaired': 2, 'cursor': None})
+        self.assertEqual(self.cached(LOG_KEY)['value'], '67055C7HGTF5')
+        self.assertEqual(self.cached(LOG_KEY)['timestamp'], '2017-01-12T12:23:07')
+        self.assertFalse(self.elasticache.exists(
+            f'device_log:{DEVICE_ID}#1.3.6.1.2.1.1.5.0'))
+        self.assertEqual(self.cached(STATUS_KEY)['status'], 'online')
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+import unittest
+from unittest.mock import patch
+from tests.functions.stub_notification_server import StubNotificationServer
+from functions.push_notifications import delivery
+from functions.push_notifications import retries
+from models import push_notification_retry
+from models.device_status import DeviceStatus
+from models.push_notification_retry import PushNotificationRetry
+from tests.functions import test_helper
+
+REPORTING_ID = 'eeeeeeee-eeee-eeee-eeee-eeeeeeee0001'
+OBJECT_ID = '1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.8.0'
+RETRY_ID = f'{REPORTING_ID}#{OBJECT_ID}'
+
+
+class TestPushNotificationRetry(unittest.TestCase):
+    def setUp(self):
+        test_helper.set_env_var(self)
+        test_helper.create_table(self)
+        delivery.reset()
+        self.retry = PushNotificationRetry()
+
+    def tearDown(self):
+        delivery.reset()
+        test_helper.clear_db(self)
+
+    def put(self, timestamp, value, notify_url='http://dummy.com'):
+        return self.retry.put(
+            REPORTING_ID, OBJECT_ID, timestamp,
+            [{'feature_name': 'TonerInk_LifeBlack', 'value': value}], notify_url)
+
+    def get(self):
+        return self.retry.table.get_item(Key={'id': RETRY_ID}).get('Item')
+
+    def test_put_merges_features(self):
+        self.assertTrue(self.put('2017-02-04T12:23:02', 'new'))
+        self.assertTrue(self.retry.put(
+            REPORTING_ID, OBJECT_ID, '2017-02-04T12:23:01',
+            [{'feature_name': 'TonerInk_LifeBlack', 'value': 'old'},
+             {'feature_name': 'TonerInk_LifeCyan', 'value': 'cyan'}],
+            'http://dummy.com'))
+        item = self.get()
+        # Every feature keeps its most recent value
+        self.assertEqual(item['timestamp'], '2017-02-04T12:23:02')
+        self.assertEqual(
+            [(f['feature_name'], f['value'], f['timestamp']) for f in item['data']],
+            [('TonerInk_LifeBlack', 'new', '2017-02-04T12:23:02'),
+             ('TonerInk_LifeCyan', 'cyan', '2017-02-04T12:23:01')])
+
+        # A newer notification keeps the backoff of the queued one
+        self.retry.reschedule(item)
+        self.assertTrue(self.put('2017-02-04T12:23:03', 'newer'))
+        item = self.get()
+        self.assertEqual(item['data'][0]['value'], 'newer')
+        self.assertEqual(item['data'][1]['value'], 'cyan')
+        self.assertEqual(item['attempts'], 2)
+
+    def test_delete_keeps_merged_notification(self):
+        self.put('2017-02-04T12:23:01', 'queued')
+        item = self.get()
+        self.put('2017-02-04T12:23:02', 'merged')
+        self.assertFalse(self.retry.delete(item))
+        self.assertTrue(self.retry.delete(self.get()))
+        self.assertIsNone(self.get())
+
+    def test_backoff(self):
+        self.assertEqual(push_notification_retry.backoff_seconds(1), 60)
+        self.assertEqual(push_notification_retry.backoff_seconds(2), 120)
+        self.assertEqual(push_notification_retry.backoff_seconds(5), 960)
+        self.assertEqual(push_notification_retry.backoff_seconds(10), 3600)
+
+    def test_reschedule_gives_up(self):
+        self.put('2017-02-04T12:23:01', 'value')
+        item = self.get()
+        item['attempts'] = push_notification_retry.MAX_ATTEMPTS
+        self.retry.reschedule(item)
+        self.assertIsNone(self.get())
+
+    @patch('models.push_notification_retry.RETRY_BASE_SECONDS', 0)
+    def test_get_due(self):
+        self.put('2017-02-04T12:23:01', 'due')
+        self.retry.put(
+            REPORTING_ID, '1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.10.0',
+            '2017-02-04T12:23:01', [], 'http://dummy.com')
+        self.retry.table.update_item(
+            Key={'id': f'{REPORTING_ID}#1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.10.0'},
+            UpdateExpression='SET next_attempt_at = :next',
+            ExpressionAttributeValues={':next': '9999-12-31T23:59:59'})
+        self.assertEqual(
+            [item['id'] for item in self.retry.get_due(100)], [RETRY_ID])
+
+    @patch('models.push_notification_retry.RETRY_BASE_SECONDS', 0)
+    def test_get_due_of_every_shard(self):
+        object_ids = [f'1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.{i}.0' for i in range(20)]
+        for object_id in object_ids:
+            self.retry.put(
+                REPORTING_ID, object_id, '2017-02-04T12:23:01', [],
+                'http://dummy.com')
+        shards = {
+            push_notification_retry.queue_shard(f'{REPORTING_ID}#{object_id}')
+            for object_id in object_ids}
+        self.assertGreater(len(shards), 1)
+        self.assertEqual(
+            sorted(item['object_id'] for item in self.retry.get_due(100)),
+            sorted(object_ids))
+
+    @patch('models.push_notification_retry.RETRY_BASE_SECONDS', 0)
+    def test_get_due_up_to_limit(self):
+        for i in range(5):
+            self.retry.put(
+                REPORTING_ID, f'1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.{i}.0',
+                '2017-02-04T12:23:01', [], 'http://dummy.com')
+        self.assertEqual(len(self.retry.get_due(3)), 3)
+        self.assertEqual(len(self.retry.get_due(10)), 5)
+
+    @patch('models.push_notification_retry.RETRY_BASE_SECONDS', 0)
+    def test_claim(self):
+        self.put('2017-02-04T12:23:01', 'value')
+        item, = self.retry.get_due(100)
+        # Only one of two overlapping drains claims the notification
+        self.assertTrue(self.retry.claim(item))
+        self.assertFalse(self.retry.claim(item))
+        self.assertEqual(self.retry.get_due(100), [])
+
+    @patch('models.push_notification_retry.RETRY_BASE_SECONDS', 0)
+    def test_drain(self):
+        with StubNotificationServer(status=500) as stub:
+            self.put('2017-02-04T12:23:01', 'old', stub.url)
+            self.put('2017-02-04T12:23:02', 'new', stub.url)
+            self.assertEqual(
+                retries.drain({}, None),
+                {'delivered': 0, 'rescheduled': 1, 'dropped': 0, 'superseded': 0})
+            self.assertEqual(self.get()['attempts'], 2)
+
+            stub.status = 200
+            self.assertEqual(
+                retries.drain({}, None),
+                {'delivered': 1, 'rescheduled': 0, 'dropped': 0, 'superseded': 0})
+            self.assertIsNone(self.get())
+        # Only the latest notification has been sent
+        self.assertEqual(len(stub.requests), 2)
+        self.assertEqual(stub.requests[1]['timestamp'], ['2017-02-04T12:23:02'])
+
+    @patch('models.push_notification_retry.RETRY_BASE_SECONDS', 0)
+    def test_drain_skips_superseded_features(self):
+        with StubNotificationServer() as stub:
+            self.retry.put(
+                REPORTING_ID, OBJECT_ID, '2017-02-04T12:23:01',
+                [{'feature_name': 'TonerInk_LifeBlack', 'value': 'old'},
+                 {'feature_name': 'TonerInk_LifeCyan', 'value': 'cyan'}],
+                stub.url)
+            # A newer value of TonerInk_LifeBlack has been notified since
+            DeviceStatus().insert(REPORTING_ID, OBJECT_ID, '2017-02-04T12:23:02', {
+                'TonerInk_LifeBlack': {'value': 'new', 'timestamp': '2017-02-04T12:23:02'},
+                'TonerInk_LifeCyan': {'value': 'cyan', 'timestamp': '2017-02-04T12:23:01'}})
+            self.assertEqual(
+                retries.drain({}, None),
+                {'delivered': 1, 'rescheduled': 0, 'dropped': 0, 'superseded': 0})
+        self.assertEqual(len(stub.requests), 1)
+        self.assertNotIn('old', str(stub.requests[0]))
+        self.assertIn('cyan', str(stub.requests[0]))
+
+        self.put('2017-02-04T12:23:01', 'old')
+        self.assertEqual(
+            retries.drain({}, None),
+            {'delivered': 0, 'rescheduled': 0, 'dropped': 0, 'superseded': 1})
+        self.assertIsNone(self.get())
+
+    @patch('models.push_notification_retry.RETRY_BASE_SECONDS', 0)
+    @patch.dict('os.environ', {'PUSH_NOTIFICATION_RETRIES_PER_RUN': '1'})
+    def test_drain_up_to_retries_per_run(self):
+        with StubNotificationServer() as stub:
+            for i in range(2):
+                self.retry.put(
+                    REPORTING_ID, f'1.3.6.1.4.1.2435.2.3.9.4.2.1.5.5.{i}.0',
+                    '2017-02-04T12:23:01',
+                    [{'feature_name': 'TonerInk_LifeBlack', 'value': 'value'}],
+                    stub.url)
+            for _ in range(2):
+                self.assertEqual(
+                    retries.drain({}, None),
+                    {'delivered': 1, 'rescheduled': 0, 'dropped': 0, 'superseded': 0})
+        self.assertEqual(len(stub.requests), 2)
+
+    def test_drain_skips_pending_notifications(self):
+        self.put('2017-02-04T12:23:01', 'value')
+        self.assertEqual(
+            retries.drain({}, None),
+            {'delivered': 0, 'rescheduled': 0, 'dropped': 0, 'superseded': 0})
+        self.assertTrue(self.get())
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
 import unittest
+from unittest.mock import patch
+from models import service_oid
 from models.service_oid import ServiceOid
 from tests.functions import test_helper
 
@@ -13,3 +15,39 @@ class TestServiceOid(unittest.TestCase):
 
     def test_ids(self):
         self.assertEqual(ServiceOid.ids(), ['0'])
+
+    def test_read_from_catalog(self):
+        item = ServiceOid().read('0')
+        self.dynamodb.Table('service_oids').delete_item(Key={'id': '0'})
+
+        self.assertEqual(ServiceOid().read('0'), item)
+        item['oids'] = []
+        self.assertNotEqual(ServiceOid().read('0')['oids'], [])
+
+    def test_read_missing_service(self):
+        self.assertEqual(ServiceOid.ids(), ['0'])
+        self.dynamodb.Table('service_oids').put_item(
+            Item={'id': '1', 'oids': ['1.3.6.1.2.1.1.1']})
+
+        self.assertEqual(
+            ServiceOid().read('1')['oids'], ['1.3.6.1.2.1.1.1'])
+        self.assertEqual(sorted(ServiceOid.ids()), ['0', '1'])
+        self.assertFalse(ServiceOid().read('2'))
+
+    def test_catalog_reloaded_after_ttl(self):
+        self.assertEqual(ServiceOid.ids(), ['0'])
+        self.dynamodb.Table('service_oids').delete_item(Key={'id': '0'})
+        self.assertEqual(ServiceOid.ids(), ['0'])
+
+        with patch.dict('os.environ', {'SERVICE_OID_CATALOG_TTL': '0'}):
+            self.assertEqual(ServiceOid.ids(), [])
+        service_oid.reset()
+        self.assertEqual(ServiceOid.ids(), [])
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()